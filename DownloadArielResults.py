@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+'''
+Description:
+    Downloads the results of an Ariel search to a CSV or JSONL file, e.g. a
+    sample of the events of a log source type to build a mapping CSV.
+
+    The results are requested in chunks (Range header) by several workers at
+    the same time and written to the file in order as they arrive, so large
+    result sets are neither held in memory nor read as one slow response. A
+    chunk that fails is retried on its own.
+
+    Either run an AQL query (-q), or download the results of a search that
+    already exists (-s), e.g. one started from the console.
+
+Usage:
+    Usage: DownloadArielResults.py [options]
+
+    Options:
+      -h, --help            show this help message and exit
+      -q QUERY, --query=QUERY
+                            AQL query to run.
+      -s SEARCH_ID, --search_id=SEARCH_ID
+                            Id of an existing search to download.
+      -o FILE, --output_file=FILE
+                            Output file name.
+      -f FORMAT, --format=FORMAT
+                            Output format, csv or jsonl (default csv)
+      -w WORKERS, --workers=WORKERS
+                            Number of chunks downloaded at the same time
+                            (default 4)
+      --chunk_size=ROWS     Number of rows per request (default 10000)
+      --max_attempts=ATTEMPTS
+                            Number of attempts to download a chunk (default 3)
+      --timeout=SECONDS     Time to wait for the search to complete (default
+                            900)
+      --config_section=SECTION
+                            Section of config.ini with the console to query
+                            (default DEFAULT)
+'''
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             'modules'))
+import arielapiclient
+import ArielResultDownloader
+import ArielSearchRunner
+
+
+def parse_arguments(arguments):
+
+    parser = optparse.OptionParser()
+    parser.add_option('-q', '--query', dest='query', action='store',
+                      metavar='QUERY', help='AQL query to run.')
+    parser.add_option('-s', '--search_id', dest='search_id', action='store',
+                      metavar='SEARCH_ID',
+                      help='Id of an existing search to download.')
+    parser.add_option('-o', '--output_file', dest='output_file',
+                      action='store', metavar='FILE',
+                      help='Output file name.')
+    parser.add_option('-f', '--format', dest='output_format',
+                      action='store', type='choice',
+                      choices=list(ArielResultDownloader.ArielResultDownloader
+                                   .OUTPUT_FORMATS),
+                      default='csv', metavar='FORMAT',
+                      help='Output format, csv or jsonl (default csv)')
+    parser.add_option('-w', '--workers', dest='workers', action='store',
+                      type='int', default=4, metavar='WORKERS',
+                      help='Number of chunks downloaded at the same time '
+                           '(default 4)')
+    parser.add_option('--chunk_size', dest='chunk_size', action='store',
+                      type='int', default=10000, metavar='ROWS',
+                      help='Number of rows per request (default 10000)')
+    parser.add_option('--max_attempts', dest='max_attempts', action='store',
+                      type='int', default=3, metavar='ATTEMPTS',
+                      help='Number of attempts to download a chunk '
+                           '(default 3)')
+    parser.add_option('--timeout', dest='timeout', action='store',
+                      type='float', default=900.0, metavar='SECONDS',
+                      help='Time to wait for the search to complete '
+                           '(default 900)')
+    parser.add_option('--config_section', dest='config_section',
+                      action='store', default='DEFAULT', metavar='SECTION',
+                      help='Section of config.ini with the console to query '
+                           '(default DEFAULT)')
+
+    (options, args) = parser.parse_args(arguments)
+    if bool(options.query) == bool(options.search_id):
+        parser.error('Specify either a query or a search id.')
+    if not options.output_file:
+        parser.error('No output file specified.')
+    if options.workers < 1 or options.chunk_size < 1 or \
+            options.max_attempts < 1 or options.timeout <= 0:
+        parser.error('The workers, chunk size, attempts and timeout must be '
+                     'positive.')
+    return options
+
+
+if __name__ == '__main__':
+    options = parse_arguments(sys.argv[1:])
+
+    ariel_client = arielapiclient.APIClient(
+        config_section=options.config_section,
+        max_connections=options.workers)
+    # creates the search and waits for its completion
+    search_runner = ArielSearchRunner.ArielSearchRunner(
+        ariel_client, timeout=options.timeout)
+    downloader = ArielResultDownloader.ArielResultDownloader(
+        ariel_client, chunk_size=options.chunk_size, workers=options.workers,
+        max_attempts=options.max_attempts)
+
+    start = time.monotonic()
+    search_id = options.search_id
+    try:
+        if options.query:
+            search_id = search_runner.create_search(options.query)
+        record_count = search_runner.wait_for_search(search_id)
+        rows = downloader.download(search_id, record_count,
+                                   options.output_file, options.output_format)
+    except LookupError as error:
+        print(str(error))
+        sys.exit(1)
+    finally:
+        # only the search created here is deleted
+        if options.query and search_id:
+            ariel_client.delete_search(search_id)
+        ariel_client.close()
+
+    seconds = time.monotonic() - start
+    print(str(rows) + ' rows written to ' + options.output_file + ' in ' +
+          '{0:.1f}'.format(seconds) + 's (' +
+          '{0:.0f}'.format(rows / seconds if seconds else 0) + ' rows/s, ' +
+          str(ariel_client.metrics.get_api_calls()) + ' REST API calls)')
@@ -32,6 +32,77 @@ Usage:
       -l FILE, --log_file=FILE
                             log file name.
       -v, --verbose         Enable verbose messages
+      -c, --preload_catalog
+                            Load log source types and categories once at
+                            startup instead of looking them up for each line
+      -f FILE, --categories_file=FILE
+                            Resolve Low Level Category IDs offline from this
+                            file (qidmap_cli.sh -l output, e.g. categories.txt)
+      -p, --prefetch_mappings
+                            Read all the existing mappings of the log source
+                            types in the input file at once instead of looking
+                            them up for each line
+      -w N, --workers=N     Number of lines processed at the same time (default 1)
+      -a, --async           Process the lines with the asyncio engine, --workers
+                            sets the number of lines in flight
+      --pipeline=WORKERS    Process the lines in stages connected by bounded
+                            queues (resolve, QID record write, mapping write)
+                            with WORKERS threads each: one number for all the
+                            stages or three separated by commas, e.g. 4,8,8
+      -j FILE, --journal=FILE
+                            Record each processed line in this journal file
+                            (default with --resume: OUTPUT_FILE.journal)
+      -r, --resume          Skip the lines already completed with identical
+                            content according to the journal (not with
+                            --coalesce, --plan or --apply)
+      --coalesce            Read the whole file first, process repeated events
+                            once and create or update each QID record once
+      --prevalidate         Check every line of the file before any request and
+                            stop if a line has an error, the errors are written
+                            to OUTPUT_FILE.errors.csv
+      --plan=FILE           Do not change anything, write the actions needed for
+                            each line to this plan file
+      --apply=FILE          Execute the actions of this plan file (instead of
+                            reading an input file)
+      --read_rate=N         Maximum number of read requests per second (default
+                            no limit)
+      --write_rate=N        Maximum number of write requests per second (default
+                            no limit)
+      --max_retries=N       Number of times a request throttled by the console
+                            (429 or 503) is sent again (default 5)
+      --config_file=FILE    Read the console settings from this file instead of
+                            config.ini
+      --config_section=SECTION
+                            Use the console settings of this section of the
+                            configuration file (default DEFAULT)
+      --targets=SECTIONS    Comma separated configuration sections: check the
+                            file once, then import it into all these consoles
+                            at the same time (one output file per console, and
+                            a combined summary in OUTPUT_FILE)
+      --baseline=FILE       Take the existing custom mappings and their QID
+                            records from this export (customizations.howto)
+                            instead of reading them from the console, only
+                            the events missing from it are read in batches
+                            (with --targets: FILE.SECTION.csv for each
+                            console)
+      --verify_with_ariel=HOURS
+                            After the import, count the events of the created
+                            or remapped QIDs over the last HOURS hours with
+                            one Ariel search, and add the counts to the output
+                            file
+      --prometheus_file=FILE
+                            Also write the request metrics of the run to this
+                            Prometheus textfile
+      --profile=FILE        Profile the run (cProfile, tracemalloc and time per
+                            phase), write the pstats to this file and print a
+                            summary
+      --cache_file=FILE     Keep the results of the log source type, category,
+                            severity and QID lookups in this SQLite file for
+                            the next runs against the same console
+      --refresh_cache       Ignore the cached lookup results and replace them
+      --serve=SOCKET        Run as a service on this UNIX socket, keeping the
+                            connections, catalog and caches warm between the
+                            jobs submitted with SubmitJob.py
       -d DEBUG, --debug=DEBUG
                             Define logging level.
                             [DEBUG|INFO|WARNING|ERROR*|CRITICAL]
@@ -39,9 +110,32 @@ Usage:
 
 Changelog:
     v1.0 - 2019-06-05 + Initial script
+    v1.1 - 2026-10-17 + Reuse a single REST API client with persistent HTTPS connections
+                      + Preloaded catalog of log source types and categories (-c)
+                      + Offline Low Level Category resolution from categories.txt (-f)
+                      + Prefetch of the existing mappings per log source type (-p)
+                      + Concurrent processing of lines with a pool of workers (-w)
+                      + asyncio engine (-a)
+                      + Results are written to the output file as each line is processed
+                      + Checkpoint journal and resume of interrupted imports (-j, -r)
+                      + Plan mode and apply of a reviewed plan (--plan, --apply)
+                      + Deduplication of repeated events and coalesced QID writes (--coalesce)
+                      + Rate limits, adaptive concurrency and retry of throttled requests (--read_rate, --write_rate, --max_retries)
+                      + Alternative configuration file (--config_file) and benchmark suite (benchmark/)
+                      + Per endpoint request metrics report, OUTPUT_FILE.metrics.json (--prometheus_file)
+                      + CPU and memory profiling with time per phase (--profile)
+                      + Persistent lookup cache across runs (--cache_file, --refresh_cache)
+                      + Batched lookup of the QID records of the lines using an existing QID
+                      + Service mode for repeated imports (--serve) and its client SubmitJob.py
+                      + Console settings of any configuration section, import into several consoles at once (--config_section, --targets)
+                      + Snapshot of the existing custom mappings from the customizations export, checked against the console (--baseline)
+                      + Event counts of the created or remapped QIDs from one Ariel search (--verify_with_ariel)
+                      + Compact rows and results for the modes that keep the whole file in memory (--coalesce, --targets)
+                      + Staged pipeline with bounded queues, workers per stage and queue depth report (--pipeline)
+                      + Offline check of the whole file before any request (--prevalidate)
 
 To Do:
-    + find the unique value based on the HLC
+    + find the unique value based on the HLC (without the preloaded catalog)
     + extract categories
 '''
 
@@ -53,63 +147,389 @@ import optparse
 import csv
 import xml
 import logging
+import functools
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import threading
+import signal
+import subprocess
+import tempfile
+import configparser
 
 sys.path.append(os.path.realpath('modules'))
 client_module = importlib.import_module('RestApiClient')
+catalog_module = importlib.import_module('ReferenceCatalog')
+category_resolver_module = importlib.import_module('CategoryResolver')
+mapping_index_module = importlib.import_module('EventMappingIndex')
+async_client_module = importlib.import_module('AsyncRestApiClient')
+journal_module = importlib.import_module('CheckpointJournal')
+qid_record_index_module = importlib.import_module('QidRecordIndex')
+throttle_module = importlib.import_module('RequestThrottle')
+config_module = importlib.import_module('config')
+metrics_module = importlib.import_module('RequestMetrics')
+profiler_module = importlib.import_module('RunProfiler')
+lookup_cache_module = importlib.import_module('LookupCache')
+job_service_module = importlib.import_module('JobService')
+baseline_module = importlib.import_module('BaselineSnapshot')
+ariel_client_module = importlib.import_module('arielapiclient')
+event_counter_module = importlib.import_module('QidEventCounter')
+compact_records_module = importlib.import_module('CompactRecords')
+staged_pipeline_module = importlib.import_module('StagedPipeline')
+
+# one lock (and the number of lines using it) per (Log Source Type ID, Event ID, Event Category)
+mapping_key_locks = {}
+mapping_key_locks_guard = threading.Lock()
+async_mapping_key_locks = {}
+# last line of each event in the pipeline (--pipeline)
+pipeline_previous_lines = {}
+pipeline_previous_lines_guard = threading.Lock()
+async_default_severities = {}
+# set with --profile
+profiler = None
+
+def timed_phase(phase):
+    # adds the time of each call of the decorated function to a phase of the profile (--profile)
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if profiler is None:
+                    return await function(*args, **kwargs)
+                with profiler.phase_timers.phase(phase):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if profiler is None:
+                return function(*args, **kwargs)
+            with profiler.phase_timers.phase(phase):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timed_csv_lines(csv_reader):
+    # the time taken to read and parse the input file is a phase of the profile (--profile)
+    if profiler is None:
+        return csv_reader
+    return profiler.phase_timers.timed_iter('read CSV', csv_reader)
 
 def main(input_file):
 
+    if mapping_index is not None:
+        prefetch_dsm_event_mappings(input_file)
+    prefetch_qid_records(input_file)
+
     with open(input_file, mode='r') as input_file_handler: # open file
-        csv_reader = csv.DictReader(input_file_handler)
-        for csv_line in csv_reader: # for each line
-                logging.info(csv_line)
-                try:
-                    valid_csv_line = validate_csv_line(csv_line) # validate content
-                except ValueError as error: # if controlled validation error (log to console and skip this line)
-                     logging.error(error)
-                     logging.error("Line: " + str(csv_line))
-                     print(str(error) + "\nLine:\n" + str(csv_line))
-                     result=dict()
-                     result.update(csv_line)
-                     result.update({"mapping_result": "ERROR", "mapping_result_msg": error})
-                     results.append(result)
-                except LookupError as error: # if controlled lookup error (log to console and skip this line)
-                     logging.error(error)
-                     logging.error("Line: " + str(csv_line))
-                     print(str(error) + "\nLine:\n" + str(csv_line))
-                     result=dict()
-                     result.update(csv_line)
-                     result.update({"mapping_result": "ERROR", "mapping_result_msg": error})
-                     results.append(result)
-                else: # process line
-                    process_csv_line(valid_csv_line)
+        csv_reader = timed_csv_lines(csv.DictReader(input_file_handler))
+        if async_client is not None: # process the lines with the asyncio engine
+            asyncio.run(async_handle_csv_lines(csv_reader, options.workers, result_writer.write))
+        elif options.pipeline_workers: # process the lines in stages, results are kept in input order
+            handle_csv_lines_in_pipeline(csv_reader, options.pipeline_workers, result_writer.write)
+        elif options.workers > 1: # process several lines at a time, results are kept in input order
+            for result in handle_csv_lines_concurrently(csv_reader, options.workers):
+                result_writer.write(result)
+        else:
+            for csv_line in csv_reader: # for each line
+                result_writer.write(handle_csv_line(csv_line))
+
+
+def handle_csv_line(csv_line):
+    line_hash, completed_row = journal_lookup(csv_line)
+    if completed_row is not None: # already completed by a previous run
+        return completed_row
+
+    logging.info(csv_line)
+    try:
+        valid_csv_line = validate_csv_line(csv_line) # validate content
+    except (ValueError, LookupError) as error: # if controlled validation or lookup error (log to console and skip this line)
+        result = error_result(csv_line, error)
+    else: # process line
+        with mapping_key_lock(valid_csv_line): # lines for the same event are never processed at the same time
+            result = process_csv_line(valid_csv_line)
+
+    journal_record(line_hash, result)
+    return result
+
+def journal_lookup(csv_line):
+    # returns the hash of the line content and, when resuming, the output row of the same line if it was completed before
+    if journal is None:
+        return None, None
+    line_hash = journal.line_hash(csv_line)
+    entry = journal.take_completed(line_hash)
+    if entry is not None:
+        logging.info('Already completed in a previous run: ' + str(csv_line))
+        return line_hash, entry['row']
+    return line_hash, None
+
+def journal_record(line_hash, result):
+    if journal is not None:
+        journal.record(line_hash, result, result_writer.row(result))
+
+def error_result(csv_line, error):
+    logging.error(error)
+    logging.error("Line: " + str(csv_line))
+    print(str(error) + "\nLine:\n" + str(csv_line))
+    result=dict()
+    result.update(csv_line)
+    result.update({"mapping_result": "ERROR", "mapping_result_msg": error})
+    return result
+
+def handle_csv_lines_concurrently(csv_reader, workers):
+    # at most "workers" lines are processed at the same time (one request in flight each),
+    # and no more than a few lines per worker are read ahead of the oldest unfinished line
+    pending_lines = collections.deque()
+    previous_lines = {} # last pending line of each event, so lines of the same event run in input order
+    initializer = profiler.start_thread if profiler is not None else None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+        for csv_line in csv_reader:
+            key = input_mapping_key(csv_line)
+            future = executor.submit(handle_csv_line_after, csv_line, previous_lines.get(key))
+            previous_lines[key] = future
+            pending_lines.append((key, future))
+            if len(pending_lines) >= workers * 4:
+                yield pending_line_result(pending_lines, previous_lines)
+        while pending_lines:
+            yield pending_line_result(pending_lines, previous_lines)
+
+def handle_csv_line_after(csv_line, previous_line):
+    if previous_line is not None:
+        concurrent.futures.wait([previous_line])
+    return handle_csv_line(csv_line)
+
+def pending_line_result(pending_lines, previous_lines):
+    key, future = pending_lines.popleft()
+    result = future.result()
+    if previous_lines.get(key) is future:
+        del previous_lines[key]
+    return result
+
+class PipelineLine:
+    """
+    A line of the input file going through the stages of the pipeline (--pipeline), with what each
+    stage found for the next one. done is set once the line has been processed, the next line of the
+    same event waits for it.
+    """
 
+    __slots__ = ('csv_line', 'key', 'previous', 'done', 'line_hash', 'key_lock', 'new_qid_record', 'dsm_event_mapping', 'qid_record')
+
+    def __init__(self, csv_line, key, previous):
+        self.csv_line = csv_line
+        self.key = key
+        self.previous = previous
+        self.done = threading.Event()
+        self.line_hash = None
+        self.key_lock = None
+        self.new_qid_record = None
+        self.dsm_event_mapping = None
+        self.qid_record = None
+
+def handle_csv_lines_in_pipeline(csv_reader, stage_workers, handle_result):
+    # the lines are read by a feeder thread, go through a stage per kind of work, each with its own workers
+    # and a bounded input queue, and their results are written in input order by this thread
+    resolve_workers, qid_record_workers, mapping_workers = stage_workers
+    pipeline = staged_pipeline_module.StagedPipeline([
+        staged_pipeline_module.Stage('resolve', pipeline_stage(pipeline_resolve), resolve_workers),
+        staged_pipeline_module.Stage('write QID record', pipeline_stage(pipeline_write_qid_record), qid_record_workers),
+        staged_pipeline_module.Stage('write mapping', pipeline_stage(pipeline_write_dsm_event_mapping), mapping_workers)],
+        initializer=profiler.start_thread if profiler is not None else None)
+    pipeline.run(pipeline_lines(csv_reader), handle_result)
+    report = pipeline.get_report()
+    logging.info('Pipeline stages:\n' + report)
+    print(report)
+
+def pipeline_lines(csv_reader):
+    # lines of the same event are processed one after the other, in input order
+    for csv_line in csv_reader:
+        key = input_mapping_key(csv_line)
+        with pipeline_previous_lines_guard:
+            line = PipelineLine(csv_line, key, pipeline_previous_lines.get(key))
+            pipeline_previous_lines[key] = line
+        yield line
+
+def pipeline_stage(function):
+    # a line failing in a stage still lets the next line of the same event go
+    @functools.wraps(function)
+    def wrapper(line):
+        try:
+            return function(line)
+        except BaseException:
+            release_pipeline_line(line)
+            raise
+    return wrapper
+
+def pipeline_resolve(line):
+    if line.previous is not None:
+        line.previous.done.wait()
+        line.previous = None
+    line.line_hash, completed_row = journal_lookup(line.csv_line)
+    if completed_row is not None: # already completed by a previous run
+        release_pipeline_line(line)
+        return staged_pipeline_module.Done(completed_row)
+
+    logging.info(line.csv_line)
+    try:
+        validate_csv_line(line.csv_line) # validate content
+    except (ValueError, LookupError) as error: # if controlled validation or lookup error (log to console and skip this line)
+        return pipeline_line_result(line, error_result(line.csv_line, error))
+    line.key_lock = acquire_mapping_key_lock(line.csv_line) # held until the mapping is written
+    line.new_qid_record, line.dsm_event_mapping = resolve_csv_line(line.csv_line)
+    return line
+
+def pipeline_write_qid_record(line):
+    line.qid_record = write_csv_line_qid_record(line.csv_line, line.new_qid_record, line.dsm_event_mapping)
+    return line
+
+def pipeline_write_dsm_event_mapping(line):
+    return pipeline_line_result(line, write_csv_line_dsm_event_mapping(line.csv_line, line.qid_record, line.dsm_event_mapping))
+
+def pipeline_line_result(line, result):
+    journal_record(line.line_hash, result)
+    release_pipeline_line(line)
+    return staged_pipeline_module.Done(result)
+
+def release_pipeline_line(line):
+    if line.key_lock is not None:
+        release_mapping_key_lock(*line.key_lock)
+        line.key_lock = None
+    line.done.set()
+    with pipeline_previous_lines_guard:
+        if pipeline_previous_lines.get(line.key) is line:
+            del pipeline_previous_lines[line.key]
+
+def input_mapping_key(csv_line):
+    # the event of the line as written in the input file (before the Log Source Type is resolved)
+    if csv_line_contains_value_for(csv_line,"Log Source Type ID"):
+        log_source_type = str(csv_line["Log Source Type ID"]).strip()
+    else:
+        log_source_type = str(csv_line.get("Log Source Type") or "").strip().lower()
+    return (log_source_type, csv_line.get("Event ID"), csv_line.get("Event Category"))
+
+@contextlib.contextmanager
+def mapping_key_lock(csv_line):
+    key, key_lock = acquire_mapping_key_lock(csv_line)
+    try:
+        yield
+    finally:
+        release_mapping_key_lock(key, key_lock)
+
+def acquire_mapping_key_lock(csv_line):
+    # the lock may be released by another thread (pipeline stages)
+    key = (str(csv_line["Log Source Type ID"]), csv_line["Event ID"], csv_line["Event Category"])
+    with mapping_key_locks_guard:
+        key_lock = mapping_key_locks.setdefault(key, [threading.Lock(), 0])
+        key_lock[1] += 1
+    key_lock[0].acquire()
+    return key, key_lock
+
+def release_mapping_key_lock(key, key_lock):
+    key_lock[0].release()
+    with mapping_key_locks_guard:
+        key_lock[1] -= 1
+        if key_lock[1] == 0:
+            del mapping_key_locks[key]
+
+@timed_phase('prefetch mappings')
+def prefetch_dsm_event_mappings(input_file):
+    if baseline is not None:
+        # the snapshot only holds the custom mappings, read the mappings of the other events of the file in batches
+        events = input_events(input_file)
+        loaded_events = mapping_index.load_events(client, events, print_request=options.verbose)
+        logging.info('Read the dsm event mappings of ' + str(loaded_events) + ' events missing from the baseline, out of ' + str(len(events)) + ' events')
+        return
+    # read all the mappings of the log source types of the file at once
+    log_source_type_ids = input_log_source_type_ids(input_file)
+    mapping_index.load(client, log_source_type_ids, print_request=options.verbose)
+    logging.info('Prefetched ' + str(len(mapping_index)) + ' dsm event mappings for ' + str(len(log_source_type_ids)) + ' log source types')
+
+@timed_phase('prefetch qid records')
+def prefetch_qid_records(input_file):
+    # read the QID records of the QIDs used by the lines of the file in batches, instead of one request per line
+    qids = input_qids(input_file)
+    uncached_qids = []
+    for qid in sorted(qids):
+        cached_records = cached_lookup('qid_records', 'qid = ' + str(qid))
+        if cached_records is None:
+            uncached_qids.append(qid)
+        else:
+            qid_record_index.add_qid_records(qid, cached_records)
+    if uncached_qids:
+        for qid, qid_records in qid_record_index.load_qids(client, uncached_qids, print_request=options.verbose).items():
+            cache_lookup('qid_records', 'qid = ' + str(qid), qid_records)
+    logging.info('Prefetched the qid records of ' + str(len(qids)) + ' QIDs, ' + str(len(uncached_qids)) + ' not cached')
+
+def input_qids(input_file):
+    # collect the distinct QIDs of the lines using an existing QID
+    qids = set()
+    with open(input_file, mode='r') as input_file_handler:
+        for csv_line in csv.DictReader(input_file_handler):
+            try:
+                if uses_existing_qid(csv_line):
+                    qids.add(int(csv_line["QID"]))
+            except ValueError as error: # reported again when the line is processed
+                logging.debug(error)
+    return qids
+
+def input_events(input_file):
+    # collect the distinct (log source type id, event id, event category) of the file, the log source type names are resolved once each
+    events = set()
+    named_events = set()
+    with open(input_file, mode='r') as input_file_handler:
+        for csv_line in csv.DictReader(input_file_handler):
+            try:
+                if csv_line_contains_value_for(csv_line,"Log Source Type ID"):
+                    events.add((int(csv_line["Log Source Type ID"]), csv_line["Event ID"], csv_line["Event Category"]))
+                elif csv_line_contains_value_for(csv_line,"Log Source Type"):
+                    named_events.add((csv_line["Log Source Type"], csv_line["Event ID"], csv_line["Event Category"]))
+            except (ValueError, KeyError) as error: # reported again when the line is validated
+                logging.debug(error)
+    log_source_type_ids = log_source_type_ids_by_name(set(event[0] for event in named_events))
+    events.update((log_source_type_ids[event[0]], event[1], event[2]) for event in named_events if event[0] in log_source_type_ids)
+    return events
+
+def input_log_source_type_ids(input_file):
+    # collect the distinct log source types of the file, the names are resolved once each
+    log_source_type_ids = set()
+    log_source_type_names = set()
+    with open(input_file, mode='r') as input_file_handler:
+        for csv_line in csv.DictReader(input_file_handler):
+            try:
+                if csv_line_contains_value_for(csv_line,"Log Source Type ID"):
+                    log_source_type_ids.add(int(csv_line["Log Source Type ID"]))
+                elif csv_line_contains_value_for(csv_line,"Log Source Type"):
+                    log_source_type_names.add(csv_line["Log Source Type"])
+            except ValueError as error: # reported again when the line is validated
+                logging.debug(error)
+    log_source_type_ids.update(log_source_type_ids_by_name(log_source_type_names).values())
+    return log_source_type_ids
+
+def log_source_type_ids_by_name(log_source_type_names):
+    # one lookup per distinct name, the names that can't be resolved are reported again when their lines are validated
+    log_source_type_ids = {}
+    for log_source_type_name in sorted(log_source_type_names):
+        try:
+            log_source_type_ids[log_source_type_name] = int(get_log_source_type_id(log_source_type_name))
+        except (ValueError, LookupError) as error:
+            logging.debug(error)
+    return log_source_type_ids
 
 def csv_line_contains_value_for(csv_line, field):
     return field in csv_line and csv_line[field] != "" and csv_line[field] != None
 
+@timed_phase('validate')
 def validate_csv_line(csv_line):
 
+    check_csv_line(csv_line)
+
     # Get Log Source Type ID
     if not csv_line_contains_value_for(csv_line,"Log Source Type ID"):
-        if csv_line_contains_value_for(csv_line,"Log Source Type"):
-            csv_line["Log Source Type ID"] = get_log_source_type_id(csv_line["Log Source Type"])
-        else:
-            raise ValueError('Log Source Type or Log Source Type ID must be provided')
-
-    if csv_line_contains_value_for(csv_line,"QID") and (csv_line_contains_value_for(csv_line,"QID Name") or
-        csv_line_contains_value_for(csv_line,"QID Description") or
-        csv_line_contains_value_for(csv_line,"Severity") or
-        csv_line_contains_value_for(csv_line,"Low Level Category ID")):
-        raise ValueError('Provide either existing QID or New QID Values but not both')
-
+        csv_line["Log Source Type ID"] = get_log_source_type_id(csv_line["Log Source Type"])
 
     # Get Low Level Category ID
     if not csv_line_contains_value_for(csv_line,"Low Level Category ID"):
-        if csv_line_contains_value_for(csv_line,"Low Level Category"):
-            csv_line["Low Level Category ID"] = get_low_level_category_id(csv_line["Low Level Category"], csv_line["High Level Category"])
-        else:
-            raise ValueError('Low Level Category or Low Level Category ID must be provided')
+        csv_line["Low Level Category ID"] = get_low_level_category_id(csv_line["Low Level Category"], csv_line["High Level Category"])
 
     # get severity
     if not csv_line_contains_value_for(csv_line,"Severity"):
@@ -121,147 +541,342 @@ def validate_csv_line(csv_line):
 
     return csv_line
 
+def check_csv_line(csv_line):
+    # the rules of validate_csv_line that need no lookup, so a line can be checked before any request
+    if not csv_line_contains_value_for(csv_line,"Log Source Type ID") and not csv_line_contains_value_for(csv_line,"Log Source Type"):
+        raise ValueError('Log Source Type or Log Source Type ID must be provided')
+
+    if csv_line_contains_value_for(csv_line,"QID") and (csv_line_contains_value_for(csv_line,"QID Name") or
+        csv_line_contains_value_for(csv_line,"QID Description") or
+        csv_line_contains_value_for(csv_line,"Severity") or
+        csv_line_contains_value_for(csv_line,"Low Level Category ID")):
+        raise ValueError('Provide either existing QID or New QID Values but not both')
+
+    if not csv_line_contains_value_for(csv_line,"Low Level Category ID") and not csv_line_contains_value_for(csv_line,"Low Level Category"):
+        raise ValueError('Low Level Category or Low Level Category ID must be provided')
+
+    for column in integer_columns:
+        if csv_line_contains_value_for(csv_line,column) and not is_integer(csv_line[column]):
+            raise ValueError(column + ' must be an integer: ' + str(csv_line[column]))
+
+def is_integer(value):
+    try:
+        int(value)
+    except ValueError:
+        return False
+    return True
+
+# input columns holding an integer when they have a value
+integer_columns = ['Log Source Type ID', 'QID', 'Severity', 'Low Level Category ID']
+
+@timed_phase('prevalidate')
+def prevalidate(input_file, error_file):
+    # offline check of the whole file before any request (--prevalidate): every line is checked with check_csv_line
+    # and the lines of the same event must have the same values. The lines with an error are written to error_file
+    # with their error, returns their number.
+    errors = {} # line number -> error
+    events = {} # event -> (values of its first line, line numbers of its lines)
+    conflicting_events = []
+    lines = 0
+    with open(input_file, mode='r') as input_file_handler:
+        csv_reader = csv.DictReader(input_file_handler)
+        fieldnames = csv_reader.fieldnames or []
+        for line_number, csv_line in enumerate(csv_reader, start=2):
+            lines += 1
+            try:
+                check_csv_line(csv_line)
+            except ValueError as error:
+                errors[line_number] = str(error)
+                continue
+            key = input_mapping_key(csv_line)
+            values = tuple(csv_line.get(field) for field in fieldnames)
+            if key not in events:
+                events[key] = (values, [line_number])
+                continue
+            first_values, line_numbers = events[key]
+            if values != first_values and first_values is not None:
+                conflicting_events.append(key)
+                events[key] = (None, line_numbers) # reported once
+            line_numbers.append(line_number)
+    for key in conflicting_events:
+        line_numbers = events[key][1]
+        for line_number in line_numbers:
+            errors[line_number] = 'Conflicting values for the same event in lines ' + ', '.join(str(number) for number in line_numbers)
+
+    if errors:
+        with open(input_file, mode='r') as input_file_handler, open(error_file, 'w', encoding='utf-8-sig', newline="") as error_file_handle:
+            writer = csv.writer(error_file_handle, dialect='excel', delimiter=',')
+            writer.writerow(['Line'] + fieldnames + ['Error'])
+            for line_number, csv_line in enumerate(csv.DictReader(input_file_handler), start=2):
+                if line_number in errors:
+                    writer.writerow([line_number] + [csv_line.get(field) for field in fieldnames] + [errors[line_number]])
+        for line_number in sorted(errors)[:10]:
+            print('Line ' + str(line_number) + ': ' + errors[line_number])
+    msg = str(lines) + ' lines checked, ' + str(len(errors)) + ' with errors' + (', see ' + error_file if errors else '')
+    logging.info(msg)
+    print(msg)
+    return len(errors)
+
+def cached_lookup(entity, key):
+    # the result of a lookup from the persistent lookup cache (--cache_file), or None
+    if lookup_cache is None:
+        return None
+    return lookup_cache.get(entity, normalize_lookup_key(key))
+
+def cache_lookup(entity, key, value):
+    if lookup_cache is not None:
+        lookup_cache.put(entity, normalize_lookup_key(key), value)
+
+def normalize_lookup_key(key):
+    # names are looked up with ilike, so they are cached case insensitively
+    return str(key).strip().lower()
+
 def get_log_source_type_id(log_source_type):
+    # use the preloaded catalog if available
+    if catalog is not None:
+        return log_source_type_id_from_records(catalog.find_log_source_types(log_source_type), log_source_type)
+
+    # use the lookup cache if available
+    cached_records = cached_lookup('log_source_type', log_source_type)
+    if cached_records is not None:
+        return log_source_type_id_from_records(cached_records, log_source_type)
+
+    # send the request
+    response = client.call_api(*log_source_type_id_request(log_source_type), print_request=options.verbose)
+    return log_source_type_id_response(response, log_source_type)
+
+def log_source_type_id_request(log_source_type):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = 'config/event_sources/log_source_management/log_source_types'
     http_method = 'GET'
     fields = 'id, name, custom'
     query_filter = 'name ilike "'+log_source_type+'" '
     params = {'fields': fields, 'filter': query_filter}
     headers = {'range': 'items=0-5'}
+    return endpoint_url, http_method, headers, params
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, params=params,
-                               headers=headers, print_request=options.verbose)
-
+def log_source_type_id_response(response, log_source_type):
     # handle response
     if response.code == 200:
         qid_records = json.loads(response.read().decode('utf-8'))
-        # go through the returned list of qid records and print each one
-        logging.debug (qid_records)
-        for qid_record in qid_records:
-            logging.debug(qid_record)
-        if len(qid_records) == 1:
-            return qid_records[0]["id"]
-        elif len(qid_records) == 0:
-            raise LookupError('Could not find any Log Source Type ID for Log Source Type ' + log_source_type)
-        else:
-            raise LookupError('Found '+ str(len(qid_records)) + ' records for Log Source Type ' + log_source_type)
+        cache_lookup('log_source_type', log_source_type, qid_records)
+        return log_source_type_id_from_records(qid_records, log_source_type)
     else:
         logging.error(pretty_print_response(response))
         raise LookupError('Failed to retrieve the list of log source type records')
 
+def log_source_type_id_from_records(qid_records, log_source_type):
+    # go through the returned list of qid records and print each one
+    logging.debug (qid_records)
+    for qid_record in qid_records:
+        logging.debug(qid_record)
+    if len(qid_records) == 1:
+        return qid_records[0]["id"]
+    elif len(qid_records) == 0:
+        raise LookupError('Could not find any Log Source Type ID for Log Source Type ' + log_source_type)
+    else:
+        raise LookupError('Found '+ str(len(qid_records)) + ' records for Log Source Type ' + log_source_type)
+
+# the default severity only depends on the category, so it is looked up once per category
+@functools.lru_cache(maxsize=None)
 def get_default_severity(low_level_category_id):
-    # prepare request
-    client = client_module.RestApiClient(version='15.1')
-    endpoint_url = 'data_classification/low_level_categories' + '/' + str(low_level_category_id)
-    http_method = 'GET'
+    # use the preloaded catalog if available
+    if catalog is not None:
+        return default_severity_from_catalog(low_level_category_id)
 
+    # use the lookup cache if available
+    cached_record = cached_lookup('default_severity', low_level_category_id)
+    if cached_record is not None:
+        return default_severity_from_record(cached_record, low_level_category_id)
 
     # send the request
-    response = client.call_api(endpoint_url, http_method, print_request=options.verbose)
+    response = client.call_api(*default_severity_request(low_level_category_id), print_request=options.verbose)
+    return default_severity_response(response, low_level_category_id)
+
+def default_severity_from_catalog(low_level_category_id):
+    llc_record = catalog.get_low_level_category(low_level_category_id)
+    if llc_record is None:
+        raise LookupError('Could not find any Low Level Category ID ' + str(low_level_category_id))
+    return default_severity_from_record(llc_record, low_level_category_id)
+
+def default_severity_request(low_level_category_id):
+    # prepare request
+    endpoint_url = 'data_classification/low_level_categories' + '/' + str(low_level_category_id)
+    http_method = 'GET'
+    return endpoint_url, http_method
 
+def default_severity_response(response, low_level_category_id):
     # handle response
     if response.code == 200:
         llc_record = json.loads(response.read().decode('utf-8'))
-        # go through the returned list of qid records and print each one
-        logging.debug(llc_record)
-        if "severity" in llc_record:
-            logging.debug(llc_record)
-            return str(llc_record["severity"])
-        else:
-            raise LookupError('Could not find any Low Level Category ID ' + low_level_category_id)
+        cache_lookup('default_severity', low_level_category_id, llc_record)
+        return default_severity_from_record(llc_record, low_level_category_id)
     else:
         raise LookupError('Failed to retrieve Low Level Category record')
 
+def default_severity_from_record(llc_record, low_level_category_id):
+    # go through the returned list of qid records and print each one
+    logging.debug(llc_record)
+    if "severity" in llc_record:
+        logging.debug(llc_record)
+        return str(llc_record["severity"])
+    else:
+        raise LookupError('Could not find any Low Level Category ID ' + str(low_level_category_id))
+
 def get_low_level_category_id(low_level_category, high_level_category):
+    # use the offline categories file or the preloaded catalog if available
+    if category_resolver is not None or catalog is not None:
+        return low_level_category_id_offline(low_level_category, high_level_category)
+
+    # use the lookup cache if available
+    cached_records = cached_lookup('low_level_category', low_level_category)
+    if cached_records is not None:
+        return low_level_category_id_from_records(cached_records, low_level_category)
+
+    # send the request
+    response = client.call_api(*low_level_category_id_request(low_level_category), print_request=options.verbose)
+    return low_level_category_id_response(response, low_level_category)
+
+def low_level_category_id_offline(low_level_category, high_level_category):
+    # both narrow down the results using the High Level Category
+    if category_resolver is not None:
+        llc_records = [{"id": llc_id} for llc_id in category_resolver.find_low_level_category_ids(low_level_category, high_level_category)]
+    else:
+        llc_records = catalog.find_low_level_categories(low_level_category, high_level_category)
+    return low_level_category_id_from_records(llc_records, low_level_category)
+
+def low_level_category_id_request(low_level_category):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = 'data_classification/low_level_categories'
     http_method = 'GET'
     fields = 'id, name, description, severity, high_level_category_id'
     query_filter = 'name ilike "'+low_level_category+'" '
     params = {'fields': fields, 'filter': query_filter}
     headers = {'range': 'items=0-5'}
+    return endpoint_url, http_method, headers, params
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, params=params,
-                               headers=headers, print_request=options.verbose)
-
+def low_level_category_id_response(response, low_level_category):
     # handle response
     if response.code == 200:
         llc_records = json.loads(response.read().decode('utf-8'))
-        # go through the returned list of qid records and print each one
-        logging.debug(llc_records)
-        for llc_record in llc_records:
-            logging.debug(llc_record)
-        if len(llc_records) == 1:
-            return llc_records[0]["id"]
-        elif len(llc_records) == 0:
-            raise LookupError('Could not find any Low Level Category ID for Low Level Category ' + low_level_category)
-        else:
-            # TODO: find the unique value based on the HLC
-            raise LookupError('Found '+ str(len(llc_records)) + ' records for Low Level Category ' + low_level_category)
+        cache_lookup('low_level_category', low_level_category, llc_records)
+        return low_level_category_id_from_records(llc_records, low_level_category)
     else:
         logging.error(pretty_print_response(response))
         raise LookupError('Failed to retrieve the list of Low Level Category records')
 
+def low_level_category_id_from_records(llc_records, low_level_category):
+    # go through the returned list of qid records and print each one
+    logging.debug(llc_records)
+    for llc_record in llc_records:
+        logging.debug(llc_record)
+    if len(llc_records) == 1:
+        return llc_records[0]["id"]
+    elif len(llc_records) == 0:
+        raise LookupError('Could not find any Low Level Category ID for Low Level Category ' + low_level_category)
+    else:
+        # TODO: find the unique value based on the HLC (done when the catalog is preloaded)
+        raise LookupError('Found '+ str(len(llc_records)) + ' records for Low Level Category ' + low_level_category)
+
+@timed_phase('process')
 def process_csv_line(csv_line):
 
+    new_qid_record, dsm_event_mapping = resolve_csv_line(csv_line)
+    qid_record = write_csv_line_qid_record(csv_line, new_qid_record, dsm_event_mapping)
+    return write_csv_line_dsm_event_mapping(csv_line, qid_record, dsm_event_mapping)
+
+def resolve_csv_line(csv_line):
     # create a new qid record first to be mapped to the dsm event
-    new_qid_record = {'log_source_type_id': int(csv_line["Log Source Type ID"]),
-                      'name': csv_line["QID Name"],
-                      'description': csv_line["QID Description"],
-                      'severity': int(csv_line["Severity"]),
-                      'low_level_category_id': int(csv_line["Low Level Category ID"])
-                      }
+    new_qid_record = new_qid_record_from_csv_line(csv_line)
 
     dsm_event_mapping = get_dsm_event_mapping(csv_line)
-
+    return new_qid_record, dsm_event_mapping
+
+def write_csv_line_qid_record(csv_line, new_qid_record, dsm_event_mapping):
+    return run_writes(qid_record_writes(csv_line, new_qid_record, dsm_event_mapping))
+
+def write_csv_line_dsm_event_mapping(csv_line, qid_record, dsm_event_mapping):
+    return run_writes(dsm_event_mapping_writes(csv_line, qid_record, dsm_event_mapping))
+
+# The writes of a line are generators shared by the sequential and the asyncio modes: they yield
+# (function, arguments) for each call to the console and are sent its result, run_writes() calls
+# the functions and async_run_writes() their async versions.
+def run_writes(writes):
+    try:
+        function, arguments = next(writes)
+        while True:
+            function, arguments = writes.send(function(*arguments))
+    except StopIteration as stop:
+        return stop.value
+
+def qid_record_writes(csv_line, new_qid_record, dsm_event_mapping):
     # first take care of QID record
-    if csv_line_contains_value_for(csv_line,"QID") and csv_line["QID"] != "0": # use provided QID for mapping
-        qid_records = get_qid_records('qid = ' + str(csv_line["QID"]))
-        if len(qid_records) == 0:
-            msg="Can't find QID record for QID " + str(csv_line["QID"]) + ". do nothing!"
-            logging.info(msg)
-            qid_record = {"qid_result": "SKIPPED", "qid_result_msg": msg}
-        elif len(qid_records) == 1:
-            qid_record=qid_records[0]
-            msg="using existing QID record! " + str(csv_line["QID"])
-            logging.info(msg)
-            qid_record.update({"qid_result": "SKIPPED", "qid_result_msg": msg})
-        else:
-            msg="Found dupplicated QID records for QID " + str(csv_line["QID"]) + ". This should never happen do nothing!"
-            logging.info(msg)
-            qid_record = {"qid_result": "SKIPPED", "qid_result_msg": msg}
+    if uses_existing_qid(csv_line): # use provided QID for mapping
+        qid_record = existing_qid_record_from_records((yield get_existing_qid_records, (csv_line["QID"],)), csv_line)
     elif dsm_event_mapping != None: # use currently mapped QID and update it with new values
         logging.debug(new_qid_record)
-        qid_record = update_qid_record(dsm_event_mapping["qid_record_id"],new_qid_record)
+        qid_record = baseline_qid_record_if_up_to_date(dsm_event_mapping["qid_record_id"],new_qid_record)
+        if qid_record is None:
+            qid_record = yield update_qid_record, (dsm_event_mapping["qid_record_id"],new_qid_record)
     else: # create new qid record and dsm_event_mapping
         logging.debug(new_qid_record)
-        qid_record = create_qid_record(new_qid_record)
+        qid_record = yield create_qid_record, (new_qid_record,)
+    return qid_record
 
+def dsm_event_mapping_writes(csv_line, qid_record, dsm_event_mapping):
     # then take care of event mapping
     if dsm_event_mapping == None: # create new mapping
-        new_dsm_event_mapping = {"log_source_type_id": int(csv_line["Log Source Type ID"]),
-                                 "log_source_event_id": csv_line["Event ID"],
-                                 "log_source_event_category": csv_line["Event Category"],
-                                 "qid_record_id": qid_record['id']
-                                 }
+        new_dsm_event_mapping = new_dsm_event_mapping_from_csv_line(csv_line, qid_record)
         logging.debug(new_dsm_event_mapping)
-        dsm_event_mapping = create_dsm_event_mapping(new_dsm_event_mapping)
+        dsm_event_mapping = yield create_dsm_event_mapping, (new_dsm_event_mapping,)
     elif 'id' not in qid_record:
         msg="QID not available"
         logging.info(msg)
         dsm_event_mapping.update({"mapping_result": "SKIPPED", "mapping_result_msg": msg})
     elif dsm_event_mapping['qid_record_id'] != qid_record['id']: # update existing mapping (if needed)
-        dsm_event_mapping = update_dsm_event_mapping(dsm_event_mapping["id"],{"qid_record_id": qid_record['id']})
+        dsm_event_mapping = yield update_dsm_event_mapping, (dsm_event_mapping["id"],{"qid_record_id": qid_record['id']})
     else: # skip mapping
         msg="Already mapped"
         logging.info(msg)
         dsm_event_mapping.update({"mapping_result": "SKIPPED", "mapping_result_msg": msg})
 
+    return merge_result(qid_record, dsm_event_mapping)
+
+def new_qid_record_from_csv_line(csv_line):
+    return {'log_source_type_id': int(csv_line["Log Source Type ID"]),
+            'name': csv_line["QID Name"],
+            'description': csv_line["QID Description"],
+            'severity': int(csv_line["Severity"]),
+            'low_level_category_id': int(csv_line["Low Level Category ID"])
+            }
+
+def new_dsm_event_mapping_from_csv_line(csv_line, qid_record):
+    return {"log_source_type_id": int(csv_line["Log Source Type ID"]),
+            "log_source_event_id": csv_line["Event ID"],
+            "log_source_event_category": csv_line["Event Category"],
+            "qid_record_id": qid_record['id']
+            }
+
+def uses_existing_qid(csv_line):
+    return csv_line_contains_value_for(csv_line,"QID") and csv_line["QID"] != "0"
+
+def existing_qid_record_from_records(qid_records, csv_line):
+    if len(qid_records) == 0:
+        msg="Can't find QID record for QID " + str(csv_line["QID"]) + ". do nothing!"
+        logging.info(msg)
+        qid_record = {"qid_result": "SKIPPED", "qid_result_msg": msg}
+    elif len(qid_records) == 1:
+        qid_record=qid_records[0]
+        msg="using existing QID record! " + str(csv_line["QID"])
+        logging.info(msg)
+        qid_record.update({"qid_result": "SKIPPED", "qid_result_msg": msg})
+    else:
+        msg="Found dupplicated QID records for QID " + str(csv_line["QID"]) + ". This should never happen do nothing!"
+        logging.info(msg)
+        qid_record = {"qid_result": "SKIPPED", "qid_result_msg": msg}
+    return qid_record
+
+def merge_result(qid_record, dsm_event_mapping):
     result=dict()
     #result.update(csv_line)
     result.update(qid_record)
@@ -269,69 +884,454 @@ def process_csv_line(csv_line):
     #print(qid_record)
     #print(dsm_event_mapping)
     #print(result)
+    return result
+
+# output columns, in order
+header_row = [
+    'Event Mapping Record ID',
+    'Log Source Type',
+    'Log Source Type ID',
+    'Event Category',
+    'Event ID',
+    'QID Record ID',
+    'QID',
+    'QID Name',
+    'QID Description',
+    'Severity',
+    'Low Level Category ID',
+    'Low Level Category',
+    'High Level Category',
+    'Mapping Result',
+    'Mapping Result Msg',
+    'QID Result',
+    'QID Result Msg'
+]
+
+# keys of the REST API records (and of the result messages) written to each output column
+header_mapping = {
+    'id': 'Event Mapping Record ID',
+    'log_source_type': 'Log Source Type',
+    'log_source_type_id': 'Log Source Type ID',
+    'log_source_event_category': 'Event Category',
+    'log_source_event_id': 'Event ID',
+    'qid_record_id': 'QID Record ID',
+    'qid': 'QID',
+    'name': 'QID Name',
+    'description': 'QID Description',
+    'severity': 'Severity',
+    'low_level_category_id': 'Low Level Category ID',
+    'low_level_category': 'Low Level Category',
+    'high_level_category': 'High Level Category',
+    'mapping_result': 'Mapping Result',
+    'mapping_result_msg': 'Mapping Result Msg',
+    'qid_result': 'QID Result',
+    'qid_result_msg': 'QID Result Msg'
+}
+
+# input columns set by validate_csv_line, kept in the compact rows even when the file does not have them
+validated_columns = ['Log Source Type ID', 'Low Level Category ID', 'Severity', 'QID Description']
+
+# columns with few distinct values, stored once in the compact rows and results
+interned_columns = [
+    'Log Source Type',
+    'Log Source Type ID',
+    'Event Category',
+    'Severity',
+    'Low Level Category ID',
+    'Low Level Category',
+    'High Level Category',
+    'Mapping Result',
+    'QID Result'
+]
+
+# a result reduced to the output columns
+ResultRecord = compact_records_module.record_class('ResultRecord', header_row, interned_columns)
+
+def compact_csv_lines(fieldnames, csv_lines):
+    # the lines of the file as compact rows, for the modes that keep the whole file in memory
+    row_class = compact_records_module.record_class('InputRow', fieldnames + validated_columns, interned_columns)
+    return [row_class(csv_line) for csv_line in csv_lines]
+
+class ResultWriter:
+    """
+    Writes the results to the output file as soon as each line has been processed.
+
+    A result is a dict as returned by process_csv_line (REST API record keys) or by
+    error_result (input CSV columns), or a ResultRecord returned by record. The output file is opened and the header row
+    is written when the writer is created; every result is written and flushed
+    right away, so nothing is kept in memory and a crash leaves the results of all
+    the lines processed so far.
+
+    The header_row controls the ordering of the output results. The projection of a
+    result into the header rows is computed once: a column takes the value of its
+    REST API key if the result has it, otherwise the value of the column itself.
+    """
+
+    def __init__(self, output_file):
+        column_keys = dict((column, key) for key, column in header_mapping.items())
+        self.projection = [(column_keys.get(column, column), column) for column in header_row]
+
+        self.output_file_handle = open(output_file, 'w', encoding='utf-8-sig', newline="")
+        self.writer = csv.writer(self.output_file_handle, dialect='excel', delimiter=',')
+        self.writer.writerow(header_row)
+        self.output_file_handle.flush()
+        self.rows = 0
+
+    @timed_phase('write results')
+    def write(self, result):
+        self.writer.writerow(self.values(result))
+        self.output_file_handle.flush()
+        self.rows += 1
+
+    def values(self, result):
+        if isinstance(result, ResultRecord):
+            return result.values()
+        return [result[key] if key in result else result.get(column) for key, column in self.projection]
+
+    def record(self, result):
+        # the compact form of a result kept in memory until it is written
+        return ResultRecord.from_values(self.values(result))
+
+    def row(self, result):
+        return dict(zip(header_row, self.values(result)))
 
-    results.append(result)
-
-def write_file(output_file, results):
-        """
-        Writes the passed results to the output file.
-
-        results must be a list of result objects this is (I guess pretty loosely) defined
-        in this script. output_file is the name of the file to write the results to.
-
-        The header_row controls the ordering of the output results. The function also
-        maps the keys in the result objects to the header rows so it can be written
-        using the csv.DictReader method.
-        """
-        header_row = [
-            'Event Mapping Record ID',
-            'Log Source Type',
-            'Log Source Type ID',
-            'Event Category',
-            'Event ID',
-            'QID Record ID',
-            'QID',
-            'QID Name',
-            'QID Description',
-            'Severity',
-            'Low Level Category ID',
-            'Low Level Category',
-            'High Level Category',
-            'Mapping Result',
-            'Mapping Result Msg',
-            'QID Result',
-            'QID Result Msg'
-        ]
-
-        header_mapping = {
-            'id': 'Event Mapping Record ID',
-            'log_source_type': 'Log Source Type',
-            'log_source_type_id': 'Log Source Type ID',
-            'log_source_event_category': 'Event Category',
-            'log_source_event_id': 'Event ID',
-            'qid_record_id': 'QID Record ID',
-            'qid': 'QID',
-            'name': 'QID Name',
-            'description': 'QID Description',
-            'severity': 'Severity',
-            'low_level_category_id': 'Low Level Category ID',
-            'low_level_category': 'Low Level Category',
-            'high_level_category': 'High Level Category',
-            'mapping_result': 'Mapping Result',
-            'mapping_result_msg': 'Mapping Result Msg',
-            'qid_result': 'QID Result',
-            'qid_result_msg': 'QID Result Msg'
-        }
-
-        for result in results:
-            for mapping in header_mapping.items():
-                if mapping[0] in result:
-                    result[mapping[1]] = result.pop(mapping[0])
-
-        with open(output_file, 'w', encoding='utf-8-sig', newline="") as output_file_handle:
-            writer = csv.DictWriter(f=output_file_handle, fieldnames=header_row, extrasaction='ignore', dialect='excel', delimiter=',')
-            writer.writerow(dict((h, h) for h in header_row))
-            writer.writerows([dict((k, v) for k, v in result.items()) for result in results])
+    def close(self):
+        self.output_file_handle.close()
+
+
+# coalesce mode: all the lines are read and validated first, repeated events are processed once
+# and every QID record is created or updated once, whatever the number of lines referring to it
+
+def coalesce(input_file):
+
+    if mapping_index is not None:
+        prefetch_dsm_event_mappings(input_file)
+    prefetch_qid_records(input_file)
+
+    with open(input_file, mode='r') as input_file_handler:
+        csv_reader = csv.DictReader(input_file_handler)
+        csv_lines = compact_csv_lines(csv_reader.fieldnames or [], timed_csv_lines(csv_reader))
+    line_numbers = list(range(2, len(csv_lines) + 2))
+    results = [None] * len(csv_lines)
+
+    # validate content
+    for i, csv_line in enumerate(csv_lines):
+        logging.info(csv_line)
+        try:
+            validate_csv_line(csv_line)
+        except (ValueError, LookupError) as error: # if controlled validation or lookup error (log to console and skip this line)
+            results[i] = result_writer.record(error_result(csv_line, error))
+
+    # lines of the same event: identical lines are processed once, conflicting ones are not processed at all
+    duplicates = {} # line index -> index of the first line of the event
+    for indexes in group_lines(csv_lines, results, event_key).values():
+        if all_same_values(csv_lines, indexes, compact_records_module.Record.values):
+            for i in indexes[1:]:
+                duplicates[i] = indexes[0]
+        else:
+            report_conflict(csv_lines, results, indexes, line_numbers, 'Conflicting values for the same event in lines ')
+
+    # lines creating the same new QID record: one record with the same values
+    unique_lines = [i for i in range(len(csv_lines)) if i not in duplicates]
+    qid_groups = group_lines(csv_lines, results, qid_record_key, unique_lines)
+    for indexes in qid_groups.values():
+        if not all_same_values(csv_lines, indexes, new_qid_record_from_csv_line):
+            report_conflict(csv_lines, results, indexes, line_numbers, 'Conflicting QID values for the same QID Name in lines ')
+
+    # current mapping of each event
+    dsm_event_mappings = {}
+    for i in unique_lines:
+        if results[i] is None:
+            dsm_event_mappings[i] = get_dsm_event_mapping(csv_lines[i])
+
+    # QID record of each line
+    qid_records = {}
+    written_qid_records = {} # QID record id -> (line, result of its update or creation)
+    existing_qid_records = {} # QID -> result of its lookup
+    for key, indexes in qid_groups.items():
+        indexes = [i for i in indexes if results[i] is None]
+        if not indexes:
+            continue
+        # an event of the group that is already mapped gives the QID record of the whole group
+        mapped_indexes = [i for i in indexes if dsm_event_mappings[i] is not None]
+        new_qid_record = new_qid_record_from_csv_line(csv_lines[indexes[0]])
+        if mapped_indexes:
+            group_qid_record = write_qid_record_once(dsm_event_mappings[mapped_indexes[0]]["qid_record_id"], new_qid_record, line_numbers[mapped_indexes[0]], written_qid_records)
+        else:
+            logging.debug(new_qid_record)
+            group_qid_record = create_qid_record(new_qid_record)
+            if 'id' in group_qid_record:
+                written_qid_records[group_qid_record['id']] = (line_numbers[indexes[0]], group_qid_record)
+        for i in indexes:
+            if dsm_event_mappings[i] is not None: # use currently mapped QID and update it with new values
+                qid_records[i] = write_qid_record_once(dsm_event_mappings[i]["qid_record_id"], new_qid_record, line_numbers[i], written_qid_records)
+            elif i == indexes[0] and not mapped_indexes:
+                qid_records[i] = group_qid_record
+            else:
+                qid_records[i] = shared_qid_record(group_qid_record, written_qid_records)
+    for i in unique_lines:
+        if results[i] is None and uses_existing_qid(csv_lines[i]): # use provided QID for mapping
+            qid = str(csv_lines[i]["QID"])
+            if qid not in existing_qid_records:
+                existing_qid_records[qid] = existing_qid_record_from_records(get_existing_qid_records(qid), csv_lines[i])
+            qid_records[i] = dict(existing_qid_records[qid])
+
+    # then take care of event mappings, the records of each line are only kept until its result is written
+    for i in unique_lines:
+        if results[i] is None:
+            results[i] = result_writer.record(write_dsm_event_mapping(csv_lines[i], qid_records.pop(i), dsm_event_mappings.pop(i)))
+    for i, first in duplicates.items():
+        results[i] = results[first].copy()
+        if results[i]["Mapping Result"] != "ERROR":
+            msg = "Duplicate of line " + str(line_numbers[first])
+            logging.info(msg)
+            results[i].update({"Mapping Result": "SKIPPED", "Mapping Result Msg": msg, "QID Result": "SKIPPED", "QID Result Msg": msg})
+
+    for result in results:
+        result_writer.write(result)
+
+def event_key(csv_line):
+    return (int(csv_line["Log Source Type ID"]), csv_line["Event ID"], csv_line["Event Category"])
+
+def qid_record_key(csv_line):
+    if uses_existing_qid(csv_line):
+        return None
+    return (int(csv_line["Log Source Type ID"]), csv_line["QID Name"])
+
+def group_lines(csv_lines, results, key_function, indexes=None):
+    # indexes of the valid lines by key, in input order
+    groups = collections.OrderedDict()
+    for i in (range(len(csv_lines)) if indexes is None else indexes):
+        if results[i] is None:
+            key = key_function(csv_lines[i])
+            if key is not None:
+                groups.setdefault(key, []).append(i)
+    return groups
+
+def all_same_values(csv_lines, indexes, value_function):
+    first_values = value_function(csv_lines[indexes[0]])
+    return all(value_function(csv_lines[i]) == first_values for i in indexes[1:])
+
+def report_conflict(csv_lines, results, indexes, line_numbers, msg):
+    error = ValueError(msg + ', '.join(str(line_numbers[i]) for i in indexes))
+    for i in indexes:
+        results[i] = result_writer.record(error_result(csv_lines[i], error))
+
+def write_qid_record_once(qid_record_id, new_qid_record, line_number, written_qid_records):
+    if qid_record_id in written_qid_records:
+        written_line_number, qid_record = written_qid_records[qid_record_id]
+        if written_line_number == line_number:
+            return qid_record
+        return shared_qid_record(qid_record, written_qid_records)
+    logging.debug(new_qid_record)
+    qid_record = baseline_qid_record_if_up_to_date(qid_record_id, new_qid_record) or update_qid_record(qid_record_id, new_qid_record)
+    written_qid_records[qid_record_id] = (line_number, qid_record)
+    return qid_record
+
+def shared_qid_record(qid_record, written_qid_records):
+    # the result of a QID record written for a previous line
+    qid_record = dict(qid_record)
+    if 'id' in qid_record and qid_record["qid_result"] in ("CREATED", "UPDATED"):
+        msg = qid_record["qid_result"].capitalize() + " for line " + str(written_qid_records[qid_record['id']][0])
+        qid_record.update({"qid_result": "SKIPPED", "qid_result_msg": msg})
+    return qid_record
+
+def write_dsm_event_mapping(csv_line, qid_record, dsm_event_mapping):
+    if dsm_event_mapping == None: # create new mapping
+        if 'id' not in qid_record:
+            msg="QID not available"
+            logging.info(msg)
+            return merge_result(qid_record, {"mapping_result": "SKIPPED", "mapping_result_msg": msg})
+        new_dsm_event_mapping = new_dsm_event_mapping_from_csv_line(csv_line, qid_record)
+        logging.debug(new_dsm_event_mapping)
+        dsm_event_mapping = create_dsm_event_mapping(new_dsm_event_mapping)
+    elif 'id' not in qid_record:
+        msg="QID not available"
+        logging.info(msg)
+        dsm_event_mapping.update({"mapping_result": "SKIPPED", "mapping_result_msg": msg})
+    elif dsm_event_mapping['qid_record_id'] != qid_record['id']: # update existing mapping (if needed)
+        dsm_event_mapping = update_dsm_event_mapping(dsm_event_mapping["id"],{"qid_record_id": qid_record['id']})
+    else: # skip mapping
+        msg="Already mapped"
+        logging.info(msg)
+        dsm_event_mapping.update({"mapping_result": "SKIPPED", "mapping_result_msg": msg})
+
+    return merge_result(qid_record, dsm_event_mapping)
+
+
+# plan mode: resolve every line against the current console content without changing it,
+# and write the actions that an import would take to a plan file that can be reviewed and applied later
+
+plan_header_row = [
+    'Line',
+    'Log Source Type',
+    'Log Source Type ID',
+    'Event Category',
+    'Event ID',
+    'QID',
+    'QID Name',
+    'QID Description',
+    'Severity',
+    'Low Level Category ID',
+    'Low Level Category',
+    'High Level Category',
+    'QID Action',
+    'QID Record ID',
+    'Mapping Action',
+    'Event Mapping Record ID',
+    'QID Plan Msg',
+    'Mapping Plan Msg'
+]
+
+def plan(input_file, plan_file):
+
+    # read the current mappings and QID records of the log source types of the file, unless they come from a baseline snapshot
+    if baseline is None:
+        log_source_type_ids = input_log_source_type_ids(input_file)
+        mapping_index.load(client, log_source_type_ids, print_request=options.verbose)
+        qid_record_index.load(client, log_source_type_ids, print_request=options.verbose)
+    else:
+        prefetch_dsm_event_mappings(input_file)
+    prefetch_qid_records(input_file)
+
+    planned_mappings = {} # (Log Source Type ID, Event ID, Event Category) -> line creating the mapping
+    action_counts = collections.Counter()
+    with open(input_file, mode='r') as input_file_handler, open(plan_file, 'w', encoding='utf-8-sig', newline="") as plan_file_handle:
+        plan_writer = csv.DictWriter(f=plan_file_handle, fieldnames=plan_header_row, extrasaction='ignore', dialect='excel', delimiter=',')
+        plan_writer.writeheader()
+        for line_number, csv_line in enumerate(csv.DictReader(input_file_handler), start=2):
+            plan_row = plan_csv_line(csv_line, line_number, planned_mappings)
+            plan_writer.writerow(plan_row)
+            action_counts[plan_row['QID Action'] + ' QID / ' + plan_row['Mapping Action'] + ' mapping'] += 1
+
+    for actions, count in sorted(action_counts.items()):
+        print(str(count) + '\t' + actions)
+    return sum(action_counts.values())
+
+def plan_csv_line(csv_line, line_number, planned_mappings):
+    logging.info(csv_line)
+    try:
+        valid_csv_line = validate_csv_line(csv_line) # validate content
+        return plan_valid_csv_line(valid_csv_line, line_number, planned_mappings)
+    except (ValueError, LookupError) as error: # if controlled validation or lookup error (log and skip this line)
+        logging.error(error)
+        logging.error("Line: " + str(csv_line))
+        return dict(csv_line, **{'Line': line_number, 'QID Action': 'ERROR', 'Mapping Action': 'ERROR', 'QID Plan Msg': str(error), 'Mapping Plan Msg': str(error)})
+
+def plan_valid_csv_line(valid_csv_line, line_number, planned_mappings):
+    # the lookups of the line raise LookupError, reported as an error of this line only
+    plan_row = dict(valid_csv_line, **{'Line': line_number, 'QID Record ID': '', 'Event Mapping Record ID': '', 'QID Plan Msg': '', 'Mapping Plan Msg': ''})
+    key = (int(valid_csv_line["Log Source Type ID"]), valid_csv_line["Event ID"], valid_csv_line["Event Category"])
+    dsm_event_mapping = get_dsm_event_mapping(valid_csv_line)
+
+    # first take care of QID record
+    if uses_existing_qid(valid_csv_line): # use provided QID for mapping
+        qid_record = existing_qid_record_from_records(get_existing_qid_records(valid_csv_line["QID"]), valid_csv_line)
+        plan_row['QID Action'] = 'SKIP'
+        plan_row['QID Record ID'] = qid_record.get('id', '')
+        plan_row['QID Plan Msg'] = qid_record['qid_result_msg']
+    elif dsm_event_mapping != None: # update the currently mapped QID if its values change
+        qid_record = qid_record_index.get(dsm_event_mapping["qid_record_id"]) or get_qid_record(dsm_event_mapping["qid_record_id"])
+        plan_row['QID Record ID'] = dsm_event_mapping["qid_record_id"]
+        if qid_record_is_up_to_date(qid_record, new_qid_record_from_csv_line(valid_csv_line)):
+            plan_row['QID Action'] = 'SKIP'
+            plan_row['QID Plan Msg'] = 'QID record is up to date'
+        else:
+            plan_row['QID Action'] = 'UPDATE'
+    elif key in planned_mappings: # the QID record is created by a previous line
+        plan_row['QID Action'] = 'UPDATE'
+        plan_row['QID Plan Msg'] = 'QID record created by line ' + str(planned_mappings[key])
+    else: # create new qid record and dsm_event_mapping
+        plan_row['QID Action'] = 'CREATE'
+
+    # then take care of event mapping
+    if dsm_event_mapping == None and key in planned_mappings:
+        plan_row['Mapping Action'] = 'SKIP'
+        plan_row['Mapping Plan Msg'] = 'Mapped by line ' + str(planned_mappings[key])
+    elif dsm_event_mapping == None:
+        if plan_row['QID Action'] == 'SKIP' and plan_row['QID Record ID'] == '':
+            plan_row['Mapping Action'] = 'SKIP'
+            plan_row['Mapping Plan Msg'] = 'QID not available'
+        else:
+            plan_row['Mapping Action'] = 'CREATE'
+            planned_mappings[key] = line_number
+    else:
+        plan_row['Event Mapping Record ID'] = dsm_event_mapping["id"]
+        if plan_row['QID Record ID'] == '':
+            plan_row['Mapping Action'] = 'SKIP'
+            plan_row['Mapping Plan Msg'] = 'QID not available'
+        elif dsm_event_mapping['qid_record_id'] != plan_row['QID Record ID']:
+            plan_row['Mapping Action'] = 'UPDATE'
+        else:
+            plan_row['Mapping Action'] = 'SKIP'
+            plan_row['Mapping Plan Msg'] = 'Already mapped'
+
+    return plan_row
+
+def baseline_qid_record_if_up_to_date(qid_record_id, new_qid_record):
+    # with a baseline snapshot the current values of the QID record are known, it is only written if they change
+    if baseline is None:
+        return None
+    qid_record = qid_record_index.get(qid_record_id)
+    if qid_record is None or not qid_record_is_up_to_date(qid_record, new_qid_record):
+        return None
+    msg = "QID record is up to date"
+    logging.info(msg)
+    qid_record.update({"qid_result": "SKIPPED", "qid_result_msg": msg})
+    return qid_record
+
+def qid_record_is_up_to_date(qid_record, new_qid_record):
+    for field in ('name', 'description', 'severity', 'low_level_category_id'):
+        if qid_record.get(field) != new_qid_record[field]:
+            return False
+    return True
+
+def apply_plan(plan_file):
+    # execute the actions of a plan file, lines without any action are not sent to the console
+    applied_qid_record_ids = {} # (Log Source Type ID, Event ID, Event Category) -> QID record created by a previous line
+    with open(plan_file, mode='r', encoding='utf-8-sig') as plan_file_handler:
+        for plan_row in csv.DictReader(plan_file_handler):
+            result_writer.write(apply_plan_row(plan_row, applied_qid_record_ids))
+
+def apply_plan_row(plan_row, applied_qid_record_ids):
+    logging.info(plan_row)
+    result = dict(plan_row)
+    if plan_row['QID Action'] == 'ERROR':
+        result.update({"mapping_result": "ERROR", "mapping_result_msg": plan_row['Mapping Plan Msg']})
+        return result
+
+    key = (int(plan_row["Log Source Type ID"]), plan_row["Event ID"], plan_row["Event Category"])
+
+    # first take care of QID record
+    if plan_row['QID Action'] == 'CREATE':
+        qid_record = create_qid_record(new_qid_record_from_csv_line(plan_row))
+        if 'id' in qid_record:
+            applied_qid_record_ids[key] = qid_record['id']
+    elif plan_row['QID Action'] == 'UPDATE':
+        qid_record_id = plan_row['QID Record ID'] or applied_qid_record_ids.get(key)
+        if qid_record_id is None:
+            qid_record = {"qid_result": "SKIPPED", "qid_result_msg": "QID record was not created"}
+        else:
+            qid_record = update_qid_record(qid_record_id, new_qid_record_from_csv_line(plan_row))
+    else:
+        qid_record = {"qid_result": "SKIPPED", "qid_result_msg": plan_row['QID Plan Msg']}
+        if plan_row['QID Record ID'] != '':
+            qid_record['id'] = int(plan_row['QID Record ID'])
+
+    # then take care of event mapping
+    if plan_row['Mapping Action'] == 'CREATE' and 'id' in qid_record:
+        dsm_event_mapping = create_dsm_event_mapping(new_dsm_event_mapping_from_csv_line(plan_row, qid_record))
+    elif plan_row['Mapping Action'] == 'UPDATE' and 'id' in qid_record:
+        dsm_event_mapping = update_dsm_event_mapping(plan_row['Event Mapping Record ID'], {"qid_record_id": qid_record['id']})
+    elif plan_row['Mapping Action'] == 'SKIP':
+        dsm_event_mapping = {"mapping_result": "SKIPPED", "mapping_result_msg": plan_row['Mapping Plan Msg']}
+        if plan_row['Event Mapping Record ID'] != '':
+            dsm_event_mapping['id'] = int(plan_row['Event Mapping Record ID'])
+    else:
+        dsm_event_mapping = {"mapping_result": "SKIPPED", "mapping_result_msg": "QID not available"}
+
+    result.update(merge_result(qid_record, dsm_event_mapping))
+    return result
 
 
 def pretty_print_response(response):
@@ -339,19 +1339,25 @@ def pretty_print_response(response):
 
 def get_dsm_event_mapping(csv_line):
 
+    # use the prefetched mappings if available for this event
+    if mapping_index is not None and mapping_index.is_known(csv_line["Log Source Type ID"], csv_line["Event ID"], csv_line["Event Category"]):
+        return mapping_index.get(csv_line["Log Source Type ID"], csv_line["Event ID"], csv_line["Event Category"])
+
+    # send the request
+    response = client.call_api(*dsm_event_mapping_request(csv_line), print_request=options.verbose)
+    return dsm_event_mapping_response(response)
+
+def dsm_event_mapping_request(csv_line):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = 'data_classification/dsm_event_mappings'
     http_method = 'GET'
     fields = 'id, log_source_type_id, log_source_event_id, log_source_event_category, qid_record_id'
     query_filter = 'log_source_type_id = ' + str(csv_line["Log Source Type ID"]) + ' and log_source_event_id = "' + str(csv_line["Event ID"]) + '" and log_source_event_category = "' + str(csv_line["Event Category"]) +'"'
     params = {'fields': fields, 'filter': query_filter}
     headers = {'range': 'items=0-5'}
+    return endpoint_url, http_method, headers, params
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, params=params,
-                               headers=headers, print_request=options.verbose)
-
+def dsm_event_mapping_response(response):
     # handle response
     if response.code == 200:
         dsm_event_mapping_records = json.loads(response.read().decode('utf-8'))
@@ -366,7 +1372,6 @@ def get_dsm_event_mapping(csv_line):
         raise LookupError('Failed to retrieve the list of dsm_event_mappings')
 
 def get_qid_record(qid_record_id):
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = ('data_classification/qid_records' + '/' + str(qid_record_id))
     http_method = 'GET'
     response = client.call_api(endpoint_url, http_method, print_request=options.verbose)
@@ -377,27 +1382,41 @@ def get_qid_record(qid_record_id):
         logging.debug(json.dumps(qid_record, indent=4))
         return qid_record
     else:
-        SampleUtilities.pretty_print_response(response)
+        logging.error(pretty_print_response(response))
         raise LookupError('Failed to retrieve the qid record with id=' + str(qid_record_id))
 
+def get_existing_qid_records(qid):
+    # use the QID records prefetched in batches if available
+    if qid_record_index.has_qid(qid):
+        return qid_record_index.find_by_qid(qid)
+    return get_qid_records('qid = ' + str(qid))
+
 def get_qid_records(query_filter):
 
+    # use the lookup cache if available
+    cached_records = cached_lookup('qid_records', query_filter)
+    if cached_records is not None:
+        return cached_records
+
+    # send the request
+    response = client.call_api(*qid_records_request(query_filter), print_request=options.verbose)
+    return qid_records_response(response, query_filter)
+
+def qid_records_request(query_filter):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = 'data_classification/qid_records'
     http_method = 'GET'
     fields = 'id, qid, name, description, severity, low_level_category_id'
     # query_filter = 'name ilike "%authentication%" '
     params = {'fields': fields, 'filter': query_filter}
     headers = {'range': 'items=0-5'}
+    return endpoint_url, http_method, headers, params
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, params=params,
-                               headers=headers, print_request=options.verbose)
-
+def qid_records_response(response, query_filter):
     # handle response
     if response.code == 200:
         qid_records = json.loads(response.read().decode('utf-8'))
+        cache_lookup('qid_records', query_filter, qid_records)
         # go through the returned list of qid records and print each one
         for qid_record in qid_records:
             logging.debug(qid_record)
@@ -409,8 +1428,12 @@ def get_qid_records(query_filter):
 
 def update_dsm_event_mapping(dsm_event_mapping_id, fields_to_update):
 
+    # send the request
+    response = client.call_api(*update_dsm_event_mapping_request(dsm_event_mapping_id, fields_to_update), print_request=options.verbose)
+    return update_dsm_event_mapping_response(response, dsm_event_mapping_id)
+
+def update_dsm_event_mapping_request(dsm_event_mapping_id, fields_to_update):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = ('data_classification/dsm_event_mappings' + '/' + str(dsm_event_mapping_id))
     http_method = 'POST'
     '''
@@ -420,15 +1443,15 @@ def update_dsm_event_mapping(dsm_event_mapping_id, fields_to_update):
     '''
     data = json.dumps(fields_to_update).encode('utf-8')
     headers = {'Content-type': 'application/json'}
+    return endpoint_url, http_method, headers, [], data
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, data=data,
-                               headers=headers, print_request=options.verbose)
-
+def update_dsm_event_mapping_response(response, dsm_event_mapping_id):
     # check response and handle any error
     if response.code == 200:
         updated_dsm_event_mapping = json.loads(response.read().decode('utf-8'))
         logging.info(json.dumps(updated_dsm_event_mapping, indent=4))
+        if mapping_index is not None:
+            mapping_index.add(updated_dsm_event_mapping)
         updated_dsm_event_mapping.update({"mapping_result": "UPDATED"})
         return updated_dsm_event_mapping
     else:
@@ -442,22 +1465,26 @@ def update_dsm_event_mapping(dsm_event_mapping_id, fields_to_update):
 # function helps creating a new dsm event mapping
 def create_dsm_event_mapping(dsm_event_mapping):
 
+    # send the request
+    response = client.call_api(*create_dsm_event_mapping_request(dsm_event_mapping), print_request=options.verbose)
+    return create_dsm_event_mapping_response(response)
+
+def create_dsm_event_mapping_request(dsm_event_mapping):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = 'data_classification/dsm_event_mappings'
     http_method = 'POST'
     data = json.dumps(dsm_event_mapping).encode('utf-8')
     headers = {'Content-type': 'application/json'}
+    return endpoint_url, http_method, headers, [], data
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, data=data,
-                               headers=headers, print_request=options.verbose)
-
+def create_dsm_event_mapping_response(response):
     # check response and handle any error
     if response.code == 201:
         dsm_event_mapping = json.loads(response.read().decode('utf-8'))
         logging.info('A new dsm event mapping is created. ID: ' + str(dsm_event_mapping["id"]))
         logging.debug(json.dumps(dsm_event_mapping, indent=4))
+        if mapping_index is not None:
+            mapping_index.add(dsm_event_mapping)
         dsm_event_mapping.update({"mapping_result": "CREATED"})
         return dsm_event_mapping
     else:
@@ -469,8 +1496,12 @@ def create_dsm_event_mapping(dsm_event_mapping):
 
 def update_qid_record(qid_record_id, fields_to_update):
 
+    # send the request
+    response = client.call_api(*update_qid_record_request(qid_record_id, fields_to_update), print_request=options.verbose)
+    return update_qid_record_response(response, qid_record_id)
+
+def update_qid_record_request(qid_record_id, fields_to_update):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = ('data_classification/qid_records' + '/' + str(qid_record_id))
     http_method = 'POST'
     '''
@@ -480,15 +1511,15 @@ def update_qid_record(qid_record_id, fields_to_update):
     '''
     data = json.dumps(fields_to_update).encode('utf-8')
     headers = {'Content-type': 'application/json'}
+    return endpoint_url, http_method, headers, [], data
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, data=data,
-                               headers=headers, print_request=options.verbose)
-
+def update_qid_record_response(response, qid_record_id):
     # check response and handle any error
     if response.code == 200:
         updated_qid_record = json.loads(response.read().decode('utf-8'))
         logging.info(json.dumps(updated_qid_record, indent=4))
+        if qid_record_index is not None:
+            qid_record_index.add(updated_qid_record)
         updated_qid_record.update({"qid_result": "UPDATED"})
         return updated_qid_record
     else:
@@ -503,21 +1534,25 @@ def update_qid_record(qid_record_id, fields_to_update):
 # function helps creating qid record needed for dsm event mapping
 def create_qid_record(qid_record):
 
+    # send the request
+    response = client.call_api(*create_qid_record_request(qid_record), print_request=options.verbose)
+    return create_qid_record_response(response)
+
+def create_qid_record_request(qid_record):
     # prepare request
-    client = client_module.RestApiClient(version='15.1')
     endpoint_url = 'data_classification/qid_records'
     http_method = 'POST'
     data = json.dumps(qid_record).encode('utf-8')
     headers = {'Content-type': 'application/json'}
+    return endpoint_url, http_method, headers, [], data
 
-    # send the request
-    response = client.call_api(endpoint_url, http_method, data=data,
-                               headers=headers, print_request=options.verbose)
-
+def create_qid_record_response(response):
     # check response and handle any error
     if response.code == 201:
         qid_record = json.loads(response.read().decode('utf-8'))
         logging.info('A new qid record is created. ID: ' + str(qid_record["id"]))
+        if qid_record_index is not None:
+            qid_record_index.add(qid_record)
         qid_record.update({"qid_result": "CREATED"})
         return qid_record
     else:
@@ -528,6 +1563,188 @@ def create_qid_record(qid_record):
         return {"qid_result": "FAILED_CREATE", "qid_result_msg": json.loads(response_txt)['description']}
 
 
+# asyncio engine: the same steps as the functions above, but the REST API requests are
+# sent with async_client so many lines can wait for the console at the same time on a single thread
+
+async def async_handle_csv_lines(csv_reader, concurrency, handle_result):
+    # at most "concurrency" lines are processed at the same time, results are handled in input order
+    pending_lines = collections.deque()
+    previous_lines = {} # last pending line of each event, so lines of the same event run in input order
+    try:
+        for csv_line in csv_reader:
+            key = input_mapping_key(csv_line)
+            task = asyncio.ensure_future(async_handle_csv_line_after(csv_line, previous_lines.get(key)))
+            previous_lines[key] = task
+            pending_lines.append((key, task))
+            if len(pending_lines) >= concurrency:
+                handle_result(await async_pending_line_result(pending_lines, previous_lines))
+        while pending_lines:
+            handle_result(await async_pending_line_result(pending_lines, previous_lines))
+    finally:
+        # the connections belong to this event loop
+        async_client.close()
+
+async def async_handle_csv_line_after(csv_line, previous_line):
+    if previous_line is not None:
+        await asyncio.wait([previous_line])
+    return await async_handle_csv_line(csv_line)
+
+async def async_pending_line_result(pending_lines, previous_lines):
+    key, task = pending_lines.popleft()
+    result = await task
+    if previous_lines.get(key) is task:
+        del previous_lines[key]
+    return result
+
+async def async_handle_csv_line(csv_line):
+    line_hash, completed_row = journal_lookup(csv_line)
+    if completed_row is not None: # already completed by a previous run
+        return completed_row
+
+    logging.info(csv_line)
+    try:
+        valid_csv_line = await async_validate_csv_line(csv_line) # validate content
+    except (ValueError, LookupError) as error: # if controlled validation or lookup error (log to console and skip this line)
+        result = error_result(csv_line, error)
+    else: # process line
+        async with async_mapping_key_lock(valid_csv_line): # lines for the same event are never processed at the same time
+            result = await async_process_csv_line(valid_csv_line)
+
+    journal_record(line_hash, result)
+    return result
+
+@contextlib.asynccontextmanager
+async def async_mapping_key_lock(csv_line):
+    key = (str(csv_line["Log Source Type ID"]), csv_line["Event ID"], csv_line["Event Category"])
+    key_lock = async_mapping_key_locks.setdefault(key, [asyncio.Lock(), 0])
+    key_lock[1] += 1
+    try:
+        async with key_lock[0]:
+            yield
+    finally:
+        key_lock[1] -= 1
+        if key_lock[1] == 0:
+            del async_mapping_key_locks[key]
+
+@timed_phase('validate')
+async def async_validate_csv_line(csv_line):
+
+    check_csv_line(csv_line)
+
+    # Get Log Source Type ID
+    if not csv_line_contains_value_for(csv_line,"Log Source Type ID"):
+        csv_line["Log Source Type ID"] = await async_get_log_source_type_id(csv_line["Log Source Type"])
+
+    # Get Low Level Category ID
+    if not csv_line_contains_value_for(csv_line,"Low Level Category ID"):
+        csv_line["Low Level Category ID"] = await async_get_low_level_category_id(csv_line["Low Level Category"], csv_line["High Level Category"])
+
+    # get severity
+    if not csv_line_contains_value_for(csv_line,"Severity"):
+        csv_line["Severity"] = await async_get_default_severity(csv_line["Low Level Category ID"])
+
+    # get QID Descrition
+    if not csv_line_contains_value_for(csv_line,"QID Description"):
+        csv_line["QID Description"] = ""
+
+    return csv_line
+
+async def async_get_log_source_type_id(log_source_type):
+    if catalog is not None:
+        return get_log_source_type_id(log_source_type)
+    cached_records = cached_lookup('log_source_type', log_source_type)
+    if cached_records is not None:
+        return log_source_type_id_from_records(cached_records, log_source_type)
+    response = await async_client.call_api(*log_source_type_id_request(log_source_type), print_request=options.verbose)
+    return log_source_type_id_response(response, log_source_type)
+
+async def async_get_default_severity(low_level_category_id):
+    # looked up once per category, like get_default_severity
+    if low_level_category_id not in async_default_severities:
+        if catalog is not None:
+            async_default_severities[low_level_category_id] = default_severity_from_catalog(low_level_category_id)
+        else:
+            cached_record = cached_lookup('default_severity', low_level_category_id)
+            if cached_record is not None:
+                async_default_severities[low_level_category_id] = default_severity_from_record(cached_record, low_level_category_id)
+            else:
+                response = await async_client.call_api(*default_severity_request(low_level_category_id), print_request=options.verbose)
+                async_default_severities[low_level_category_id] = default_severity_response(response, low_level_category_id)
+    return async_default_severities[low_level_category_id]
+
+async def async_get_low_level_category_id(low_level_category, high_level_category):
+    if category_resolver is not None or catalog is not None:
+        return low_level_category_id_offline(low_level_category, high_level_category)
+    cached_records = cached_lookup('low_level_category', low_level_category)
+    if cached_records is not None:
+        return low_level_category_id_from_records(cached_records, low_level_category)
+    response = await async_client.call_api(*low_level_category_id_request(low_level_category), print_request=options.verbose)
+    return low_level_category_id_response(response, low_level_category)
+
+@timed_phase('process')
+async def async_process_csv_line(csv_line):
+
+    # create a new qid record first to be mapped to the dsm event
+    new_qid_record = new_qid_record_from_csv_line(csv_line)
+
+    dsm_event_mapping = await async_get_dsm_event_mapping(csv_line)
+
+    qid_record = await async_run_writes(qid_record_writes(csv_line, new_qid_record, dsm_event_mapping))
+    return await async_run_writes(dsm_event_mapping_writes(csv_line, qid_record, dsm_event_mapping))
+
+async def async_run_writes(writes):
+    try:
+        function, arguments = next(writes)
+        while True:
+            function, arguments = writes.send(await async_writes[function](*arguments))
+    except StopIteration as stop:
+        return stop.value
+
+async def async_get_dsm_event_mapping(csv_line):
+    if mapping_index is not None and mapping_index.is_known(csv_line["Log Source Type ID"], csv_line["Event ID"], csv_line["Event Category"]):
+        return get_dsm_event_mapping(csv_line)
+    response = await async_client.call_api(*dsm_event_mapping_request(csv_line), print_request=options.verbose)
+    return dsm_event_mapping_response(response)
+
+async def async_get_existing_qid_records(qid):
+    # use the QID records prefetched in batches if available
+    if qid_record_index.has_qid(qid):
+        return qid_record_index.find_by_qid(qid)
+    return await async_get_qid_records('qid = ' + str(qid))
+
+async def async_get_qid_records(query_filter):
+    cached_records = cached_lookup('qid_records', query_filter)
+    if cached_records is not None:
+        return cached_records
+    response = await async_client.call_api(*qid_records_request(query_filter), print_request=options.verbose)
+    return qid_records_response(response, query_filter)
+
+async def async_update_dsm_event_mapping(dsm_event_mapping_id, fields_to_update):
+    response = await async_client.call_api(*update_dsm_event_mapping_request(dsm_event_mapping_id, fields_to_update), print_request=options.verbose)
+    return update_dsm_event_mapping_response(response, dsm_event_mapping_id)
+
+async def async_create_dsm_event_mapping(dsm_event_mapping):
+    response = await async_client.call_api(*create_dsm_event_mapping_request(dsm_event_mapping), print_request=options.verbose)
+    return create_dsm_event_mapping_response(response)
+
+async def async_update_qid_record(qid_record_id, fields_to_update):
+    response = await async_client.call_api(*update_qid_record_request(qid_record_id, fields_to_update), print_request=options.verbose)
+    return update_qid_record_response(response, qid_record_id)
+
+async def async_create_qid_record(qid_record):
+    response = await async_client.call_api(*create_qid_record_request(qid_record), print_request=options.verbose)
+    return create_qid_record_response(response)
+
+# the async version of each function yielded by the writes of a line
+async_writes = {
+    get_existing_qid_records: async_get_existing_qid_records,
+    update_qid_record: async_update_qid_record,
+    create_qid_record: async_create_qid_record,
+    update_dsm_event_mapping: async_update_dsm_event_mapping,
+    create_dsm_event_mapping: async_create_dsm_event_mapping
+}
+
+
 def parse_arguments(arguments):
     """
     Parse the arguments passed to the script.
@@ -570,6 +1787,195 @@ def parse_arguments(arguments):
                       help='Enable verbose messages',
                       )
 
+    parser.add_option('-c',
+                      '--preload_catalog',
+                      dest='preload_catalog',
+                      action='store_true',
+                      default=False,
+                      help='Load log source types and categories once at startup instead of looking them up for each line',
+                      )
+
+    parser.add_option('-f',
+                      '--categories_file',
+                      dest='categories_file',
+                      action='store',
+                      help='Resolve Low Level Category IDs offline from this file (qidmap_cli.sh -l output, e.g. categories.txt)',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('-p',
+                      '--prefetch_mappings',
+                      dest='prefetch_mappings',
+                      action='store_true',
+                      default=False,
+                      help='Read all the existing mappings of the log source types in the input file at once instead of looking them up for each line',
+                      )
+
+    parser.add_option('-w',
+                      '--workers',
+                      dest='workers',
+                      action='store',
+                      type='int',
+                      default=1,
+                      metavar='N',
+                      help='Number of lines processed at the same time (default 1)',
+                      )
+
+    parser.add_option('-a',
+                      '--async',
+                      dest='async_engine',
+                      action='store_true',
+                      default=False,
+                      help='Process the lines with the asyncio engine, --workers sets the number of lines in flight',
+                      )
+
+    parser.add_option('--pipeline',
+                      dest='pipeline_workers',
+                      action='store',
+                      help='Process the lines in stages connected by bounded queues (resolve, QID record write, mapping write) with WORKERS threads each: one number for all the stages or three separated by commas, e.g. 4,8,8',
+                      metavar='WORKERS'
+                      )
+
+    parser.add_option('-j',
+                      '--journal',
+                      dest='journal_file',
+                      action='store',
+                      help='Record each processed line in this journal file (default with --resume: OUTPUT_FILE.journal)',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('-r',
+                      '--resume',
+                      dest='resume',
+                      action='store_true',
+                      default=False,
+                      help='Skip the lines already completed with identical content according to the journal (not with --coalesce, --plan or --apply)',
+                      )
+
+    parser.add_option('--coalesce',
+                      dest='coalesce',
+                      action='store_true',
+                      default=False,
+                      help='Read the whole file first, process repeated events once and create or update each QID record once',
+                      )
+
+    parser.add_option('--prevalidate',
+                      dest='prevalidate',
+                      action='store_true',
+                      default=False,
+                      help='Check every line of the file before any request and stop if a line has an error, the errors are written to OUTPUT_FILE.errors.csv',
+                      )
+
+    parser.add_option('--plan',
+                      dest='plan_file',
+                      action='store',
+                      help='Do not change anything, write the actions needed for each line to this plan file',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('--apply',
+                      dest='apply_file',
+                      action='store',
+                      help='Execute the actions of this plan file (instead of reading an input file)',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('--read_rate',
+                      dest='read_rate',
+                      action='store',
+                      type='float',
+                      metavar='N',
+                      help='Maximum number of read requests per second (default no limit)',
+                      )
+
+    parser.add_option('--write_rate',
+                      dest='write_rate',
+                      action='store',
+                      type='float',
+                      metavar='N',
+                      help='Maximum number of write requests per second (default no limit)',
+                      )
+
+    parser.add_option('--max_retries',
+                      dest='max_retries',
+                      action='store',
+                      type='int',
+                      default=5,
+                      metavar='N',
+                      help='Number of times a request throttled by the console (429 or 503) is sent again (default 5)',
+                      )
+
+    parser.add_option('--config_file',
+                      dest='config_file',
+                      action='store',
+                      help='Read the console settings from this file instead of config.ini',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('--config_section',
+                      dest='config_section',
+                      action='store',
+                      help='Use the console settings of this section of the configuration file (default DEFAULT)',
+                      metavar='SECTION'
+                      )
+
+    parser.add_option('--targets',
+                      dest='targets',
+                      action='store',
+                      help='Comma separated configuration sections: check the file once, then import it into all these consoles at the same time (one output file per console, and a combined summary in OUTPUT_FILE)',
+                      metavar='SECTIONS'
+                      )
+
+    parser.add_option('--baseline',
+                      dest='baseline_file',
+                      action='store',
+                      help='Take the existing custom mappings and their QID records from this export (customizations.howto) instead of reading them from the console, only the events missing from it are read in batches (with --targets: FILE.SECTION.csv for each console)',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('--verify_with_ariel',
+                      dest='verify_hours',
+                      action='store',
+                      type='int',
+                      help='After the import, count the events of the created or remapped QIDs over the last HOURS hours with one Ariel search, and add the counts to the output file',
+                      metavar='HOURS'
+                      )
+
+    parser.add_option('--prometheus_file',
+                      dest='prometheus_file',
+                      action='store',
+                      help='Also write the request metrics of the run to this Prometheus textfile',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('--profile',
+                      dest='profile_file',
+                      action='store',
+                      help='Profile the run (cProfile, tracemalloc and time per phase), write the pstats to this file and print a summary',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('--cache_file',
+                      dest='cache_file',
+                      action='store',
+                      help='Keep the results of the log source type, category, severity and QID lookups in this SQLite file for the next runs against the same console',
+                      metavar='FILE'
+                      )
+
+    parser.add_option('--refresh_cache',
+                      dest='refresh_cache',
+                      action='store_true',
+                      default=False,
+                      help='Ignore the cached lookup results and replace them',
+                      )
+
+    parser.add_option('--serve',
+                      dest='serve_socket',
+                      action='store',
+                      help='Run as a service on this UNIX socket, keeping the connections, catalog and caches warm between the jobs submitted with SubmitJob.py',
+                      metavar='SOCKET'
+                      )
+
     parser.add_option('-d',
                       '--debug',
                       dest='debug',
@@ -587,16 +1993,48 @@ def parse_arguments(arguments):
 
     (options, args) = parser.parse_args()
 
-    if not options.input_file:
+    # in service mode the input and output files are given by each job
+    if not options.input_file and not options.apply_file and not options.serve_socket:
         print ("No input CSV file specified.")
         parser.print_help()
         sys.exit(-1)
 
-    if not options.output_file:
+    if not options.output_file and not options.plan_file and not options.serve_socket:
         print ("No output CSV file specified.")
         parser.print_help()
         sys.exit(-1)
 
+    if options.targets and (options.plan_file or options.apply_file or options.serve_socket):
+        print ("--targets can not be used with --plan, --apply or --serve.")
+        parser.print_help()
+        sys.exit(-1)
+
+    if options.pipeline_workers:
+        try:
+            stage_workers = [int(workers) for workers in options.pipeline_workers.split(',')]
+        except ValueError:
+            stage_workers = []
+        if len(stage_workers) == 1:
+            stage_workers *= 3
+        if len(stage_workers) != 3 or min(stage_workers) < 1:
+            print ("--pipeline takes one or three numbers of workers.")
+            parser.print_help()
+            sys.exit(-1)
+        options.pipeline_workers = stage_workers
+
+    if options.pipeline_workers and (options.async_engine or options.coalesce or options.plan_file or options.apply_file):
+        print ("--pipeline can not be used with --async, --coalesce, --plan or --apply.")
+        parser.print_help()
+        sys.exit(-1)
+
+    if (options.journal_file or options.resume) and (options.coalesce or options.plan_file or options.apply_file):
+        print ("-j and --resume can not be used with --coalesce, --plan or --apply, their lines are not recorded in the journal.")
+        parser.print_help()
+        sys.exit(-1)
+
+    if options.resume and not options.journal_file:
+        options.journal_file = options.output_file + '.journal'
+
     if(options.debug == 'DEBUG'):
         options.debug=logging.DEBUG
     elif (options.debug == 'INFO'):
@@ -612,10 +2050,338 @@ def parse_arguments(arguments):
 
     return options
 
+# rate limits and retries of the requests of a client, from the command line options
+def new_request_throttle(max_concurrency):
+    return throttle_module.RequestThrottle(read_rate=options.read_rate, write_rate=options.write_rate,
+                                           max_concurrency=max_concurrency, max_retries=options.max_retries)
+
+# end of run performance report, written next to the output (or plan) file
+def write_metrics_report(output_file, rows):
+    metrics.write_report(output_file + '.metrics.json', rows)
+    if options.prometheus_file:
+        metrics.write_prometheus_file(options.prometheus_file, rows)
+    api_calls = metrics.get_api_calls()
+    logging.info(str(api_calls) + ' REST API calls for ' + str(rows) + ' lines, report: ' + output_file + '.metrics.json')
+    print(str(api_calls) + ' REST API calls for ' + str(rows) + ' lines' + (' (' + '{0:.2f}'.format(api_calls / rows) + ' per line)' if rows else ''))
+
+def serve(socket_path):
+    # service mode: run the jobs submitted with SubmitJob.py until the process is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = job_service_module.JobServer(socket_path, run_job)
+    logging.info('Serving import jobs on ' + socket_path)
+    print('Serving import jobs on ' + socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def run_job(job):
+    # one job of the service: the client, catalog and caches are kept, the state of a run is new
+    global metrics, mapping_index, qid_record_index, journal, result_writer
+    metrics = metrics_module.RequestMetrics()
+    client.metrics = metrics
+    if async_client is not None:
+        async_client.metrics = metrics
+    if baseline is None:
+        mapping_index = mapping_index_module.EventMappingIndex() if options.prefetch_mappings else None
+        qid_record_index = qid_record_index_module.QidRecordIndex()
+    # otherwise the snapshot indexes are kept, they are updated by the writes of the jobs
+    # the default severities are looked up again through the lookup cache, so they follow its TTL
+    get_default_severity.cache_clear()
+    async_default_severities.clear()
+    journal = None
+    if not os.path.isfile(job['input_file']):
+        raise ValueError('Input CSV file not found: ' + job['input_file'])
+    if options.prevalidate and prevalidate(job['input_file'], job['output_file'] + '.errors.csv'):
+        raise ValueError('Lines with errors, see ' + job['output_file'] + '.errors.csv')
+    result_writer = ResultWriter(job['output_file'])
+    try:
+        if job.get('coalesce', options.coalesce):
+            coalesce(job['input_file'])
+        else:
+            main(job['input_file'])
+    finally:
+        result_writer.close()
+        write_metrics_report(job['output_file'], result_writer.rows)
+    return {'rows': result_writer.rows, 'api_calls': metrics.get_api_calls()}
+
+def run_targets(sections):
+    # fan-out mode (--targets): the lines are checked once, then the valid ones are imported into each console
+    # by its own process (with its own connection pool and caches, the ids can differ between consoles)
+    config_error = target_sections_error(sections)
+    if config_error:
+        print(config_error)
+        return 1
+
+    with open(options.input_file, mode='r') as input_file_handler:
+        csv_reader = csv.DictReader(input_file_handler)
+        fieldnames = csv_reader.fieldnames or []
+        csv_lines = compact_csv_lines(fieldnames, csv_reader)
+    errors = {} # line index -> error of the lines failing the checks
+    for i, csv_line in enumerate(csv_lines):
+        try:
+            check_csv_line(csv_line)
+        except ValueError as error:
+            errors[i] = str(error)
+    print(str(len(csv_lines)) + ' lines checked, ' + str(len(errors)) + ' with errors, importing the others into ' + ', '.join(sections))
+
+    output_dir = os.path.dirname(os.path.abspath(options.output_file))
+    with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', newline='', suffix='.csv', dir=output_dir, delete=False) as valid_file_handle:
+        valid_file = valid_file_handle.name
+        writer = csv.DictWriter(valid_file_handle, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(csv_line for i, csv_line in enumerate(csv_lines) if i not in errors)
+    try:
+        target_runs = [start_target_run(section, valid_file) for section in sections]
+        exit_codes = []
+        for target_process, stdout_file in target_runs:
+            exit_codes.append(target_process.wait())
+            stdout_file.close()
+    finally:
+        os.remove(valid_file)
+
+    summary = write_targets_summary(options.output_file, sections, fieldnames, csv_lines, errors)
+    print('')
+    print('{0:<20}{1:>8}{2:>10}{3:>10}{4:>10}{5:>10}{6:>12}'.format('Target', 'Exit', 'CREATED', 'UPDATED', 'SKIPPED', 'ERROR', 'API calls'))
+    for section, exit_code in zip(sections, exit_codes):
+        counts = summary[section]
+        print('{0:<20}{1:>8}{2:>10}{3:>10}{4:>10}{5:>10}{6:>12}'.format(section, exit_code, counts['CREATED'], counts['UPDATED'], counts['SKIPPED'], counts['ERROR'], target_api_calls(section)))
+    print('Combined summary written to ' + options.output_file)
+    return 0 if all(exit_code == 0 for exit_code in exit_codes) else 1
+
+def target_sections_error(sections):
+    # every target needs its console settings: the script can not prompt for them from several processes
+    config_file = os.path.abspath(options.config_file) if options.config_file else os.path.join(os.path.dirname(os.path.realpath(__file__)), 'config.ini')
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    for section in sections:
+        if section != 'DEFAULT' and not config.has_section(section):
+            return 'No section ' + section + ' in ' + config_file
+        if 'server_ip' not in config[section]:
+            return 'No server_ip in section ' + section + ' of ' + config_file
+    return None
+
+def target_file(file_name, section):
+    # the file of one target: output.csv -> output.SECTION.csv
+    root, extension = os.path.splitext(file_name)
+    return root + '.' + section + extension
+
+def start_target_run(section, input_file):
+    # the options given later on the command line win, so the target run gets the same options
+    # with its own input, output, log and configuration section
+    arguments = [sys.executable, os.path.realpath(__file__)] + sys.argv[1:] + [
+        '--targets=', '--config_section=' + section, '-i', input_file,
+        '-o', target_file(options.output_file, section), '-l', target_file(options.log_file, section)]
+    for option, file_name in (('-j', options.journal_file), ('--prometheus_file', options.prometheus_file),
+                              ('--profile', options.profile_file), ('--baseline', options.baseline_file)):
+        if file_name:
+            arguments += [option, target_file(file_name, section)]
+    # the console messages of each target are kept apart
+    stdout_file = open(target_file(options.output_file, section) + '.stdout', 'w')
+    logging.info('Starting the import into ' + section + ': ' + ' '.join(arguments))
+    return subprocess.Popen(arguments, stdout=stdout_file, stderr=subprocess.STDOUT), stdout_file
+
+def write_targets_summary(output_file, sections, fieldnames, csv_lines, errors):
+    # one line per input line with the results of each target, returns the number of lines per result and target
+    target_columns = ['QID Record ID', 'Mapping Result', 'Mapping Result Msg']
+    summary = dict((section, collections.Counter()) for section in sections)
+    target_rows = {}
+    for section in sections:
+        try:
+            with open(target_file(output_file, section), mode='r', encoding='utf-8-sig', newline='') as target_output:
+                target_rows[section] = [[target_row.get(column, '') for column in target_columns] for target_row in csv.DictReader(target_output)]
+        except FileNotFoundError:
+            target_rows[section] = []
+    with open(output_file, 'w', encoding='utf-8-sig', newline="") as output_file_handle:
+        writer = csv.writer(output_file_handle, dialect='excel', delimiter=',')
+        writer.writerow(['Line'] + fieldnames + [section + ' ' + column for section in sections for column in target_columns])
+        row_indexes = dict((section, 0) for section in sections)
+        for i, csv_line in enumerate(csv_lines):
+            row = [i + 2] + [csv_line.get(field) for field in fieldnames]
+            for section in sections:
+                if i in errors:
+                    values = ['', 'ERROR', errors[i]]
+                elif row_indexes[section] < len(target_rows[section]):
+                    values = target_rows[section][row_indexes[section]]
+                    row_indexes[section] += 1
+                else:
+                    values = ['', 'ERROR', 'Not imported, see ' + target_file(output_file, section) + '.stdout']
+                summary[section][values[1]] += 1
+                row += values
+            writer.writerow(row)
+    return summary
+
+def target_api_calls(section):
+    # from the metrics report of the target run
+    try:
+        with open(target_file(options.output_file, section) + '.metrics.json', mode='r', encoding='utf-8') as report:
+            return json.load(report)['api_calls']
+    except (OSError, ValueError, KeyError):
+        return ''
+
+def verify_with_ariel(output_file, hours):
+    # the QIDs created or remapped by the run, with the log source types they are mapped for
+    verified_qids = set()
+    with open(output_file, mode='r', encoding='utf-8-sig', newline='') as output_file_handle:
+        for row in csv.DictReader(output_file_handle):
+            if is_verified_row(row):
+                verified_qids.add(int(row['QID']))
+    if not verified_qids:
+        print('No created or remapped QID to verify')
+        return
+
+    # one aggregated search for all the QIDs
+    ariel_client = ariel_client_module.APIClient(config_section=options.config_section or 'DEFAULT', config=config,
+                                                 throttle=new_request_throttle(1), metrics=metrics)
+    try:
+        event_counts = event_counter_module.QidEventCounter(ariel_client, hours=hours).count_events(verified_qids)
+    finally:
+        ariel_client.close()
+
+    # add the event count of each verified line to the output file
+    verified_rows = 0
+    rows_with_events = 0
+    annotated_file = output_file + '.tmp'
+    with open(output_file, mode='r', encoding='utf-8-sig', newline='') as output_file_handle, \
+            open(annotated_file, 'w', encoding='utf-8-sig', newline="") as annotated_file_handle:
+        reader = csv.reader(output_file_handle)
+        writer = csv.writer(annotated_file_handle, dialect='excel', delimiter=',')
+        columns = next(reader)
+        writer.writerow(columns + ['Ariel Event Count'])
+        for values in reader:
+            row = dict(zip(columns, values))
+            event_count = ''
+            if is_verified_row(row):
+                event_count = event_counts.get((int(row['QID']), int(row['Log Source Type ID'])), 0)
+                verified_rows += 1
+                rows_with_events += 1 if event_count else 0
+            writer.writerow(values + [event_count])
+    os.replace(annotated_file, output_file)
+
+    msg = (str(rows_with_events) + ' of ' + str(verified_rows) + ' created or remapped lines had events in the last ' +
+           str(hours) + ' hours (' + str(len(verified_qids)) + ' QIDs, one Ariel search)')
+    logging.info(msg)
+    print(msg)
+
+def is_verified_row(row):
+    return bool(row.get('QID')) and (row.get('QID Result') == 'CREATED' or row.get('Mapping Result') in ('CREATED', 'UPDATED'))
+
+def load_baseline(baseline_file):
+    # a snapshot that no longer matches the console would create, update or skip the wrong records
+    baseline = baseline_module.BaselineSnapshot(baseline_file)
+    differences = baseline.spot_check(client, print_request=options.verbose)
+    logging.info('Baseline ' + baseline_file + ': ' + str(len(baseline)) + ' mappings, ' + str(baseline.skipped_rows) + ' rows without ids skipped')
+    if differences:
+        for difference in differences:
+            logging.error(difference)
+        print('The baseline ' + baseline_file + ' is out of date, export it again:\n' + '\n'.join(differences))
+        client.close()
+        sys.exit(1)
+    return baseline
+
+def stop_profiler():
+    # the time spent waiting for the console comes from the request metrics
+    if profiler is None:
+        return
+    profiler.stop()
+    request_phases = [('REST ' + method + ' requests', calls, seconds)
+                      for method, (calls, seconds) in sorted(metrics.get_latency_by_method().items())]
+    summary = profiler.get_summary(request_phases)
+    logging.info(summary)
+    print(summary)
+
 
 if __name__ == '__main__':
-    results=[]
     options = parse_arguments(sys.argv[1:])
     logging.basicConfig(filename=options.log_file,level=options.debug, format='%(asctime)s - %(levelname)s - %(message)s')
-    main(options.input_file)
-    write_file(options.output_file,results)
+    if options.prevalidate and options.input_file:
+        # nothing is sent to the console if a line of the file has an error
+        if prevalidate(options.input_file, (options.output_file or options.plan_file) + '.errors.csv'):
+            print('Nothing imported, fix the lines with errors first')
+            sys.exit(1)
+    if options.targets:
+        sys.exit(run_targets([section.strip() for section in options.targets.split(',') if section.strip()]))
+    if options.profile_file:
+        profiler = profiler_module.RunProfiler(options.profile_file)
+        profiler.start()
+    # a single client (and its pool of keep-alive connections) is shared by all the REST helpers
+    config = None
+    if options.config_file or options.config_section:
+        config_file = os.path.abspath(options.config_file) if options.config_file else 'config.ini'
+        config = config_module.Config(config_file=config_file, config_section=options.config_section or 'DEFAULT')
+    # the requests of all the clients are counted together
+    metrics = metrics_module.RequestMetrics()
+    max_connections = max(10, options.workers, sum(options.pipeline_workers or []))
+    client = client_module.RestApiClient(version='15.1', config=config, max_connections=max_connections, throttle=new_request_throttle(max_connections), metrics=metrics)
+    lookup_cache = None
+    if options.cache_file:
+        lookup_cache = lookup_cache_module.LookupCache(options.cache_file, client.get_server_ip(), refresh=options.refresh_cache)
+    elif options.serve_socket:
+        # the lookups of a job are reused by the next jobs of the service
+        lookup_cache = lookup_cache_module.LookupCache(':memory:', client.get_server_ip())
+    catalog = None
+    if options.preload_catalog:
+        catalog = catalog_module.ReferenceCatalog()
+        with profiler.phase_timers.phase('load catalog') if profiler is not None else contextlib.nullcontext():
+            catalog.load(client, print_request=options.verbose)
+    category_resolver = None
+    if options.categories_file:
+        category_resolver = category_resolver_module.CategoryResolver(options.categories_file)
+    async_client = None
+    if options.async_engine:
+        async_client = async_client_module.AsyncRestApiClient(version='15.1', config=config, max_connections_per_host=options.workers, throttle=new_request_throttle(options.workers), metrics=metrics)
+    baseline = None
+    if options.baseline_file:
+        baseline = load_baseline(options.baseline_file)
+    mapping_index = None
+    if options.prefetch_mappings or options.plan_file or baseline is not None:
+        mapping_index = mapping_index_module.EventMappingIndex()
+    # QID records of the QIDs used by the lines, and in plan mode of the log source types of the file
+    qid_record_index = qid_record_index_module.QidRecordIndex()
+    if baseline is not None:
+        # the existing mappings and QID records come from the snapshot instead of the console
+        baseline.fill(mapping_index, qid_record_index)
+    if options.serve_socket:
+        try:
+            serve(options.serve_socket)
+        finally:
+            if lookup_cache is not None:
+                lookup_cache.close()
+            client.close()
+            stop_profiler()
+        sys.exit(0)
+    if options.plan_file:
+        # plan mode, nothing is changed and no output file is written
+        rows = plan(options.input_file, options.plan_file)
+        write_metrics_report(options.plan_file, rows)
+        client.close()
+        if lookup_cache is not None:
+            lookup_cache.close()
+        stop_profiler()
+        sys.exit(0)
+
+    journal = None
+    if options.journal_file:
+        journal = journal_module.CheckpointJournal(options.journal_file, resume=options.resume)
+    result_writer = ResultWriter(options.output_file)
+    try:
+        if options.apply_file:
+            apply_plan(options.apply_file)
+        elif options.coalesce:
+            coalesce(options.input_file)
+        else:
+            main(options.input_file)
+        if options.verify_hours:
+            result_writer.close()
+            verify_with_ariel(options.output_file, options.verify_hours)
+    finally:
+        result_writer.close()
+        if journal is not None:
+            journal.close()
+        if lookup_cache is not None:
+            lookup_cache.close()
+        client.close()
+        write_metrics_report(options.output_file, result_writer.rows)
+        stop_profiler()
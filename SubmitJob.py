@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+'''
+Description:
+    Submits an import job to MapEventsFromCSV.py running as a service
+    (--serve), and waits for the result.
+
+    The service keeps its REST API connections, catalog and caches warm
+    between jobs, so a small import does not pay for the startup of the
+    script. This client only loads the standard library and the job protocol.
+    The input and output files are read and written by the service, the
+    output file is the result CSV of the import.
+
+Usage:
+    Usage: SubmitJob.py [options]
+
+    Options:
+      -h, --help            show this help message and exit
+      -s SOCKET, --socket=SOCKET
+                            UNIX socket of the service.
+      -i FILE, --input_file=FILE
+                            Input CSV file name.
+      -o FILE, --output_file=FILE
+                            Output CSV file name.
+      --coalesce            Read the whole file first, process repeated events
+                            once and create or update each QID record once
+                            (default: as the service was started)
+      -t SECONDS, --timeout=SECONDS
+                            Give up if the job is not done in this time
+                            (default no limit)
+'''
+
+import optparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             'modules'))
+import JobService
+
+
+def parse_arguments(arguments):
+
+    parser = optparse.OptionParser()
+    parser.add_option('-s', '--socket', dest='socket_path', action='store',
+                      metavar='SOCKET', help='UNIX socket of the service.')
+    parser.add_option('-i', '--input_file', dest='input_file',
+                      action='store', metavar='FILE',
+                      help='Input CSV file name.')
+    parser.add_option('-o', '--output_file', dest='output_file',
+                      action='store', metavar='FILE',
+                      help='Output CSV file name.')
+    parser.add_option('--coalesce', dest='coalesce', action='store_true',
+                      help='Read the whole file first, process repeated '
+                           'events once and create or update each QID record '
+                           'once (default: as the service was started)')
+    parser.add_option('-t', '--timeout', dest='timeout', action='store',
+                      type='float', metavar='SECONDS',
+                      help='Give up if the job is not done in this time '
+                           '(default no limit)')
+
+    (options, args) = parser.parse_args(arguments)
+    if not options.socket_path:
+        parser.error('No service socket specified.')
+    if not options.input_file:
+        parser.error('No input CSV file specified.')
+    if not options.output_file:
+        parser.error('No output CSV file specified.')
+    return options
+
+
+if __name__ == '__main__':
+    options = parse_arguments(sys.argv[1:])
+
+    # the service does not run in the working directory of the client
+    job = {'input_file': os.path.abspath(options.input_file),
+           'output_file': os.path.abspath(options.output_file)}
+    if options.coalesce:
+        job['coalesce'] = True
+    try:
+        response = JobService.submit_job(options.socket_path, job,
+                                         timeout=options.timeout)
+    except (OSError, LookupError) as error:
+        print('Failed to submit the job to ' + options.socket_path + ': ' +
+              str(error))
+        sys.exit(1)
+
+    if response['status'] != 'DONE':
+        print('Job failed: ' + response.get('message', ''))
+        sys.exit(1)
+    print(str(response['rows']) + ' lines written to ' +
+          response['output_file'] + ' in ' + str(response['seconds']) +
+          's, ' + str(response['api_calls']) + ' REST API calls')
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+'''
+Description:
+    Generates a synthetic input CSV file for MapEventsFromCSV.py, with the
+    columns of DSMEventMappingTemplate.csv and values known to the mock
+    console of MockQRadarServer.py.
+
+    The lines mix the ways the template can be filled in: log source types by
+    name or by id, low level categories by id or by name and high level
+    category, with or without a severity. A share of the lines repeat the
+    event of a previous line, as exported mappings often do.
+
+Usage:
+    Usage: GenerateEventsCSV.py [options]
+
+    Options:
+      -h, --help            show this help message and exit
+      -n ROWS, --rows=ROWS  Number of lines (default 1000)
+      -o FILE, --output_file=FILE
+                            Output CSV file name.
+      --duplicates=RATE     Share of the lines repeating a previous event
+                            (default 0.05)
+      --seed=SEED           Seed of the random generator (default 1)
+'''
+
+import csv
+import optparse
+import random
+import sys
+
+import MockQRadarServer
+
+
+HEADER_ROW = ['Log Source Type', 'Log Source Type ID', 'Event Category',
+              'Event ID', 'QID', 'QID Name', 'QID Description', 'Severity',
+              'Low Level Category ID', 'Low Level Category',
+              'High Level Category']
+
+EVENT_CATEGORIES = ['Audit', 'Authentication', 'Network', 'System', 'Policy']
+
+
+# Writes rows synthetic lines to output_file.
+def generate_csv(output_file, rows, duplicates=0.05, seed=1):
+
+    generator = random.Random(seed)
+    log_source_types = [
+        log_source_type for log_source_type in
+        MockQRadarServer.get_log_source_types() if log_source_type['custom']]
+    high_level_categories, low_level_categories = \
+        MockQRadarServer.get_categories()
+    high_level_category_names = dict(
+        (high_level_category['id'], high_level_category['name'])
+        for high_level_category in high_level_categories)
+
+    lines = []
+    with open(output_file, mode='w', newline='',
+              encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(HEADER_ROW)
+        for row in range(rows):
+            if lines and generator.random() < duplicates:
+                line = generator.choice(lines)
+            else:
+                line = new_line(generator, row, log_source_types,
+                                low_level_categories,
+                                high_level_category_names)
+                lines.append(line)
+            writer.writerow(line)
+
+
+def new_line(generator, row, log_source_types, low_level_categories,
+             high_level_category_names):
+
+    log_source_type = generator.choice(log_source_types)
+    low_level_category = generator.choice(low_level_categories)
+    event_category = generator.choice(EVENT_CATEGORIES)
+
+    line = dict((column, '') for column in HEADER_ROW)
+    if generator.random() < 0.5:
+        line['Log Source Type'] = log_source_type['name']
+    else:
+        line['Log Source Type ID'] = str(log_source_type['id'])
+    line['Event Category'] = event_category
+    line['Event ID'] = 'EVT-' + str(row)
+    line['QID Name'] = event_category + ' event ' + str(row)
+    line['QID Description'] = 'Synthetic event ' + str(row)
+    if generator.random() < 0.7:
+        line['Severity'] = str(generator.randint(1, 10))
+    if generator.random() < 0.5:
+        line['Low Level Category ID'] = str(low_level_category['id'])
+    else:
+        line['Low Level Category'] = low_level_category['name']
+        line['High Level Category'] = high_level_category_names[
+            low_level_category['high_level_category_id']]
+    return [line[column] for column in HEADER_ROW]
+
+
+def parse_arguments(arguments):
+
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--rows', dest='rows', action='store',
+                      type='int', default=1000, metavar='ROWS',
+                      help='Number of lines (default 1000)')
+    parser.add_option('-o', '--output_file', dest='output_file',
+                      action='store', metavar='FILE',
+                      help='Output CSV file name.')
+    parser.add_option('--duplicates', dest='duplicates', action='store',
+                      type='float', default=0.05, metavar='RATE',
+                      help='Share of the lines repeating a previous event '
+                           '(default 0.05)')
+    parser.add_option('--seed', dest='seed', action='store', type='int',
+                      default=1, metavar='SEED',
+                      help='Seed of the random generator (default 1)')
+
+    (options, args) = parser.parse_args(arguments)
+    if not options.output_file:
+        parser.error('No output CSV file specified.')
+    return options
+
+
+if __name__ == '__main__':
+    options = parse_arguments(sys.argv[1:])
+    generate_csv(options.output_file, options.rows,
+                 duplicates=options.duplicates, seed=options.seed)
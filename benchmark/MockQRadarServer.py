@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+
+'''
+Description:
+    A local stand-in for the QRadar REST API, to benchmark MapEventsFromCSV.py
+    without a console. It implements the endpoints used by the script:
+    log_source_types, low_level_categories, high_level_categories, qid_records
+    and dsm_event_mappings, with the fields/filter parameters, the Range and
+    Content-Range headers, and POST to create or update records.
+
+    The Ariel searches counting the events of a list of QIDs per log source
+    type (ariel/searches, as sent by --verify_with_ariel) complete at once:
+    each mapping of the console to one of the QIDs gets get_event_count()
+    events, the mappings without events are left out of the results as in an
+    AQL GROUP BY.
+
+    The latency of each request and the share of requests that fail with 503
+    can be set, and requests above a number in flight can be throttled with
+    429, to see how the script behaves with a slow or busy console.
+
+    GET /api/mock/stats returns the number of requests per endpoint (the
+    stats requests are not counted).
+
+Usage:
+    Usage: MockQRadarServer.py [options]
+
+    Options:
+      -h, --help            show this help message and exit
+      -p PORT, --port=PORT  Port to listen on (default 8443)
+      --cert=FILE           TLS certificate (PEM)
+      --key=FILE            TLS private key (PEM)
+      --latency=SECONDS     Time taken by each request (default 0)
+      --jitter=SECONDS      Random time added to the latency (default 0)
+      --error_rate=RATE     Share of the requests failing with 503 (default 0)
+      --max_in_flight=N     Requests above this number in flight are throttled
+                            with 429 (default no limit)
+      --retry_after=SECONDS
+                            Retry-After header of the throttled requests
+                            (default none)
+'''
+
+import http.server
+import json
+import optparse
+import os
+import random
+import re
+import socketserver
+import ssl
+import sys
+import threading
+import time
+import urllib.parse
+
+
+LOG_SOURCE_TYPES_ENDPOINT = \
+    'config/event_sources/log_source_management/log_source_types'
+LOW_LEVEL_CATEGORIES_ENDPOINT = 'data_classification/low_level_categories'
+HIGH_LEVEL_CATEGORIES_ENDPOINT = 'data_classification/high_level_categories'
+QID_RECORDS_ENDPOINT = 'data_classification/qid_records'
+DSM_EVENT_MAPPINGS_ENDPOINT = 'data_classification/dsm_event_mappings'
+
+# log source types of the mock console, the first ones are custom
+LOG_SOURCE_TYPE_NAMES = ['Custom Log Source Type', 'Custom Log Source Type 2',
+                         'Custom Log Source Type 3', 'Linux OS',
+                         'Microsoft Windows Security Event Log',
+                         'Cisco ASA']
+CUSTOM_LOG_SOURCE_TYPES = 3
+FIRST_LOG_SOURCE_TYPE_ID = 4000
+
+CATEGORIES_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                               '..', 'categories.txt')
+
+FILTER_CLAUSE_PATTERN = re.compile(r'(\w+)\s+(ilike|=|in)\s+(.*)$',
+                                   re.IGNORECASE)
+
+ARIEL_SEARCHES_ENDPOINT = 'ariel/searches'
+ARIEL_QIDS_PATTERN = re.compile(r'\bqid\s+in\s*\(([\d,\s]*)\)', re.IGNORECASE)
+
+
+# Returns the log source types of the mock console.
+def get_log_source_types():
+    return [{'id': FIRST_LOG_SOURCE_TYPE_ID + index, 'name': name,
+             'custom': index < CUSTOM_LOG_SOURCE_TYPES}
+            for index, name in enumerate(LOG_SOURCE_TYPE_NAMES)]
+
+
+# Returns the high and low level categories read from categories.txt (id|
+# name|parent|), with the high level categories numbered after their parent
+# names.
+def get_categories(categories_file=CATEGORIES_FILE):
+
+    high_level_categories = {}
+    low_level_categories = []
+    with open(categories_file, mode='r', encoding='utf-8') as categories:
+        for line in categories:
+            fields = line.rstrip('\n').split('|')
+            if len(fields) < 3 or not fields[0].strip().isdigit():
+                continue
+            high_level_category_name = fields[2].strip()
+            if high_level_category_name not in high_level_categories:
+                high_level_categories[high_level_category_name] = {
+                    'id': (len(high_level_categories) + 1) * 1000,
+                    'name': high_level_category_name}
+            low_level_category_id = int(fields[0])
+            low_level_categories.append({
+                'id': low_level_category_id,
+                'name': fields[1].strip(),
+                'description': fields[1].strip(),
+                'severity': low_level_category_id % 10,
+                'high_level_category_id':
+                    high_level_categories[high_level_category_name]['id']})
+    return list(high_level_categories.values()), low_level_categories
+
+
+# Returns the number of events the Ariel searches of the mock console find
+# for a QID and a log source type: some of the pairs have none.
+def get_event_count(qid, log_source_type_id):
+    return (qid + log_source_type_id) % 4 * 5
+
+
+# Parses an AQL-like filter made of "field = value", "field ilike value" and
+# "field in (values)" clauses joined with "and". Returns a list of (field,
+# operator, values) tuples.
+def parse_filter(query_filter):
+
+    clauses = []
+    if not query_filter or not query_filter.strip():
+        return clauses
+    for clause in re.split(r'\s+and\s+', query_filter.strip(),
+                           flags=re.IGNORECASE):
+        match = FILTER_CLAUSE_PATTERN.match(clause.strip())
+        if match is None:
+            raise ValueError('Invalid filter: ' + query_filter)
+        field, operator, value = (match.group(1), match.group(2).lower(),
+                                  match.group(3).strip())
+        if operator == 'in':
+            values = [item.strip().strip('"')
+                      for item in value.strip('()').split(',')]
+        else:
+            values = [value.strip('"')]
+        clauses.append((field, operator, values))
+    return clauses
+
+
+def matches_filter(record, clauses):
+
+    for field, operator, values in clauses:
+        record_value = str(record.get(field))
+        if operator == 'ilike':
+            pattern = re.escape(values[0]).replace('%', '.*')
+            if not re.fullmatch(pattern, record_value,
+                                re.IGNORECASE | re.DOTALL):
+                return False
+        elif record_value not in values:
+            return False
+    return True
+
+
+# The records of the mock console and the request counters. All the access
+# goes through the lock, as the server handles requests on several threads.
+class MockQRadar:
+
+    REQUIRED_FIELDS = {
+        QID_RECORDS_ENDPOINT: ('log_source_type_id', 'name', 'severity',
+                               'low_level_category_id'),
+        DSM_EVENT_MAPPINGS_ENDPOINT: ('log_source_type_id',
+                                      'log_source_event_id',
+                                      'log_source_event_category',
+                                      'qid_record_id')}
+
+    # fields with an index, so that filtered lookups in large collections
+    # do not scan every record
+    INDEXED_FIELDS = {
+        QID_RECORDS_ENDPOINT: ('qid', 'log_source_type_id'),
+        DSM_EVENT_MAPPINGS_ENDPOINT: ('log_source_event_id',
+                                      'log_source_type_id')}
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 max_in_flight=None, retry_after=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+
+        high_level_categories, low_level_categories = get_categories()
+        self.collections = {
+            LOG_SOURCE_TYPES_ENDPOINT: get_log_source_types(),
+            HIGH_LEVEL_CATEGORIES_ENDPOINT: high_level_categories,
+            LOW_LEVEL_CATEGORIES_ENDPOINT: low_level_categories,
+            QID_RECORDS_ENDPOINT: [],
+            DSM_EVENT_MAPPINGS_ENDPOINT: []}
+        self.records_by_id = dict(
+            (endpoint, dict((record['id'], record) for record in records))
+            for endpoint, records in self.collections.items())
+        self.indexes = dict(
+            (endpoint, dict((field, {}) for field in fields))
+            for endpoint, fields in self.INDEXED_FIELDS.items())
+        self.next_id = 100000
+        self.next_qid = 2000000
+        self.searches = {}
+        self.next_search_id = 0
+
+        self.requests = {}
+        self.status_codes = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def get_stats(self):
+        with self.lock:
+            return {'requests': sum(self.requests.values()),
+                    'requests_by_endpoint': dict(self.requests),
+                    'status_codes': dict(self.status_codes),
+                    'peak_in_flight': self.peak_in_flight,
+                    'connections': self.connections}
+
+    # Returns the records of a collection matching the filter.
+    def find(self, endpoint, query_filter):
+
+        clauses = parse_filter(query_filter)
+        with self.lock:
+            records = self.collections[endpoint]
+            indexes = self.indexes.get(endpoint, {})
+            for field, operator, values in clauses:
+                if operator != 'ilike' and field in indexes:
+                    candidates = set()
+                    for value in values:
+                        candidates.update(indexes[field].get(value, ()))
+                    if len(candidates) < len(records):
+                        records = [self.records_by_id[endpoint][record_id]
+                                   for record_id in sorted(candidates)]
+            return [dict(record) for record in records
+                    if matches_filter(record, clauses)]
+
+    def add_to_indexes(self, endpoint, record):
+        for field, index in self.indexes.get(endpoint, {}).items():
+            index.setdefault(str(record.get(field)), set()).add(record['id'])
+
+    def remove_from_indexes(self, endpoint, record):
+        for field, index in self.indexes.get(endpoint, {}).items():
+            index.get(str(record.get(field)), set()).discard(record['id'])
+
+    def get(self, endpoint, record_id):
+        with self.lock:
+            record = self.records_by_id[endpoint].get(record_id)
+            return None if record is None else dict(record)
+
+    def create(self, endpoint, fields):
+        with self.lock:
+            self.next_id += 1
+            record = dict(fields, id=self.next_id)
+            if endpoint == QID_RECORDS_ENDPOINT:
+                self.next_qid += 1
+                record['qid'] = self.next_qid
+                record.setdefault('description', '')
+            self.collections[endpoint].append(record)
+            self.records_by_id[endpoint][record['id']] = record
+            self.add_to_indexes(endpoint, record)
+            return dict(record)
+
+    def update(self, endpoint, record_id, fields):
+        with self.lock:
+            record = self.records_by_id[endpoint].get(record_id)
+            if record is None:
+                return None
+            self.remove_from_indexes(endpoint, record)
+            record.update(dict((field, value)
+                               for field, value in fields.items()
+                               if field not in ('id', 'qid')))
+            self.add_to_indexes(endpoint, record)
+            return dict(record)
+
+
+    # Runs the Ariel search counting the events of the QIDs of the query per
+    # log source type, and returns its id.
+    def create_search(self, query):
+
+        match = ARIEL_QIDS_PATTERN.search(query)
+        if match is None:
+            raise ValueError('Unsupported Ariel search: ' + query)
+        qids = set(int(qid) for qid in match.group(1).split(',')
+                   if qid.strip())
+        with self.lock:
+            qid_records = self.records_by_id[QID_RECORDS_ENDPOINT]
+            event_counts = {}
+            for mapping in self.collections[DSM_EVENT_MAPPINGS_ENDPOINT]:
+                qid_record = qid_records.get(mapping['qid_record_id'])
+                if qid_record is None or qid_record['qid'] not in qids:
+                    continue
+                key = (qid_record['qid'], mapping['log_source_type_id'])
+                event_counts[key] = get_event_count(*key)
+            self.next_search_id += 1
+            search_id = str(self.next_search_id)
+            self.searches[search_id] = [
+                {'qid': qid, 'devicetype': log_source_type_id,
+                 'event_count': event_count}
+                for (qid, log_source_type_id), event_count
+                in sorted(event_counts.items()) if event_count]
+            return search_id
+
+    def get_search_events(self, search_id):
+        with self.lock:
+            return self.searches.get(search_id)
+
+    def delete_search(self, search_id):
+        with self.lock:
+            return self.searches.pop(search_id, None) is not None
+
+
+class MockQRadarRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body of a response are written separately
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super(MockQRadarRequestHandler, self).setup()
+        with self.server.mock.lock:
+            self.server.mock.connections += 1
+
+    def do_GET(self):
+        self.handle_api_request()
+
+    def do_POST(self):
+        self.handle_api_request()
+
+    def do_DELETE(self):
+        self.handle_api_request()
+
+    def handle_api_request(self):
+
+        mock = self.server.mock
+        url = urllib.parse.urlparse(self.path)
+        endpoint = url.path.split('/api/', 1)[-1].strip('/')
+        params = dict(urllib.parse.parse_qsl(url.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if endpoint == 'mock/stats':
+            return self.send_json(200, mock.get_stats())
+
+        endpoint_name = re.sub(r'/\d+(/|$)', r'/{id}\1', endpoint)
+        with mock.lock:
+            key = self.command + ' ' + endpoint_name
+            mock.requests[key] = mock.requests.get(key, 0) + 1
+            mock.in_flight += 1
+            mock.peak_in_flight = max(mock.peak_in_flight, mock.in_flight)
+            throttled = (mock.max_in_flight is not None and
+                         mock.in_flight > mock.max_in_flight)
+        try:
+            if mock.latency or mock.jitter:
+                time.sleep(mock.latency + random.uniform(0, mock.jitter))
+            if throttled:
+                headers = {}
+                if mock.retry_after is not None:
+                    headers['Retry-After'] = str(mock.retry_after)
+                self.send_json(429, {'description': 'Too many requests'},
+                               headers)
+            elif mock.error_rate and random.random() < mock.error_rate:
+                self.send_json(503, {'description':
+                                     'Service temporarily unavailable'})
+            elif endpoint.startswith(ARIEL_SEARCHES_ENDPOINT):
+                self.handle_ariel(endpoint, body)
+            elif self.command == 'GET':
+                self.handle_get(endpoint, params)
+            else:
+                self.handle_post(endpoint, body)
+        finally:
+            with mock.lock:
+                mock.in_flight -= 1
+
+    def handle_get(self, endpoint, params):
+
+        mock = self.server.mock
+        if endpoint == 'help/versions':
+            return self.send_json(200, [])
+
+        if endpoint in mock.collections:
+            try:
+                records = mock.find(endpoint, params.get('filter'))
+            except ValueError as error:
+                return self.send_json(422, {'description': str(error)})
+            total = len(records)
+            range_start, range_end = 0, total - 1
+            range_match = re.match(r'items=(\d+)-(\d+)',
+                                   self.headers.get('Range', ''))
+            if range_match is not None:
+                range_start = int(range_match.group(1))
+                range_end = min(int(range_match.group(2)), total - 1)
+            page = [self.select_fields(record, params.get('fields'))
+                    for record in records[range_start:range_end + 1]]
+            return self.send_json(200, page, {
+                'Content-Range': 'items ' + str(range_start) + '-' +
+                                 str(range_start + len(page) - 1) + '/' +
+                                 str(total)})
+
+        collection, record_id = self.split_record_endpoint(endpoint)
+        if collection is not None:
+            record = mock.get(collection, record_id)
+            if record is None:
+                return self.send_json(404, {'description':
+                                            'Record not found'})
+            return self.send_json(200, self.select_fields(
+                record, params.get('fields')))
+
+        self.send_json(404, {'description': 'Unknown endpoint ' + endpoint})
+
+    def handle_post(self, endpoint, body):
+
+        mock = self.server.mock
+        try:
+            fields = json.loads(body.decode('utf-8') or '{}')
+        except ValueError:
+            return self.send_json(422, {'description': 'Invalid JSON body'})
+
+        if endpoint in MockQRadar.REQUIRED_FIELDS:
+            missing_fields = [field for field in
+                              MockQRadar.REQUIRED_FIELDS[endpoint]
+                              if fields.get(field) in (None, '')]
+            if missing_fields:
+                return self.send_json(422, {
+                    'description': 'Missing fields: ' +
+                                   ', '.join(missing_fields)})
+            return self.send_json(201, mock.create(endpoint, fields))
+
+        collection, record_id = self.split_record_endpoint(endpoint)
+        if collection in MockQRadar.REQUIRED_FIELDS:
+            record = mock.update(collection, record_id, fields)
+            if record is None:
+                return self.send_json(404, {'description':
+                                            'Record not found'})
+            return self.send_json(200, record)
+
+        self.send_json(404, {'description': 'Unknown endpoint ' + endpoint})
+
+    def handle_ariel(self, endpoint, body):
+
+        mock = self.server.mock
+        if endpoint == ARIEL_SEARCHES_ENDPOINT and self.command == 'POST':
+            form = dict(urllib.parse.parse_qsl(body.decode('utf-8')))
+            try:
+                search_id = mock.create_search(
+                    form.get('query_expression', ''))
+            except ValueError as error:
+                return self.send_json(422, {'description': str(error)})
+            return self.send_json(201, {'search_id': search_id,
+                                        'status': 'COMPLETED'})
+
+        search_id, separator, results = \
+            endpoint[len(ARIEL_SEARCHES_ENDPOINT) + 1:].partition('/')
+        events = mock.get_search_events(search_id)
+        if events is None:
+            return self.send_json(404, {'description':
+                                        'Search not found ' + search_id})
+        if self.command == 'DELETE' and not separator:
+            mock.delete_search(search_id)
+            return self.send_json(202, {'search_id': search_id,
+                                        'status': 'COMPLETED'})
+        if self.command == 'GET' and not separator:
+            return self.send_json(200, {'search_id': search_id,
+                                        'status': 'COMPLETED',
+                                        'progress': 100,
+                                        'record_count': len(events)})
+        if self.command == 'GET' and results == 'results':
+            range_start, range_end = 0, len(events) - 1
+            range_match = re.match(r'items=(\d+)-(\d+)',
+                                   self.headers.get('Range', ''))
+            if range_match is not None:
+                range_start = int(range_match.group(1))
+                range_end = min(int(range_match.group(2)), len(events) - 1)
+            return self.send_json(200, {
+                'events': events[range_start:range_end + 1]})
+
+        self.send_json(404, {'description': 'Unknown endpoint ' + endpoint})
+
+    def split_record_endpoint(self, endpoint):
+        collection, separator, record_id = endpoint.rpartition('/')
+        if (separator and record_id.isdigit() and
+                collection in self.server.mock.collections):
+            return collection, int(record_id)
+        return None, None
+
+    def select_fields(self, record, fields):
+        if not fields:
+            return record
+        return dict((field.strip(), record.get(field.strip()))
+                    for field in fields.split(','))
+
+    def send_json(self, code, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for header_key, header_value in (headers or {}).items():
+            self.send_header(header_key, header_value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockQRadarServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, port, mock, cert_file, key_file):
+        super(MockQRadarServer, self).__init__(('127.0.0.1', port),
+                                               MockQRadarRequestHandler)
+        self.mock = mock
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+
+def parse_arguments(arguments):
+
+    parser = optparse.OptionParser()
+    parser.add_option('-p', '--port', dest='port', action='store',
+                      type='int', default=8443, metavar='PORT',
+                      help='Port to listen on (default 8443)')
+    parser.add_option('--cert', dest='cert_file', action='store',
+                      metavar='FILE', help='TLS certificate (PEM)')
+    parser.add_option('--key', dest='key_file', action='store',
+                      metavar='FILE', help='TLS private key (PEM)')
+    parser.add_option('--latency', dest='latency', action='store',
+                      type='float', default=0.0, metavar='SECONDS',
+                      help='Time taken by each request (default 0)')
+    parser.add_option('--jitter', dest='jitter', action='store',
+                      type='float', default=0.0, metavar='SECONDS',
+                      help='Random time added to the latency (default 0)')
+    parser.add_option('--error_rate', dest='error_rate', action='store',
+                      type='float', default=0.0, metavar='RATE',
+                      help='Share of the requests failing with 503 '
+                           '(default 0)')
+    parser.add_option('--max_in_flight', dest='max_in_flight',
+                      action='store', type='int', metavar='N',
+                      help='Requests above this number in flight are '
+                           'throttled with 429 (default no limit)')
+    parser.add_option('--retry_after', dest='retry_after', action='store',
+                      type='int', metavar='SECONDS',
+                      help='Retry-After header of the throttled requests '
+                           '(default none)')
+
+    (options, args) = parser.parse_args(arguments)
+    if not options.cert_file or not options.key_file:
+        parser.error('--cert and --key are required')
+    return options
+
+
+if __name__ == '__main__':
+    options = parse_arguments(sys.argv[1:])
+    mock = MockQRadar(latency=options.latency, jitter=options.jitter,
+                      error_rate=options.error_rate,
+                      max_in_flight=options.max_in_flight,
+                      retry_after=options.retry_after)
+    server = MockQRadarServer(options.port, mock, options.cert_file,
+                              options.key_file)
+    print('Listening on 127.0.0.1:' + str(options.port), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+'''
+Description:
+    Measures the throughput of MapEventsFromCSV.py end to end against the
+    local mock console of MockQRadarServer.py.
+
+    For each number of rows a synthetic input file is generated, a fresh mock
+    console is started and the script is run against it, once per pass (the
+    first pass creates the QID records and mappings, the next ones find and
+    update them). Each run reports the rows per second, the REST API calls per
+    row and the peak RSS of the script, and can be appended to a JSON lines
+    report to compare runs.
+
+    The mock console uses a self-signed certificate created with openssl, and
+    the script reads a config file written to the work directory, so the
+    config.ini of the script is not used.
+
+Usage:
+    Usage: RunBenchmark.py [options]
+
+    Options:
+      -h, --help            show this help message and exit
+      -n ROWS, --rows=ROWS  Comma separated numbers of lines (default 1000)
+      --passes=N            Runs against the same console (default 1)
+      -x ARGS, --script_args=ARGS
+                            Options passed to MapEventsFromCSV.py, e.g. "-c -p
+                            -w 8"
+      --latency=SECONDS     Time taken by each request (default 0.005)
+      --jitter=SECONDS      Random time added to the latency (default 0)
+      --error_rate=RATE     Share of the requests failing with 503 (default 0)
+      --max_in_flight=N     Requests above this number in flight are throttled
+                            with 429 (default no limit)
+      --retry_after=SECONDS
+                            Retry-After header of the throttled requests
+                            (default none)
+      --duplicates=RATE     Share of the lines repeating a previous event
+                            (default 0.05)
+      -p PORT, --port=PORT  Port of the mock console (default 18443)
+      --work_dir=DIR        Keep the input, output and log files in this
+                            directory (default a temporary directory)
+      --report=FILE         Append the results to this JSON lines file
+'''
+
+import csv
+import json
+import optparse
+import os
+import shlex
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import http.client
+
+import GenerateEventsCSV
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCHMARK_DIR)
+SCRIPT_FILE = os.path.join(PACKAGE_DIR, 'MapEventsFromCSV.py')
+MOCK_SERVER_FILE = os.path.join(BENCHMARK_DIR, 'MockQRadarServer.py')
+
+RESULT_COLUMNS = ['rows', 'pass', 'seconds', 'rows_per_second', 'api_calls',
+                  'api_calls_per_row', 'peak_rss_mb', 'errors']
+
+
+# Creates the self-signed certificate of the mock console.
+def create_certificate(work_dir):
+
+    cert_file = os.path.join(work_dir, 'mock_cert.pem')
+    key_file = os.path.join(work_dir, 'mock_key.pem')
+    if not (os.path.isfile(cert_file) and os.path.isfile(key_file)):
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048',
+                        '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+                        '-keyout', key_file, '-out', cert_file],
+                       check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+    return cert_file, key_file
+
+
+def write_config_file(config_file, port, cert_file):
+    with open(config_file, mode='w', encoding='utf-8') as config_file_handle:
+        config_file_handle.write('[DEFAULT]\n'
+                                 'server_ip = 127.0.0.1:' + str(port) + '\n'
+                                 'auth_token = benchmark\n'
+                                 'certificate_file = ' + cert_file + '\n')
+
+
+def start_mock_server(options, port, cert_file, key_file):
+
+    command = [sys.executable, MOCK_SERVER_FILE, '--port', str(port),
+               '--cert', cert_file, '--key', key_file,
+               '--latency', str(options.latency),
+               '--jitter', str(options.jitter),
+               '--error_rate', str(options.error_rate)]
+    if options.max_in_flight is not None:
+        command += ['--max_in_flight', str(options.max_in_flight)]
+    if options.retry_after is not None:
+        command += ['--retry_after', str(options.retry_after)]
+    mock_server = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   text=True)
+    # wait for the server to listen
+    if not mock_server.stdout.readline():
+        mock_server.wait()
+        raise RuntimeError('The mock console failed to start on port ' +
+                           str(port))
+    return mock_server
+
+
+def stop_mock_server(mock_server):
+    mock_server.terminate()
+    mock_server.wait()
+    mock_server.stdout.close()
+
+
+# Returns the request counters of the mock console.
+def get_mock_stats(port, cert_file):
+
+    context = ssl.create_default_context(cafile=cert_file)
+    context.check_hostname = False
+    connection = http.client.HTTPSConnection('127.0.0.1', port,
+                                             context=context)
+    try:
+        connection.request('GET', '/api/mock/stats')
+        return json.loads(connection.getresponse().read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+# Runs the script and returns the elapsed seconds and its peak RSS in MB.
+def run_script(input_file, output_file, log_file, config_file, script_args):
+
+    command = ([sys.executable, SCRIPT_FILE, '-i', input_file,
+                '-o', output_file, '-l', log_file,
+                '--config_file', config_file] + script_args)
+    start = time.monotonic()
+    # the modules are loaded relative to the working directory
+    script = subprocess.Popen(command, cwd=PACKAGE_DIR,
+                              stdout=subprocess.DEVNULL)
+    pid, status, resource_usage = os.wait4(script.pid, 0)
+    seconds = time.monotonic() - start
+    script.returncode = os.waitstatus_to_exitcode(status)
+    if script.returncode != 0:
+        raise RuntimeError('MapEventsFromCSV.py failed with exit code ' +
+                           str(script.returncode) + ', see ' + log_file)
+    # ru_maxrss is in kilobytes on Linux
+    return seconds, resource_usage.ru_maxrss / 1024.0
+
+
+# Returns the number of output lines that did not succeed.
+def count_errors(output_file):
+    with open(output_file, mode='r', newline='',
+              encoding='utf-8-sig') as output:
+        return sum(1 for row in csv.DictReader(output)
+                   if row['Mapping Result'] not in ('CREATED', 'UPDATED',
+                                                    'SKIPPED'))
+
+
+def run_benchmark(options, rows, port, cert_file, key_file, work_dir):
+
+    input_file = os.path.join(work_dir, 'input_' + str(rows) + '.csv')
+    GenerateEventsCSV.generate_csv(input_file, rows,
+                                   duplicates=options.duplicates)
+    config_file = os.path.join(work_dir, 'config.ini')
+    write_config_file(config_file, port, cert_file)
+
+    results = []
+    mock_server = start_mock_server(options, port, cert_file, key_file)
+    try:
+        api_calls = 0
+        for run_pass in range(1, options.passes + 1):
+            name = 'output_' + str(rows) + '_' + str(run_pass)
+            output_file = os.path.join(work_dir, name + '.csv')
+            seconds, peak_rss_mb = run_script(
+                input_file, output_file, os.path.join(work_dir, name + '.log'),
+                config_file, shlex.split(options.script_args or ''))
+            total_api_calls = get_mock_stats(port, cert_file)['requests']
+            pass_api_calls = total_api_calls - api_calls
+            api_calls = total_api_calls
+            results.append({
+                'rows': rows,
+                'pass': run_pass,
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(rows / seconds, 1),
+                'api_calls': pass_api_calls,
+                'api_calls_per_row': round(pass_api_calls / rows, 2),
+                'peak_rss_mb': round(peak_rss_mb, 1),
+                'errors': count_errors(output_file)})
+    finally:
+        stop_mock_server(mock_server)
+    return results
+
+
+def print_results(results):
+    print(''.join(column.rjust(18) for column in RESULT_COLUMNS))
+    for result in results:
+        print(''.join(str(result[column]).rjust(18)
+                      for column in RESULT_COLUMNS))
+
+
+def write_report(report_file, options, results):
+    with open(report_file, mode='a', encoding='utf-8') as report:
+        for result in results:
+            entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'script_args': options.script_args or '',
+                     'latency': options.latency,
+                     'jitter': options.jitter,
+                     'error_rate': options.error_rate,
+                     'max_in_flight': options.max_in_flight}
+            entry.update(result)
+            report.write(json.dumps(entry) + '\n')
+
+
+def parse_arguments(arguments):
+
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--rows', dest='rows', action='store',
+                      default='1000', metavar='ROWS',
+                      help='Comma separated numbers of lines (default 1000)')
+    parser.add_option('--passes', dest='passes', action='store', type='int',
+                      default=1, metavar='N',
+                      help='Runs against the same console (default 1)')
+    parser.add_option('-x', '--script_args', dest='script_args',
+                      action='store', metavar='ARGS',
+                      help='Options passed to MapEventsFromCSV.py, e.g. '
+                           '"-c -p -w 8"')
+    parser.add_option('--latency', dest='latency', action='store',
+                      type='float', default=0.005, metavar='SECONDS',
+                      help='Time taken by each request (default 0.005)')
+    parser.add_option('--jitter', dest='jitter', action='store',
+                      type='float', default=0.0, metavar='SECONDS',
+                      help='Random time added to the latency (default 0)')
+    parser.add_option('--error_rate', dest='error_rate', action='store',
+                      type='float', default=0.0, metavar='RATE',
+                      help='Share of the requests failing with 503 '
+                           '(default 0)')
+    parser.add_option('--max_in_flight', dest='max_in_flight',
+                      action='store', type='int', metavar='N',
+                      help='Requests above this number in flight are '
+                           'throttled with 429 (default no limit)')
+    parser.add_option('--retry_after', dest='retry_after', action='store',
+                      type='int', metavar='SECONDS',
+                      help='Retry-After header of the throttled requests '
+                           '(default none)')
+    parser.add_option('--duplicates', dest='duplicates', action='store',
+                      type='float', default=0.05, metavar='RATE',
+                      help='Share of the lines repeating a previous event '
+                           '(default 0.05)')
+    parser.add_option('-p', '--port', dest='port', action='store',
+                      type='int', default=18443, metavar='PORT',
+                      help='Port of the mock console (default 18443)')
+    parser.add_option('--work_dir', dest='work_dir', action='store',
+                      metavar='DIR',
+                      help='Keep the input, output and log files in this '
+                           'directory (default a temporary directory)')
+    parser.add_option('--report', dest='report_file', action='store',
+                      metavar='FILE',
+                      help='Append the results to this JSON lines file')
+
+    (options, args) = parser.parse_args(arguments)
+    options.rows = [int(rows) for rows in options.rows.split(',')]
+    return options
+
+
+if __name__ == '__main__':
+    options = parse_arguments(sys.argv[1:])
+
+    if options.work_dir:
+        os.makedirs(options.work_dir, exist_ok=True)
+        work_dir = os.path.realpath(options.work_dir)
+        temporary_dir = None
+    else:
+        temporary_dir = tempfile.TemporaryDirectory(prefix='benchmark_')
+        work_dir = temporary_dir.name
+
+    try:
+        cert_file, key_file = create_certificate(work_dir)
+        results = []
+        for rows in options.rows:
+            results += run_benchmark(options, rows, options.port, cert_file,
+                                     key_file, work_dir)
+        print_results(results)
+        if options.report_file:
+            write_report(options.report_file, options, results)
+    finally:
+        if temporary_dir is not None:
+            temporary_dir.cleanup()
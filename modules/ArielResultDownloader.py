@@ -0,0 +1,156 @@
+import collections
+import csv
+import http.client
+import json
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Downloads the results of a completed Ariel search to a CSV or JSONL file.
+# The result set is split into chunks of chunk_size rows requested with the
+# Range header, workers chunks at a time over the pooled connections of the
+# ariel APIClient. The chunks are written in order as soon as they arrive,
+# and at most two chunks per worker are held in memory, so the size of the
+# result set is only limited by the disk.
+#
+# A chunk that fails (error status, broken connection, truncated or invalid
+# body) is requested again on its own, up to max_attempts times, without
+# restarting the download. The file is written next to output_file and only
+# renamed to output_file once complete.
+#
+# A CSV file always starts with the header of the columns of the search, also
+# when it has no results.
+class ArielResultDownloader:
+
+    OUTPUT_FORMATS = ('csv', 'jsonl')
+    CHUNK_ERRORS = (OSError, http.client.HTTPException, ValueError)
+
+    def __init__(self, ariel_client, chunk_size=10000, workers=4,
+                 max_attempts=3, retry_delay=1.0):
+        self.ariel_client = ariel_client
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    # Writes the record_count rows of the search to output_file and returns
+    # the number of rows written.
+    def download(self, search_id, record_count, output_file,
+                 output_format='csv'):
+
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError('Unknown output format ' + output_format)
+        chunk_ranges = iter([
+            (range_start, min(range_start + self.chunk_size, record_count) - 1)
+            for range_start in range(0, record_count, self.chunk_size)])
+
+        partial_file = output_file + '.part'
+        rows = 0
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            with open(partial_file, 'w', encoding='utf-8',
+                      newline='') as output:
+                row_writer = RowWriter(output, output_format)
+                if output_format == 'csv' and record_count == 0:
+                    row_writer.write_header(self.get_columns(search_id))
+                # keep the workers busy while the oldest chunk is written
+                pending_chunks = collections.deque()
+                for _ in range(self.workers * 2):
+                    self.submit_chunk(executor, pending_chunks, search_id,
+                                      chunk_ranges)
+                while pending_chunks:
+                    chunk = pending_chunks.popleft().result()
+                    self.submit_chunk(executor, pending_chunks, search_id,
+                                      chunk_ranges)
+                    row_writer.write_rows(chunk)
+                    rows += len(chunk)
+            os.replace(partial_file, output_file)
+        except BaseException:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return rows
+
+    def submit_chunk(self, executor, pending_chunks, search_id, chunk_ranges):
+        chunk_range = next(chunk_ranges, None)
+        if chunk_range is not None:
+            pending_chunks.append(executor.submit(self.get_chunk, search_id,
+                                                  *chunk_range))
+
+    # Returns the rows range_start to range_end of the search, retrying the
+    # request until it returns all of them.
+    def get_chunk(self, search_id, range_start, range_end):
+
+        chunk_name = (str(range_start) + '-' + str(range_end) +
+                      ' of the Ariel search ' + search_id)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = self.ariel_client.get_search_results(
+                    search_id, 'application/json', range_start, range_end)
+                if response.code != 200:
+                    raise ValueError('status ' + str(response.code))
+                chunk = get_rows(json.loads(response.read().decode('utf-8')))
+                if len(chunk) != range_end - range_start + 1:
+                    raise ValueError(str(len(chunk)) + ' rows returned')
+                return chunk
+            except self.CHUNK_ERRORS as error:
+                if attempt == self.max_attempts:
+                    raise LookupError('Failed to get the results ' +
+                                      chunk_name + ': ' + str(error))
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logging.warning('Failed to get the results ' + chunk_name +
+                                ' (' + str(error) + '), retry ' +
+                                str(attempt) + ' in ' + str(delay) + 's')
+                time.sleep(delay)
+
+
+    # Returns the columns of the search, read from the header of its results
+    # as CSV.
+    def get_columns(self, search_id):
+
+        response = self.ariel_client.get_search_results(search_id,
+                                                        'application/csv')
+        if response.code != 200:
+            raise LookupError('Failed to get the columns of the Ariel search ' +
+                              search_id + ': status ' + str(response.code))
+        header = response.read().decode('utf-8-sig').splitlines()[:1]
+        return next(csv.reader(header), [])
+
+
+# The results of a search are returned under the name of their database, e.g.
+# {"events": [...]} or {"flows": [...]}.
+def get_rows(results):
+    if isinstance(results, list):
+        return results
+    if not isinstance(results, dict) or len(results) != 1:
+        raise ValueError('unexpected results body')
+    return next(iter(results.values()))
+
+
+# Writes rows (dicts) as CSV, with the columns of the first row as header
+# unless it was written before, or as one JSON object per line.
+class RowWriter:
+
+    def __init__(self, output, output_format):
+        self.output = output
+        self.output_format = output_format
+        self.csv_writer = None
+
+    def write_header(self, fieldnames):
+        self.csv_writer = csv.DictWriter(self.output, fieldnames=fieldnames,
+                                         restval='')
+        self.csv_writer.writeheader()
+
+    def write_rows(self, rows):
+        if self.output_format == 'jsonl':
+            self.output.writelines(json.dumps(row) + '\n' for row in rows)
+            return
+        if self.csv_writer is None and rows:
+            self.write_header(list(rows[0]))
+        if rows:
+            self.csv_writer.writerows(rows)
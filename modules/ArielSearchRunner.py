@@ -0,0 +1,56 @@
+import json
+import logging
+import time
+
+
+# Creates an Ariel search and waits for its completion. The search is polled
+# with a growing interval, from poll_interval up to max_poll_interval
+# seconds, and given up after timeout seconds.
+class ArielSearchRunner:
+
+    FINISHED_STATUSES = ('COMPLETED', 'CANCELED', 'ERROR')
+
+    def __init__(self, ariel_client, poll_interval=0.5, max_poll_interval=10.0,
+                 timeout=900.0):
+        self.ariel_client = ariel_client
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+
+    # Returns the id of the new search.
+    def create_search(self, query):
+
+        logging.info('Ariel search: ' + query)
+        response = self.ariel_client.create_search(query)
+        if response.code not in (200, 201):
+            raise LookupError('Failed to create the Ariel search: ' +
+                              response.read().decode('utf-8'))
+        return json.loads(response.read().decode('utf-8'))['search_id']
+
+    # Polls the search until it completes and returns its number of records.
+    def wait_for_search(self, search_id):
+
+        deadline = time.monotonic() + self.timeout
+        poll_interval = self.poll_interval
+        while True:
+            response = self.ariel_client.get_search(search_id)
+            if response.code != 200:
+                raise LookupError('Failed to get the status of the Ariel '
+                                  'search ' + search_id)
+            search = json.loads(response.read().decode('utf-8'))
+            if search['status'] in self.FINISHED_STATUSES:
+                break
+            if time.monotonic() + poll_interval > deadline:
+                raise LookupError('The Ariel search ' + search_id +
+                                  ' did not complete in ' +
+                                  str(self.timeout) + 's')
+            logging.debug('Ariel search ' + search_id + ': ' +
+                          search['status'] + ' ' +
+                          str(search.get('progress', '')) + '%')
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, self.max_poll_interval)
+
+        if search['status'] != 'COMPLETED':
+            raise LookupError('The Ariel search ' + search_id + ' ended with '
+                              'status ' + search['status'])
+        return search.get('record_count', 0)
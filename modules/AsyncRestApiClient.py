@@ -0,0 +1,234 @@
+from RestApiClient import RestApiClient
+from RestApiClient import ApiResponse
+from RestApiClient import IDEMPOTENT_METHODS
+from RequestThrottle import RequestThrottle
+
+import SampleUtilities
+
+import asyncio
+import email.parser
+import http.client
+import logging
+import ssl
+import sys
+import time
+
+
+# Connection errors that mean a kept-alive connection was closed by the
+# server while it was idle. The request is retried on a new connection when
+# one of these is raised on a reused connection, as in RestApiClient only if
+# sending it again has no side effect.
+STALE_CONNECTION_ERRORS = (asyncio.IncompleteReadError,
+                           ConnectionResetError,
+                           ConnectionAbortedError,
+                           BrokenPipeError)
+
+
+# An asyncio version of RestApiClient. It reads the same configuration, uses
+# the same credentials and certificate handling, and call_api() has the same
+# arguments and returns the same kind of response; it only has to be awaited.
+#
+# Requests are sent over persistent HTTP/1.1 connections. At most
+# max_connections_per_host requests are in flight at the same time, the
+# other ones wait for a connection to be released. Rate limits, adaptive
+# concurrency and retries of throttled requests work as in RestApiClient, and
+# connecting, sending the request and reading the response each time out
+# after the timeout of its connection pool.
+class AsyncRestApiClient(RestApiClient):
+
+    # seconds between two checks for a free slot of the concurrency limit
+    ACQUIRE_POLL_INTERVAL = 0.005
+
+    def __init__(self, config_section='DEFAULT', version=None, config=None,
+                 max_connections_per_host=100, throttle=None, metrics=None):
+
+        if throttle is None:
+            throttle = RequestThrottle(
+                max_concurrency=max(1, max_connections_per_host))
+        super(AsyncRestApiClient, self).__init__(
+            config_section=config_section, version=version, config=config,
+            max_connections=0, throttle=throttle, metrics=metrics)
+
+        self.max_connections_per_host = max_connections_per_host
+        self.semaphore = None
+        self.idle_connections = []
+
+        host, separator, port = self.server_ip.rpartition(':')
+        if separator and port.isdigit():
+            self.host = host
+            self.port = int(port)
+        else:
+            self.host = self.server_ip
+            self.port = 443
+
+    # This method is used to set up an HTTP request and send it to the server
+    async def call_api(self, endpoint, method, headers=None, params=[],
+                       data=None, print_request=False):
+
+        path = self.parse_path(endpoint, params)
+        actual_headers = self.merge_headers(headers, data)
+
+        # Print the request if print_request is True.
+        if print_request:
+            SampleUtilities.pretty_print_request(self, path, method,
+                                                 headers=actual_headers)
+
+        # The semaphore is created here so that it belongs to the running
+        # event loop.
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_connections_per_host)
+
+        # Send the request and receive the response, within the budget of
+        # its kind of request and again while the console throttles it.
+        budget = self.throttle.get_budget(method)
+        attempt = 0
+        while True:
+            await asyncio.sleep(budget.token_bucket.reserve())
+            while not budget.concurrency_limit.try_acquire():
+                await asyncio.sleep(self.ACQUIRE_POLL_INTERVAL)
+            start = time.monotonic()
+            # requests that fail also count against the concurrency limit
+            throttled = True
+            response = None
+            try:
+                async with self.semaphore:
+                    response = await self.send_request(
+                        method, self.base_uri + path, actual_headers, data)
+                throttled = self.throttle.is_throttled(response)
+            except ssl.SSLCertVerificationError:
+                print("Certificate verification failed.")
+                sys.exit(3)
+            finally:
+                latency = time.monotonic() - start
+                budget.concurrency_limit.release(latency, throttled)
+                self.metrics.record(
+                    method, endpoint,
+                    0 if response is None else response.code,
+                    0 if data is None else len(data),
+                    0 if response is None else response.size, latency)
+
+            if not self.throttle.should_retry(response, attempt):
+                break
+            delay = self.throttle.get_retry_delay(response, attempt)
+            attempt += 1
+            logging.warning('Console returned ' + str(response.code) +
+                            ' for ' + method + ' ' + endpoint +
+                            ', retry ' + str(attempt) + ' in ' +
+                            '{0:.2f}'.format(delay) + 's')
+            await asyncio.sleep(delay)
+
+        self.check_deprecated(response)
+
+        # returns the response object, including error responses.
+        return response
+
+    async def send_request(self, method, url, headers, data):
+
+        timeout = self.connection_pool.timeout
+        while True:
+            reader, writer, reused = await self.get_connection(timeout)
+            try:
+                writer.write(self.build_request(method, url, headers, data))
+                await asyncio.wait_for(writer.drain(), timeout)
+                response, keep_alive = await asyncio.wait_for(
+                    self.read_response(reader), timeout)
+            except STALE_CONNECTION_ERRORS:
+                # the request may have reached the console
+                writer.close()
+                if reused and method in IDEMPOTENT_METHODS:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+
+            if keep_alive:
+                self.idle_connections.append((reader, writer))
+            else:
+                writer.close()
+            return response
+
+    # Returns a tuple (reader, writer, reused). reused is True when the
+    # connection was an idle one. The idle connections already closed by the
+    # server are dropped, so that a request is not written to them.
+    async def get_connection(self, timeout):
+        while self.idle_connections:
+            reader, writer = self.idle_connections.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port,
+                                    ssl=self.ssl_context,
+                                    server_hostname=self.host), timeout)
+        return reader, writer, False
+
+    def build_request(self, method, url, headers, data):
+
+        lines = [method + ' ' + url + ' HTTP/1.1',
+                 'Host: ' + self.server_ip]
+        for header_key, header_value in headers.items():
+            if isinstance(header_key, bytes):
+                header_key = header_key.decode('latin-1')
+            if isinstance(header_value, bytes):
+                header_value = header_value.decode('latin-1')
+            lines.append(header_key + ': ' + str(header_value))
+        if data is not None:
+            lines.append('Content-Length: ' + str(len(data)))
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if data is not None:
+            request += data
+        return request
+
+    # Reads one response. Returns the response and whether the connection can
+    # be used for another request.
+    async def read_response(self, reader):
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(status_line, None)
+        version, status, reason = (
+            status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) +
+            [''])[:3]
+
+        header_lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line)
+        response_headers = email.parser.BytesParser(
+            _class=http.client.HTTPMessage).parsebytes(b''.join(header_lines))
+
+        keep_alive = (version == 'HTTP/1.1' and
+                      response_headers.get('Connection', '').lower() !=
+                      'close')
+
+        if response_headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                chunk_size = int((await reader.readline()).split(b';')[0], 16)
+                if chunk_size == 0:
+                    # trailer section
+                    while (await reader.readline()) not in (b'\r\n', b'\n',
+                                                            b''):
+                        pass
+                    break
+                body += await reader.readexactly(chunk_size)
+                await reader.readline()
+        elif response_headers.get('Content-Length') is not None:
+            body = await reader.readexactly(
+                int(response_headers['Content-Length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        return ApiResponse(int(status), reason, response_headers,
+                           body), keep_alive
+
+    # Closes the idle connections.
+    def close(self):
+        super(AsyncRestApiClient, self).close()
+        while self.idle_connections:
+            reader, writer = self.idle_connections.pop()
+            writer.close()
@@ -0,0 +1,136 @@
+import csv
+import random
+
+
+# A snapshot of the custom event mappings of a console and of their QID
+# records, read from the CSV export of customizations.howto. Filled into an
+# EventMappingIndex and a QidRecordIndex, it lets the script decide whether
+# each line creates, updates or skips its QID record and mapping without
+# reading them from the console. The export only holds the custom mappings:
+# an event missing from the snapshot may still have a mapping, which has to
+# be read from the console.
+#
+# The export must include the "Event Mapping Record ID" and "QID Record ID"
+# columns, the ids needed to update the records. A sample of the entries can
+# be compared with the console to detect a snapshot that is out of date.
+class BaselineSnapshot:
+
+    DSM_EVENT_MAPPINGS_ENDPOINT = 'data_classification/dsm_event_mappings'
+    QID_RECORDS_ENDPOINT = 'data_classification/qid_records'
+    REQUIRED_COLUMNS = ('Event Mapping Record ID', 'QID Record ID',
+                        'Log Source Type ID', 'Event ID', 'Event Category')
+    QID_RECORD_FIELDS = ('name', 'description', 'severity',
+                         'low_level_category_id')
+
+    def __init__(self, baseline_file):
+        self.baseline_file = baseline_file
+        self.mappings = []
+        self.qid_records = {}
+        self.skipped_rows = 0
+        self.load()
+
+    def load(self):
+
+        with open(self.baseline_file, mode='r', encoding='utf-8-sig',
+                  newline='') as baseline:
+            reader = csv.DictReader(baseline)
+            missing_columns = [column for column in self.REQUIRED_COLUMNS
+                               if column not in (reader.fieldnames or [])]
+            if missing_columns:
+                raise ValueError('The baseline file ' + self.baseline_file +
+                                 ' has no ' + ', '.join(missing_columns) +
+                                 ' column, export it with the query of '
+                                 'customizations.howto')
+            for row in reader:
+                # a mapping without QID record (left join) can not be used
+                if not row['Event Mapping Record ID'] or \
+                        not row['QID Record ID']:
+                    self.skipped_rows += 1
+                    continue
+                qid_record_id = int(row['QID Record ID'])
+                self.mappings.append({
+                    'id': int(row['Event Mapping Record ID']),
+                    'log_source_type_id': int(row['Log Source Type ID']),
+                    'log_source_event_id': row['Event ID'],
+                    'log_source_event_category': row['Event Category'],
+                    'qid_record_id': qid_record_id})
+                self.qid_records[qid_record_id] = {
+                    'id': qid_record_id,
+                    'qid': optional_int(row.get('QID')),
+                    'name': row.get('QID Name') or '',
+                    'description': row.get('QID Description') or '',
+                    'severity': optional_int(row.get('Severity')),
+                    'low_level_category_id':
+                        optional_int(row.get('Low Level Category ID'))}
+
+    # Adds the snapshot to the indexes.
+    def fill(self, mapping_index, qid_record_index):
+        for dsm_event_mapping in self.mappings:
+            mapping_index.add(dsm_event_mapping)
+        for qid_record in self.qid_records.values():
+            qid_record_index.add(qid_record)
+
+    # Reads a random sample of the mappings of the snapshot and of their QID
+    # records from the console, and returns the list of the differences
+    # found (empty if the sample is up to date).
+    def spot_check(self, client, sample_size=20, print_request=False):
+
+        sample = random.sample(self.mappings,
+                               min(sample_size, len(self.mappings)))
+        if not sample:
+            return []
+        live_mappings = self.get_records(
+            client, self.DSM_EVENT_MAPPINGS_ENDPOINT, 'id, qid_record_id',
+            [dsm_event_mapping['id'] for dsm_event_mapping in sample],
+            print_request)
+        live_qid_records = self.get_records(
+            client, self.QID_RECORDS_ENDPOINT,
+            'id, ' + ', '.join(self.QID_RECORD_FIELDS),
+            [dsm_event_mapping['qid_record_id'] for dsm_event_mapping
+             in sample], print_request)
+
+        differences = []
+        for dsm_event_mapping in sample:
+            live_mapping = live_mappings.get(dsm_event_mapping['id'])
+            if live_mapping is None:
+                differences.append('Mapping ' + str(dsm_event_mapping['id']) +
+                                   ' no longer exists')
+                continue
+            if live_mapping['qid_record_id'] != \
+                    dsm_event_mapping['qid_record_id']:
+                differences.append('Mapping ' + str(dsm_event_mapping['id']) +
+                                   ' is mapped to QID record ' +
+                                   str(live_mapping['qid_record_id']))
+                continue
+            qid_record = self.qid_records[dsm_event_mapping['qid_record_id']]
+            live_qid_record = live_qid_records.get(qid_record['id'])
+            if live_qid_record is None:
+                differences.append('QID record ' + str(qid_record['id']) +
+                                   ' no longer exists')
+                continue
+            for field in self.QID_RECORD_FIELDS:
+                if (live_qid_record.get(field) or '') != \
+                        (qid_record[field] or ''):
+                    differences.append('QID record ' + str(qid_record['id']) +
+                                       ' has a different ' + field)
+                    break
+        return differences
+
+    # Reads the records with the given ids, returns them by id.
+    @staticmethod
+    def get_records(client, endpoint, fields, ids, print_request):
+        query_filter = ('id in (' +
+                        ','.join(str(record_id)
+                                 for record_id in sorted(set(ids))) + ')')
+        params = {'fields': fields, 'filter': query_filter}
+        return dict((record['id'], record) for record in client.iter_items(
+            endpoint, params=params, print_request=print_request))
+
+    def __len__(self):
+        return len(self.mappings)
+
+
+def optional_int(value):
+    if value is None or value == '':
+        return None
+    return int(value)
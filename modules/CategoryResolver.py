@@ -0,0 +1,100 @@
+import logging
+import os
+import pickle
+
+from ReferenceCatalog import normalize_name
+
+
+# Resolves Low Level Category IDs offline from the categories list exported
+# with: /opt/qradar/bin/qidmap_cli.sh -l > categories.txt
+#
+# The file has one "id|name|parent|" line per category. It is parsed once
+# into two indexes, by category name and by (category name, parent name).
+# The parsed indexes are saved next to the file (categories.txt.cache) and
+# reused as long as the file is not modified.
+class CategoryResolver:
+
+    CACHE_SUFFIX = '.cache'
+    CACHE_VERSION = 1
+
+    def __init__(self, categories_file):
+        self.categories_file = categories_file
+        self.cache_file = categories_file + self.CACHE_SUFFIX
+
+        # name -> tuple of ids, (name, parent) -> tuple of ids
+        self.ids_by_name = {}
+        self.ids_by_names = {}
+
+        file_stat = os.stat(categories_file)
+        self.file_signature = (self.CACHE_VERSION, file_stat.st_mtime_ns,
+                               file_stat.st_size)
+
+        if not self.load_cache():
+            self.parse_categories_file()
+            self.save_cache()
+
+    def parse_categories_file(self):
+
+        ids_by_name = {}
+        ids_by_names = {}
+        with open(self.categories_file, mode='r') as categories_file_handler:
+            for line in categories_file_handler:
+                fields = line.rstrip('\r\n').split('|')
+                if len(fields) < 3 or not fields[0].strip().isdigit():
+                    # header or empty line
+                    continue
+                category_id = int(fields[0])
+                name = normalize_name(fields[1])
+                parent = normalize_name(fields[2])
+                ids_by_name.setdefault(name, []).append(category_id)
+                ids_by_names.setdefault((name, parent), []).append(
+                    category_id)
+
+        self.ids_by_name = dict((k, tuple(v)) for k, v in ids_by_name.items())
+        self.ids_by_names = dict((k, tuple(v))
+                                 for k, v in ids_by_names.items())
+
+    def load_cache(self):
+
+        try:
+            with open(self.cache_file, mode='rb') as cache_file_handler:
+                signature, ids_by_name, ids_by_names = pickle.load(
+                    cache_file_handler)
+        except Exception as error:
+            # missing, truncated, foreign or from another version: rebuilt
+            logging.info('Ignoring the category cache ' + self.cache_file +
+                         ': ' + repr(error))
+            return False
+
+        if signature != self.file_signature:
+            return False
+
+        self.ids_by_name = ids_by_name
+        self.ids_by_names = ids_by_names
+        return True
+
+    def save_cache(self):
+
+        try:
+            with open(self.cache_file, mode='wb') as cache_file_handler:
+                pickle.dump((self.file_signature, self.ids_by_name,
+                             self.ids_by_names), cache_file_handler,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as error:
+            # the cache is only an optimization
+            logging.warning('Could not write categories cache ' +
+                            self.cache_file + ': ' + str(error))
+
+    # Returns the ids of the low level categories with the given name (case
+    # insensitive). When several categories share the name and a high level
+    # category name is given, only the ones under that parent are returned.
+    def find_low_level_category_ids(self, low_level_category,
+                                    high_level_category=None):
+
+        category_ids = self.ids_by_name.get(
+            normalize_name(low_level_category), ())
+        if len(category_ids) > 1 and high_level_category:
+            return self.ids_by_names.get(
+                (normalize_name(low_level_category),
+                 normalize_name(high_level_category)), ())
+        return category_ids
@@ -0,0 +1,116 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+# An append-only journal of the processed input lines. Each processed line
+# adds one JSON line with the hash of the input line content, the resulting
+# QID record id and mapping id, the result statuses and the output row.
+#
+# When an import is resumed the journal is read first, and input lines that
+# were already completed with identical content are not processed again;
+# their output row is taken from the journal instead.
+#
+# Entries are flushed and fsync'ed in batches (every sync_every entries or
+# sync_interval seconds, whichever comes first) and when the journal is
+# closed, so a crash loses at most the last batch.
+class CheckpointJournal:
+
+    # mapping results of a line that does not need to be processed again
+    COMPLETED_RESULTS = ('CREATED', 'UPDATED', 'SKIPPED')
+
+    def __init__(self, journal_file, resume=False, sync_every=100,
+                 sync_interval=1.0):
+        self.journal_file = journal_file
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.completed = {}
+        self.lock = threading.Lock()
+
+        if resume and os.path.isfile(journal_file):
+            self.load()
+
+        self.journal_file_handle = open(journal_file,
+                                        'a' if resume else 'w',
+                                        encoding='utf-8')
+        self.unsynced_entries = 0
+        self.last_sync = time.monotonic()
+
+    def load(self):
+
+        with open(self.journal_file, mode='r',
+                  encoding='utf-8') as journal_file_handle:
+            for line in journal_file_handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last entry of a crashed run
+                    logging.warning('Ignoring incomplete journal entry: ' +
+                                    line)
+                    continue
+                if self.is_completed(entry):
+                    self.completed.setdefault(
+                        entry['hash'], collections.deque()).append(entry)
+
+        logging.info('Loaded ' + str(sum(len(entries) for entries in
+                                          self.completed.values())) +
+                     ' completed lines from journal ' + self.journal_file)
+
+    def is_completed(self, entry):
+        return (entry.get('mapping_result') in self.COMPLETED_RESULTS and
+                not str(entry.get('qid_result')).startswith('FAILED'))
+
+    # Returns the hash of the content of an input line. It must be computed
+    # before the line is validated, as validation fills in missing values.
+    @staticmethod
+    def line_hash(csv_line):
+        return hashlib.sha256(json.dumps(csv_line, sort_keys=True).encode(
+            'utf-8')).hexdigest()
+
+    # Returns the journal entry of a completed line with the same content,
+    # or None. Each entry is only returned once, so repeated lines in the
+    # input are matched with as many completed entries.
+    def take_completed(self, line_hash):
+        with self.lock:
+            entries = self.completed.get(line_hash)
+            if not entries:
+                return None
+            entry = entries.popleft()
+            if not entries:
+                del self.completed[line_hash]
+            return entry
+
+    # Appends the entry of a processed line. row is the output row of the
+    # line, as a dict of output column values.
+    def record(self, line_hash, result, row):
+        mapping_id = None
+        if result.get('mapping_result') in self.COMPLETED_RESULTS:
+            mapping_id = result.get('id')
+        entry = {'hash': line_hash,
+                 'qid_record_id': result.get('qid_record_id'),
+                 'mapping_id': mapping_id,
+                 'mapping_result': result.get('mapping_result'),
+                 'qid_result': result.get('qid_result'),
+                 'row': row}
+        line = json.dumps(entry, default=str) + '\n'
+        with self.lock:
+            self.journal_file_handle.write(line)
+            self.unsynced_entries += 1
+            if (self.unsynced_entries >= self.sync_every or
+                    time.monotonic() - self.last_sync >= self.sync_interval):
+                self.sync()
+
+    def sync(self):
+        self.journal_file_handle.flush()
+        os.fsync(self.journal_file_handle.fileno())
+        self.unsynced_entries = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.journal_file_handle.close()
@@ -0,0 +1,121 @@
+import collections
+import itertools
+import sys
+
+
+# A record with a fixed set of fields, used instead of a dict for the rows
+# and results kept in memory for a whole input file. The values are held in
+# slots, so a record has no per-instance dict and no copy of the field
+# names. It offers the dict methods used on CSV lines and results: r[field],
+# r.get(), field in r, keys(), items(), values(), update() and copy(), so
+# dict(r) and csv.DictWriter work on it.
+#
+# The string values of the interned fields (e.g. log source type and
+# category names, repeated on many lines) are interned when a record is
+# created or updated, so the records share one string per distinct value.
+# Records are built and copied without a Python call per field.
+#
+# Record classes are created for a list of fields with record_class().
+class Record:
+
+    __slots__ = ()
+    FIELDS = ()
+    FIELD_SLOTS = {}
+    INTERNED_FIELDS = frozenset()
+    INTERNED_INDEXES = ()
+
+    # values is a mapping, the fields that are not in the record are dropped
+    # and the ones missing from it are None
+    def __init__(self, values=None):
+        if values is None:
+            self.set_values(itertools.repeat(None))
+        else:
+            self.set_values(self.intern_values(map(values.get, self.FIELDS)))
+
+    # Creates a record from the values of all its fields, in order.
+    @classmethod
+    def from_values(cls, values):
+        record = cls.__new__(cls)
+        record.set_values(itertools.chain(cls.intern_values(values),
+                                          itertools.repeat(None)))
+        return record
+
+    # Returns the values as a list, with the string values of the interned
+    # fields interned.
+    @classmethod
+    def intern_values(cls, values):
+        values = list(values)
+        for index in cls.INTERNED_INDEXES:
+            if index < len(values) and isinstance(values[index], str):
+                values[index] = sys.intern(values[index])
+        return values
+
+    # Assigns the values to the slots, in order.
+    def set_values(self, values):
+        collections.deque(map(setattr, itertools.repeat(self),
+                              self.__slots__, values), maxlen=0)
+
+    def __getitem__(self, field):
+        return getattr(self, self.FIELD_SLOTS[field])
+
+    def __setitem__(self, field, value):
+        setattr(self, self.FIELD_SLOTS[field], value)
+
+    def __contains__(self, field):
+        return field in self.FIELD_SLOTS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, field, default=None):
+        slot = self.FIELD_SLOTS.get(field)
+        if slot is None:
+            return default
+        return getattr(self, slot)
+
+    # a keys view, as csv.DictWriter subtracts the field names from it
+    def keys(self):
+        return self.FIELD_SLOTS.keys()
+
+    def values(self):
+        return list(map(getattr, itertools.repeat(self), self.__slots__))
+
+    def items(self):
+        return zip(self.FIELDS, self.values())
+
+    def update(self, values):
+        for field in values.keys():
+            slot = self.FIELD_SLOTS.get(field)
+            if slot is None:
+                continue
+            value = values[field]
+            if isinstance(value, str) and field in self.INTERNED_FIELDS:
+                value = sys.intern(value)
+            setattr(self, slot, value)
+
+    # The values are already interned.
+    def copy(self):
+        record = self.__class__.__new__(self.__class__)
+        record.set_values(self.values())
+        return record
+
+
+# Returns a new Record class with the given fields (in order, duplicates
+# removed), interning the string values of interned_fields.
+def record_class(name, fields, interned_fields=()):
+    fields = tuple(dict.fromkeys(fields))
+    slots = tuple('value_' + str(index) for index in range(len(fields)))
+    interned_fields = frozenset(interned_fields)
+    return type(name, (Record,), {
+        '__slots__': slots,
+        'FIELDS': fields,
+        'FIELD_SLOTS': dict(zip(fields, slots)),
+        'INTERNED_FIELDS': interned_fields,
+        'INTERNED_INDEXES': tuple(index for index, field in enumerate(fields)
+                                  if field in interned_fields)})
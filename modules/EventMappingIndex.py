@@ -0,0 +1,163 @@
+import threading
+from urllib.parse import quote
+
+
+# An in-memory index of the existing DSM event mappings of a set of log
+# source types. The mappings of each log source type are read once, page by
+# page, and indexed by (log source type id, event id, event category), so
+# that checking whether an event is already mapped needs no REST API call.
+#
+# The mappings of a set of events can be read too, in batches of
+# "log_source_event_id in (...)" filters per log source type, e.g. the events
+# missing from a snapshot of the custom mappings. The events read this way
+# are known, mapped or not.
+class EventMappingIndex:
+
+    DSM_EVENT_MAPPINGS_ENDPOINT = 'data_classification/dsm_event_mappings'
+    FIELDS = ('id, log_source_type_id, log_source_event_id, '
+              'log_source_event_category, qid_record_id')
+
+    # maximum length of the URL encoded filter of a batch, as in
+    # QidRecordIndex
+    MAX_FILTER_LENGTH = 2000
+
+    def __init__(self, page_size=500):
+        self.page_size = page_size
+        self.mappings = {}
+        self.loaded_log_source_type_ids = set()
+        self.loaded_events = set()
+        self.lock = threading.Lock()
+
+    # Reads the mappings of each of the given log source types, unless they
+    # are already in the index.
+    def load(self, client, log_source_type_ids, print_request=False):
+
+        for log_source_type_id in sorted(set(log_source_type_ids)):
+            if self.is_loaded(log_source_type_id):
+                continue
+            query_filter = ('log_source_type_id = ' +
+                            str(int(log_source_type_id)))
+            params = {'fields': self.FIELDS, 'filter': query_filter}
+            for dsm_event_mapping in client.iter_items(
+                    self.DSM_EVENT_MAPPINGS_ENDPOINT, params=params,
+                    page_size=self.page_size, prefetch=True,
+                    print_request=print_request):
+                self.add(dsm_event_mapping)
+
+            with self.lock:
+                self.loaded_log_source_type_ids.add(int(log_source_type_id))
+
+    # Reads the mappings of the given events, (log source type id, event id,
+    # event category) tuples, that are not known yet. Returns the number of
+    # events read.
+    def load_events(self, client, events, print_request=False):
+
+        event_ids_by_log_source_type_id = {}
+        unknown_events = set()
+        for event in events:
+            key = (int(event[0]), str(event[1]), str(event[2]))
+            # an event id with a double quote can not be put in a filter, it
+            # is read on its own when its line is processed
+            if self.is_known(*key) or '"' in key[1]:
+                continue
+            event_ids_by_log_source_type_id.setdefault(key[0], set()).add(
+                key[1])
+            unknown_events.add(key)
+
+        for log_source_type_id, event_ids in sorted(
+                event_ids_by_log_source_type_id.items()):
+            for query_filter in self.get_event_filters(log_source_type_id,
+                                                       sorted(event_ids)):
+                params = {'fields': self.FIELDS, 'filter': query_filter}
+                for dsm_event_mapping in client.iter_items(
+                        self.DSM_EVENT_MAPPINGS_ENDPOINT, params=params,
+                        page_size=self.page_size, prefetch=True,
+                        print_request=print_request):
+                    self.add(dsm_event_mapping)
+
+        with self.lock:
+            self.loaded_events.update(unknown_events)
+        return len(unknown_events)
+
+    # Splits the event ids of a log source type into "log_source_event_id
+    # in (...)" filters of at most MAX_FILTER_LENGTH characters once URL
+    # encoded.
+    def get_event_filters(self, log_source_type_id, event_ids):
+
+        query_filters = []
+        batch = []
+        length = 0
+        for event_id in event_ids:
+            # each event id is quoted and followed by an encoded comma or
+            # parenthesis
+            event_id_length = len(quote('"' + event_id + '"')) + 3
+            if batch and length + event_id_length > self.MAX_FILTER_LENGTH:
+                query_filters.append(self.get_event_filter(log_source_type_id,
+                                                           batch))
+                batch = []
+                length = 0
+            if not batch:
+                length = len(quote(self.get_event_filter(log_source_type_id,
+                                                         [])))
+            batch.append(event_id)
+            length += event_id_length
+        if batch:
+            query_filters.append(self.get_event_filter(log_source_type_id,
+                                                       batch))
+        return query_filters
+
+    @staticmethod
+    def get_event_filter(log_source_type_id, event_ids):
+        return ('log_source_type_id = ' + str(int(log_source_type_id)) +
+                ' and log_source_event_id in (' +
+                ','.join('"' + event_id + '"' for event_id in event_ids) +
+                ')')
+
+    # Returns True if the mappings of the log source type have been read.
+    def is_loaded(self, log_source_type_id):
+        with self.lock:
+            return int(log_source_type_id) in self.loaded_log_source_type_ids
+
+    # Returns True if the index tells whether the event is mapped: its log
+    # source type or the event itself has been read, or its mapping has been
+    # added.
+    def is_known(self, log_source_type_id, log_source_event_id,
+                 log_source_event_category):
+        key = (int(log_source_type_id), str(log_source_event_id),
+               str(log_source_event_category))
+        with self.lock:
+            return (key[0] in self.loaded_log_source_type_ids or
+                    key in self.loaded_events or key in self.mappings)
+
+    # Returns a copy of the mapping of the event, or None if the event is not
+    # mapped.
+    def get(self, log_source_type_id, log_source_event_id,
+            log_source_event_category):
+        key = (int(log_source_type_id), str(log_source_event_id),
+               str(log_source_event_category))
+        with self.lock:
+            dsm_event_mapping = self.mappings.get(key)
+        if dsm_event_mapping is None:
+            return None
+        return dict(dsm_event_mapping)
+
+    # Adds or replaces a mapping, e.g. after it has been created or updated.
+    def add(self, dsm_event_mapping):
+        for field in ('id', 'log_source_type_id', 'log_source_event_id',
+                      'log_source_event_category', 'qid_record_id'):
+            if field not in dsm_event_mapping:
+                return
+        key = (int(dsm_event_mapping['log_source_type_id']),
+               str(dsm_event_mapping['log_source_event_id']),
+               str(dsm_event_mapping['log_source_event_category']))
+        record = {'id': dsm_event_mapping['id'],
+                  'log_source_type_id': key[0],
+                  'log_source_event_id': key[1],
+                  'log_source_event_category': key[2],
+                  'qid_record_id': dsm_event_mapping['qid_record_id']}
+        with self.lock:
+            self.mappings[key] = record
+
+    def __len__(self):
+        with self.lock:
+            return len(self.mappings)
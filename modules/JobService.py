@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+
+
+# A local service that runs import jobs in a long-running process, so that
+# the REST API connections, the catalog and the caches stay warm between
+# jobs. Jobs are submitted over a UNIX socket: the client sends one JSON line
+# with the job and the service answers with one JSON line with the result
+# once the job is done.
+#
+# A job is a dict with at least input_file and output_file (absolute paths,
+# read and written by the service). Jobs are run one at a time, in the order
+# they are received, by the run_job function given to the server; it returns
+# a dict of results (e.g. the number of rows) that is sent back to the client
+# with the status DONE, or raises an exception reported with the status
+# ERROR.
+#
+# The socket is only accessible to the user running the service.
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, run_job):
+        self.socket_path = socket_path
+        self.run_job = run_job
+        self.job_lock = threading.Lock()
+        remove_stale_socket(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               JobRequestHandler)
+
+    # The socket file is created without any access for the group and the
+    # others, rather than restricted after bind() while it already accepts
+    # connections. The umask is process wide: the service binds before it
+    # starts any thread.
+    def server_bind(self):
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    # Runs one job and returns the response sent to the client.
+    def handle_job(self, job):
+
+        missing_fields = [field for field in ('input_file', 'output_file')
+                          if not job.get(field)]
+        if missing_fields:
+            return {'status': 'ERROR',
+                    'message': 'Missing job fields: ' +
+                               ', '.join(missing_fields)}
+        with self.job_lock:
+            start = time.monotonic()
+            logging.info('Job started: ' + json.dumps(job))
+            try:
+                response = {'status': 'DONE',
+                            'output_file': job['output_file']}
+                response.update(self.run_job(job) or {})
+            except Exception as error:
+                logging.exception('Job failed: ' + json.dumps(job))
+                response = {'status': 'ERROR', 'message': str(error)}
+            response['seconds'] = round(time.monotonic() - start, 3)
+            logging.info('Job finished: ' + json.dumps(response))
+        return response
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class JobRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            job = json.loads(line.decode('utf-8'))
+            if not isinstance(job, dict):
+                raise ValueError('A job must be a JSON object')
+        except ValueError as error:
+            response = {'status': 'ERROR',
+                        'message': 'Invalid job: ' + str(error)}
+        else:
+            response = self.server.handle_job(job)
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+# Removes the socket file left by a previous service, but nothing else: not
+# a file that is not a socket, nor the socket of a service still running.
+def remove_stale_socket(socket_path):
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(socket_path + ' exists and is not a socket')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe_socket:
+        try:
+            probe_socket.connect(socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(socket_path)
+            return
+    raise ValueError('A service is already listening on ' + socket_path)
+
+
+# Submits a job to the service listening on socket_path and returns its
+# response once the job is done.
+def submit_job(socket_path, job, timeout=None):
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        client_socket.settimeout(timeout)
+        client_socket.connect(socket_path)
+        client_socket.sendall(json.dumps(job).encode('utf-8') + b'\n')
+        client_socket.shutdown(socket.SHUT_WR)
+        with client_socket.makefile('rb') as response_file:
+            line = response_file.readline()
+    if not line:
+        raise LookupError('The service closed the connection without a '
+                          'response')
+    return json.loads(line.decode('utf-8'))
@@ -0,0 +1,124 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+# A persistent cache of the results of the REST API lookups, shared by the
+# runs against the same console. Entries are stored in an SQLite file and
+# keyed by console host, entity (kind of lookup) and lookup key.
+#
+# Each entity has its own time to live. Empty results (the console found
+# nothing) are cached too, with the shorter NEGATIVE_TTL, so a missing log
+# source type or category is not looked up again on every line. The cache
+# keeps at most max_entries entries; the least recently used ones are
+# removed first.
+#
+# With refresh, the cached entries are ignored and replaced by the results
+# of new lookups.
+class LookupCache:
+
+    # time to live of the entries of each entity, in seconds
+    TTLS = {'log_source_type': 24 * 3600,
+            'low_level_category': 24 * 3600,
+            'default_severity': 24 * 3600,
+            'qid_records': 3600}
+    DEFAULT_TTL = 3600
+    NEGATIVE_TTL = 600
+
+    # the last used times and the size limit are written every PRUNE_EVERY
+    # new entries, and when the cache is closed
+    PRUNE_EVERY = 100
+
+    def __init__(self, cache_file, host, max_entries=10000, refresh=False,
+                 ttls=None):
+        self.cache_file = cache_file
+        self.host = host
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.ttls = dict(self.TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.used = {}
+        self.new_entries = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(cache_file, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS lookups ('
+            'host TEXT NOT NULL, entity TEXT NOT NULL, key TEXT NOT NULL, '
+            'value TEXT NOT NULL, expires REAL NOT NULL, '
+            'last_used REAL NOT NULL, PRIMARY KEY (host, entity, key))')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS lookups_last_used '
+            'ON lookups (last_used)')
+        self.connection.commit()
+
+    # Returns the cached value of a lookup, or None if it is not cached,
+    # has expired or the cache is refreshed.
+    def get(self, entity, key):
+        if self.refresh:
+            return None
+        key = str(key)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value, expires FROM lookups '
+                'WHERE host = ? AND entity = ? AND key = ?',
+                (self.host, entity, key)).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.used[(entity, key)] = now
+        return json.loads(row[0])
+
+    # Caches the value of a lookup. An empty value is cached as a negative
+    # entry.
+    def put(self, entity, key, value):
+        now = time.time()
+        ttl = (self.ttls.get(entity, self.DEFAULT_TTL) if value
+               else self.NEGATIVE_TTL)
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO lookups '
+                '(host, entity, key, value, expires, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (self.host, entity, str(key), json.dumps(value), now + ttl,
+                 now))
+            self.new_entries += 1
+            if self.new_entries >= self.PRUNE_EVERY:
+                self.prune()
+            self.connection.commit()
+
+    # Writes the last used times, then removes the expired entries and the
+    # least recently used ones above max_entries. Must be called with the
+    # lock held.
+    def prune(self):
+        self.connection.executemany(
+            'UPDATE lookups SET last_used = ? '
+            'WHERE host = ? AND entity = ? AND key = ?',
+            [(last_used, self.host, entity, key)
+             for (entity, key), last_used in self.used.items()])
+        self.used = {}
+        self.new_entries = 0
+        self.connection.execute('DELETE FROM lookups WHERE expires < ?',
+                                (time.time(),))
+        self.connection.execute(
+            'DELETE FROM lookups WHERE rowid IN (SELECT rowid FROM lookups '
+            'ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,))
+
+    def close(self):
+        with self.lock:
+            self.prune()
+            self.connection.commit()
+            self.connection.close()
+        logging.info('Lookup cache ' + self.cache_file + ': ' +
+                     str(self.hits) + ' hits, ' + str(self.misses) +
+                     ' misses')
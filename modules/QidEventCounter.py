@@ -0,0 +1,61 @@
+from ArielSearchRunner import ArielSearchRunner
+
+import json
+
+
+# Counts the events of a set of QIDs per log source type with a single Ariel
+# search, instead of one search per QID: the counts are aggregated by the
+# console and only one row per QID and log source type with events comes
+# back.
+#
+# The search is run by an ArielSearchRunner, its results are read page by
+# page and it is deleted once read.
+class QidEventCounter:
+
+    QUERY = ('SELECT qid, devicetype, COUNT(*) AS event_count FROM events '
+             'WHERE qid IN ({qids}) GROUP BY qid, devicetype '
+             'LAST {hours} HOURS')
+
+    def __init__(self, ariel_client, hours=24, poll_interval=0.5,
+                 max_poll_interval=10.0, timeout=900.0, page_size=1000):
+        self.ariel_client = ariel_client
+        self.hours = hours
+        self.search_runner = ArielSearchRunner(
+            ariel_client, poll_interval=poll_interval,
+            max_poll_interval=max_poll_interval, timeout=timeout)
+        self.page_size = page_size
+
+    def get_query(self, qids):
+        return self.QUERY.format(
+            qids=', '.join(str(int(qid)) for qid in sorted(set(qids))),
+            hours=int(self.hours))
+
+    # Returns a dict of the number of events per (QID, log source type id),
+    # without the pairs that had no event.
+    def count_events(self, qids):
+
+        search_id = self.search_runner.create_search(self.get_query(qids))
+        try:
+            record_count = self.search_runner.wait_for_search(search_id)
+            event_counts = {}
+            for row in self.iter_results(search_id, record_count):
+                key = (int(row['qid']), int(row['devicetype']))
+                event_counts[key] = (event_counts.get(key, 0) +
+                                     int(row['event_count']))
+            return event_counts
+        finally:
+            self.ariel_client.delete_search(search_id)
+
+    # Yields the rows of the results of a completed search, one page at a
+    # time.
+    def iter_results(self, search_id, record_count):
+
+        for range_start in range(0, record_count, self.page_size):
+            range_end = min(range_start + self.page_size, record_count) - 1
+            response = self.ariel_client.get_search_results(
+                search_id, 'application/json', range_start, range_end)
+            if response.code != 200:
+                raise LookupError('Failed to get the results of the Ariel '
+                                  'search ' + search_id)
+            for row in json.loads(response.read().decode('utf-8'))['events']:
+                yield row
@@ -0,0 +1,141 @@
+import threading
+from urllib.parse import quote
+
+
+# An in-memory index of the QID records of a set of log source types. The
+# records of each log source type are read once, page by page, and indexed
+# by record id and by QID number.
+#
+# The records of a set of QID numbers can be read too, in batches of
+# "qid in (...)" filters. The QID numbers read this way are known to be
+# complete in the index, including the ones without any record.
+class QidRecordIndex:
+
+    QID_RECORDS_ENDPOINT = 'data_classification/qid_records'
+    FIELDS = ('id, qid, name, description, severity, low_level_category_id, '
+              'log_source_type_id')
+
+    # maximum length of the URL encoded filter of a batch, so that the
+    # request line stays well under the URL length limits of the console
+    # and of the proxies in front of it
+    MAX_FILTER_LENGTH = 2000
+
+    def __init__(self, page_size=500):
+        self.page_size = page_size
+        self.qid_records_by_id = {}
+        self.qid_records_by_qid = {}
+        self.loaded_qids = set()
+        self.lock = threading.Lock()
+
+    # Reads the QID records of each of the given log source types.
+    def load(self, client, log_source_type_ids, print_request=False):
+
+        for log_source_type_id in sorted(set(log_source_type_ids)):
+            query_filter = ('log_source_type_id = ' +
+                            str(int(log_source_type_id)))
+            params = {'fields': self.FIELDS, 'filter': query_filter}
+            for qid_record in client.iter_items(
+                    self.QID_RECORDS_ENDPOINT, params=params,
+                    page_size=self.page_size, prefetch=True,
+                    print_request=print_request):
+                self.add(qid_record)
+
+    # Reads the QID records of the given QID numbers, in batches. Returns a
+    # dict of the records read per QID number.
+    def load_qids(self, client, qids, print_request=False):
+
+        qid_records_by_qid = dict((int(qid), []) for qid in qids)
+        for query_filter in self.get_qid_filters(sorted(qid_records_by_qid)):
+            params = {'fields': self.FIELDS, 'filter': query_filter}
+            for qid_record in client.iter_items(
+                    self.QID_RECORDS_ENDPOINT, params=params,
+                    page_size=self.page_size, prefetch=True,
+                    print_request=print_request):
+                if qid_record.get('qid') in qid_records_by_qid:
+                    qid_records_by_qid[qid_record['qid']].append(qid_record)
+        for qid, qid_records in qid_records_by_qid.items():
+            self.add_qid_records(qid, qid_records)
+        return qid_records_by_qid
+
+    # Splits the QID numbers into "qid in (...)" filters of at most
+    # MAX_FILTER_LENGTH characters once URL encoded.
+    def get_qid_filters(self, qids):
+
+        query_filters = []
+        batch = []
+        length = 0
+        for qid in qids:
+            # each QID number is followed by an encoded comma or parenthesis
+            qid_length = len(str(qid)) + 3
+            if batch and length + qid_length > self.MAX_FILTER_LENGTH:
+                query_filters.append(self.get_qid_filter(batch))
+                batch = []
+                length = 0
+            if not batch:
+                length = len(quote('qid in ('))
+            batch.append(qid)
+            length += qid_length
+        if batch:
+            query_filters.append(self.get_qid_filter(batch))
+        return query_filters
+
+    @staticmethod
+    def get_qid_filter(qids):
+        return 'qid in (' + ','.join(str(qid) for qid in qids) + ')'
+
+    # Adds all the QID records of a QID number, e.g. read from a cache, and
+    # marks the QID number as loaded.
+    def add_qid_records(self, qid, qid_records):
+        for qid_record in qid_records:
+            self.add(qid_record)
+        with self.lock:
+            self.loaded_qids.add(int(qid))
+
+    # Returns True if all the QID records of the QID number are in the index.
+    def has_qid(self, qid):
+        try:
+            qid = int(qid)
+        except ValueError:
+            return False
+        with self.lock:
+            return qid in self.loaded_qids
+
+    # Returns a copy of the QID record with the given record id, or None.
+    def get(self, qid_record_id):
+        with self.lock:
+            qid_record = self.qid_records_by_id.get(int(qid_record_id))
+        if qid_record is None:
+            return None
+        return dict(qid_record)
+
+    # Returns copies of the QID records with the given QID number.
+    def find_by_qid(self, qid):
+        with self.lock:
+            qid_records = self.qid_records_by_qid.get(int(qid), [])
+            return [dict(qid_record) for qid_record in qid_records]
+
+    # Adds or replaces a QID record, e.g. after it has been created or
+    # updated.
+    def add(self, qid_record):
+        if 'id' not in qid_record:
+            return
+        record = dict((field, qid_record[field])
+                      for field in ('id', 'qid', 'name', 'description',
+                                    'severity', 'low_level_category_id',
+                                    'log_source_type_id')
+                      if field in qid_record)
+        with self.lock:
+            previous_record = self.qid_records_by_id.get(record['id'])
+            if previous_record is not None and 'qid' in previous_record:
+                self.qid_records_by_qid[previous_record['qid']] = [
+                    qid_record for qid_record in
+                    self.qid_records_by_qid[previous_record['qid']]
+                    if qid_record['id'] != record['id']]
+            self.qid_records_by_id[record['id']] = record
+            if 'qid' in record:
+                self.qid_records_by_qid.setdefault(record['qid'], []).append(
+                    record)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.qid_records_by_id)
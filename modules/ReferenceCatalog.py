@@ -0,0 +1,102 @@
+# An in-memory copy of the QRadar reference data needed to validate a CSV
+# file: log source types, low level categories and high level categories.
+# The collections are read once, page by page, and indexed so that name and
+# id lookups do not need any further REST API call.
+class ReferenceCatalog:
+
+    LOG_SOURCE_TYPES_ENDPOINT = \
+        'config/event_sources/log_source_management/log_source_types'
+    LOW_LEVEL_CATEGORIES_ENDPOINT = 'data_classification/low_level_categories'
+    HIGH_LEVEL_CATEGORIES_ENDPOINT = \
+        'data_classification/high_level_categories'
+
+    def __init__(self, page_size=500):
+        self.page_size = page_size
+
+        self.log_source_types_by_id = {}
+        self.log_source_types_by_name = {}
+        self.high_level_categories_by_id = {}
+        self.low_level_categories_by_id = {}
+        self.low_level_categories_by_name = {}
+        self.low_level_categories_by_names = {}
+
+    # Reads all the reference collections using the given RestApiClient and
+    # builds the indexes.
+    def load(self, client, print_request=False):
+
+        for log_source_type in self.get_all_records(
+                client, self.LOG_SOURCE_TYPES_ENDPOINT, 'id, name, custom',
+                print_request):
+            self.log_source_types_by_id[log_source_type['id']] = \
+                log_source_type
+            self.log_source_types_by_name.setdefault(
+                normalize_name(log_source_type['name']), []).append(
+                log_source_type)
+
+        for high_level_category in self.get_all_records(
+                client, self.HIGH_LEVEL_CATEGORIES_ENDPOINT, 'id, name',
+                print_request):
+            self.high_level_categories_by_id[high_level_category['id']] = \
+                high_level_category
+
+        for low_level_category in self.get_all_records(
+                client, self.LOW_LEVEL_CATEGORIES_ENDPOINT,
+                'id, name, description, severity, high_level_category_id',
+                print_request):
+            self.add_low_level_category(low_level_category)
+
+    def add_low_level_category(self, low_level_category):
+
+        high_level_category = self.high_level_categories_by_id.get(
+            low_level_category.get('high_level_category_id'), {})
+        low_name = normalize_name(low_level_category['name'])
+        high_name = normalize_name(high_level_category.get('name'))
+
+        self.low_level_categories_by_id[low_level_category['id']] = \
+            low_level_category
+        self.low_level_categories_by_name.setdefault(low_name, []).append(
+            low_level_category)
+        self.low_level_categories_by_names.setdefault(
+            (low_name, high_name), []).append(low_level_category)
+
+    # Returns every record of a collection, requesting page_size items at a
+    # time through the Range header.
+    def get_all_records(self, client, endpoint, fields, print_request=False):
+        return list(client.iter_items(endpoint, params={'fields': fields},
+                                      page_size=self.page_size,
+                                      prefetch=True,
+                                      print_request=print_request))
+
+    # Returns the log source types with the given name (case insensitive).
+    def find_log_source_types(self, log_source_type):
+        return self.log_source_types_by_name.get(
+            normalize_name(log_source_type), [])
+
+    # Returns the low level categories with the given name (case
+    # insensitive). When several categories share the name and a high level
+    # category name is given, only the ones under that high level category
+    # are returned.
+    def find_low_level_categories(self, low_level_category,
+                                  high_level_category=None):
+
+        low_level_categories = self.low_level_categories_by_name.get(
+            normalize_name(low_level_category), [])
+        if len(low_level_categories) > 1 and high_level_category:
+            return self.low_level_categories_by_names.get(
+                (normalize_name(low_level_category),
+                 normalize_name(high_level_category)), [])
+        return low_level_categories
+
+    # Returns the low level category record with the given id, or None.
+    def get_low_level_category(self, low_level_category_id):
+        try:
+            return self.low_level_categories_by_id.get(
+                int(low_level_category_id))
+        except (TypeError, ValueError):
+            return None
+
+
+def normalize_name(name):
+    if name is None:
+        return ''
+    return name.strip().lower()
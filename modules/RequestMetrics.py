@@ -0,0 +1,255 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+
+
+# Upper bounds in seconds of the latency histogram buckets, 1 ms to about 2
+# minutes with each bucket 25% wider than the previous one. The last bucket
+# has no upper bound.
+LATENCY_BUCKETS = tuple(round(0.001 * 1.25 ** index, 6)
+                        for index in range(53))
+
+# Upper bounds of the buckets of the Prometheus histogram.
+PROMETHEUS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                      5.0, 10.0, 30.0)
+
+RECORD_ID_PATTERN = re.compile(r'/\d+(?=/|$)')
+
+
+# Returns the endpoint template of a request path: the query string is
+# removed and record ids are replaced with {id}, so that the requests for
+# different records of a collection are counted together.
+def endpoint_template(endpoint):
+    return RECORD_ID_PATTERN.sub('/{id}',
+                                 '/' + endpoint.split('?', 1)[0].strip('/'))
+
+
+# A latency histogram with fixed buckets, so that its size does not depend on
+# the number of requests. Percentiles are interpolated within the bucket they
+# fall in.
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.prometheus_counts = [0] * (len(PROMETHEUS_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, latency):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.prometheus_counts[bisect.bisect_left(PROMETHEUS_BUCKETS,
+                                                  latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.maximum = max(self.maximum, latency)
+
+    def get_percentile(self, percentile):
+        if self.count == 0:
+            return None
+        rank = percentile / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+                upper = (LATENCY_BUCKETS[index]
+                         if index < len(LATENCY_BUCKETS) else self.maximum)
+                upper = min(upper, self.maximum)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.maximum
+
+    # Returns the cumulative number of requests at most as long as each of
+    # the PROMETHEUS_BUCKETS bounds.
+    def get_cumulative_counts(self):
+        cumulative_counts = []
+        for count in self.prometheus_counts[:len(PROMETHEUS_BUCKETS)]:
+            cumulative_counts.append(
+                count + (cumulative_counts[-1] if cumulative_counts else 0))
+        return cumulative_counts
+
+    def to_dict(self):
+        return {'p50': round_latency(self.get_percentile(50)),
+                'p95': round_latency(self.get_percentile(95)),
+                'p99': round_latency(self.get_percentile(99)),
+                'mean': round_latency(self.total / self.count
+                                      if self.count else None),
+                'max': round_latency(self.maximum if self.count else None)}
+
+
+def round_latency(latency):
+    return None if latency is None else round(latency, 4)
+
+
+# The metrics of the requests to one endpoint template with one HTTP method.
+class EndpointMetrics:
+
+    def __init__(self, method, endpoint):
+        self.method = method
+        self.endpoint = endpoint
+        self.calls = 0
+        self.status_codes = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self):
+        return {'method': self.method,
+                'endpoint': self.endpoint,
+                'calls': self.calls,
+                'status_codes': dict((str(code), count) for code, count in
+                                     sorted(self.status_codes.items())),
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+                'latency_seconds': self.latency.to_dict()}
+
+
+# The metrics of the requests sent by one or several REST API clients, per
+# endpoint template and HTTP method: number of calls, status codes, request
+# and response body bytes and latency histogram. Every request sent counts,
+# including the retries of throttled requests; a request that fails without
+# a response is counted with status code 0.
+class RequestMetrics:
+
+    def __init__(self):
+        self.endpoints = {}
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, method, endpoint, status_code, bytes_sent,
+               bytes_received, latency):
+        key = (method, endpoint_template(endpoint))
+        with self.lock:
+            endpoint_metrics = self.endpoints.get(key)
+            if endpoint_metrics is None:
+                endpoint_metrics = EndpointMetrics(*key)
+                self.endpoints[key] = endpoint_metrics
+            endpoint_metrics.calls += 1
+            endpoint_metrics.status_codes[status_code] = \
+                endpoint_metrics.status_codes.get(status_code, 0) + 1
+            endpoint_metrics.bytes_sent += bytes_sent
+            endpoint_metrics.bytes_received += bytes_received
+            endpoint_metrics.latency.add(latency)
+
+    def get_api_calls(self):
+        with self.lock:
+            return sum(endpoint_metrics.calls
+                       for endpoint_metrics in self.endpoints.values())
+
+    # Returns a dict of the number of calls and their total latency in
+    # seconds per HTTP method.
+    def get_latency_by_method(self):
+        latency_by_method = {}
+        with self.lock:
+            for endpoint_metrics in self.endpoints.values():
+                calls, seconds = latency_by_method.get(
+                    endpoint_metrics.method, (0, 0.0))
+                latency_by_method[endpoint_metrics.method] = (
+                    calls + endpoint_metrics.calls,
+                    seconds + endpoint_metrics.latency.total)
+        return latency_by_method
+
+    # Returns the report of the run as a dict. rows is the number of input
+    # rows processed, to compute the number of API calls per row.
+    def get_report(self, rows):
+        with self.lock:
+            endpoints = [endpoint_metrics.to_dict() for key, endpoint_metrics
+                         in sorted(self.endpoints.items())]
+        api_calls = sum(endpoint['calls'] for endpoint in endpoints)
+        return {'rows': rows,
+                'duration_seconds': round(time.monotonic() - self.start, 3),
+                'api_calls': api_calls,
+                'api_calls_per_row': (round(api_calls / rows, 3)
+                                      if rows else None),
+                'bytes_sent': sum(endpoint['bytes_sent']
+                                  for endpoint in endpoints),
+                'bytes_received': sum(endpoint['bytes_received']
+                                      for endpoint in endpoints),
+                'endpoints': endpoints}
+
+    def write_report(self, report_file, rows):
+        with open(report_file, mode='w', encoding='utf-8') as report:
+            json.dump(self.get_report(rows), report, indent=4)
+            report.write('\n')
+
+    # Writes the metrics in the Prometheus text format, e.g. for the textfile
+    # collector of the node exporter. The file is replaced at once, so the
+    # collector never reads a partial file.
+    def write_prometheus_file(self, prometheus_file, rows):
+
+        report = self.get_report(rows)
+        with self.lock:
+            endpoints = [(endpoint_metrics.method, endpoint_metrics.endpoint,
+                          endpoint_metrics.latency)
+                         for key, endpoint_metrics
+                         in sorted(self.endpoints.items())]
+
+        lines = ['# HELP qradar_event_mapping_rows Input rows processed by '
+                 'the last run.',
+                 '# TYPE qradar_event_mapping_rows gauge',
+                 'qradar_event_mapping_rows ' + str(rows),
+                 '# HELP qradar_event_mapping_api_calls_per_row REST API '
+                 'calls per input row of the last run.',
+                 '# TYPE qradar_event_mapping_api_calls_per_row gauge',
+                 'qradar_event_mapping_api_calls_per_row ' +
+                 str(report['api_calls_per_row'] or 0),
+                 '# HELP qradar_event_mapping_api_requests REST API requests '
+                 'of the last run.',
+                 '# TYPE qradar_event_mapping_api_requests gauge']
+        for endpoint in report['endpoints']:
+            for code, count in endpoint['status_codes'].items():
+                lines.append('qradar_event_mapping_api_requests' +
+                             prometheus_labels(endpoint['method'],
+                                               endpoint['endpoint'],
+                                               code=code) +
+                             ' ' + str(count))
+        for name, field in (('bytes_sent', 'bytes_sent'),
+                            ('bytes_received', 'bytes_received')):
+            lines.append('# HELP qradar_event_mapping_api_' + name +
+                         ' REST API body bytes of the last run.')
+            lines.append('# TYPE qradar_event_mapping_api_' + name +
+                         ' gauge')
+            for endpoint in report['endpoints']:
+                lines.append('qradar_event_mapping_api_' + name +
+                             prometheus_labels(endpoint['method'],
+                                               endpoint['endpoint']) +
+                             ' ' + str(endpoint[field]))
+        lines.append('# HELP qradar_event_mapping_api_request_duration_'
+                     'seconds REST API request latency of the last run.')
+        lines.append('# TYPE qradar_event_mapping_api_request_duration_'
+                     'seconds histogram')
+        for method, endpoint, latency in endpoints:
+            for bound, count in zip(PROMETHEUS_BUCKETS,
+                                    latency.get_cumulative_counts()):
+                lines.append('qradar_event_mapping_api_request_duration_'
+                             'seconds_bucket' +
+                             prometheus_labels(method, endpoint,
+                                               le=str(bound)) +
+                             ' ' + str(count))
+            lines.append('qradar_event_mapping_api_request_duration_'
+                         'seconds_bucket' +
+                         prometheus_labels(method, endpoint, le='+Inf') +
+                         ' ' + str(latency.count))
+            lines.append('qradar_event_mapping_api_request_duration_'
+                         'seconds_sum' + prometheus_labels(method, endpoint) +
+                         ' ' + str(round(latency.total, 6)))
+            lines.append('qradar_event_mapping_api_request_duration_'
+                         'seconds_count' +
+                         prometheus_labels(method, endpoint) +
+                         ' ' + str(latency.count))
+
+        temporary_file = prometheus_file + '.tmp'
+        with open(temporary_file, mode='w', encoding='utf-8') as textfile:
+            textfile.write('\n'.join(lines) + '\n')
+        os.replace(temporary_file, prometheus_file)
+
+
+def prometheus_labels(method, endpoint, **labels):
+    all_labels = [('method', method), ('endpoint', endpoint)]
+    all_labels += sorted(labels.items())
+    return '{' + ','.join(
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+        for name, value in all_labels) + '}'
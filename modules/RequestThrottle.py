@@ -0,0 +1,178 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+
+# Status codes of a console that is too busy to handle the request. Requests
+# answered with one of them are sent again after a delay.
+THROTTLED_STATUS_CODES = (429, 503)
+
+
+# A token bucket limiting the rate of the requests. Tokens are added at rate
+# tokens per second up to burst tokens, and each request takes one. A rate
+# of None means no limit.
+class TokenBucket:
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Takes a token and returns the number of seconds the caller has to wait
+    # before sending its request. The token is taken even if it is not
+    # available yet, so concurrent callers are served in order.
+    def reserve(self):
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+# An additive-increase/multiplicative-decrease limit of the number of
+# requests in flight. Every request that completes in time raises the limit
+# by 1/limit (so by one per round of requests); a throttled request, or one
+# whose latency is far above the lowest latency seen (or above
+# min_latency_floor seconds, for consoles that answer in a few
+# milliseconds), halves it. The limit
+# is only decreased once per round trip, so a burst of throttled responses
+# to requests sent at the same time counts as one signal.
+class AdaptiveConcurrencyLimit:
+
+    def __init__(self, maximum, minimum=1, backoff_ratio=0.5,
+                 latency_tolerance=4.0, min_latency_floor=0.05):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.min_latency_floor = min_latency_floor
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.min_latency = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def get_limit(self):
+        with self.condition:
+            return int(self.limit)
+
+    # Takes a slot if one is free. Returns True if it did.
+    def try_acquire(self):
+        with self.condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    # Waits for a free slot and takes it.
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    # Frees the slot of a completed request and adjusts the limit with its
+    # latency in seconds and whether it was throttled.
+    def release(self, latency, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if not throttled and (self.min_latency is None or
+                                  latency < self.min_latency):
+                self.min_latency = latency
+            congested = (throttled or (
+                self.min_latency is not None and
+                latency > self.latency_tolerance *
+                max(self.min_latency, self.min_latency_floor)))
+            previous_limit = int(self.limit)
+            if congested:
+                if now - self.last_decrease >= latency:
+                    self.limit = max(self.minimum,
+                                     self.limit * self.backoff_ratio)
+                    self.last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            if int(self.limit) != previous_limit:
+                logging.debug('Concurrency limit changed from ' +
+                              str(previous_limit) + ' to ' +
+                              str(int(self.limit)))
+            self.condition.notify_all()
+
+
+# The rate and concurrency budget of one kind of request.
+class RequestBudget:
+
+    def __init__(self, name, rate=None, burst=None, max_concurrency=10):
+        self.name = name
+        self.token_bucket = TokenBucket(rate, burst)
+        self.concurrency_limit = AdaptiveConcurrencyLimit(max_concurrency)
+
+
+# Rate limiting and retries of the requests of a RestApiClient. Reads (GET
+# and HEAD) and writes (every other method) have separate budgets, so a
+# slow stream of writes does not hold back the lookups and the other way
+# around. Throttled requests are retried up to max_retries times, waiting
+# for the Retry-After header of the response when the console sends one and
+# for an exponential backoff with full jitter otherwise.
+class RequestThrottle:
+
+    READ_METHODS = ('GET', 'HEAD')
+
+    def __init__(self, read_rate=None, write_rate=None, max_concurrency=10,
+                 max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.read_budget = RequestBudget('read', read_rate,
+                                         max_concurrency=max_concurrency)
+        self.write_budget = RequestBudget('write', write_rate,
+                                          max_concurrency=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_budget(self, method):
+        if method.upper() in self.READ_METHODS:
+            return self.read_budget
+        return self.write_budget
+
+    def is_throttled(self, response):
+        return response.code in THROTTLED_STATUS_CODES
+
+    # Returns True if a request answered with response should be sent again
+    # after attempt retries.
+    def should_retry(self, response, attempt):
+        return self.is_throttled(response) and attempt < self.max_retries
+
+    # Returns the number of seconds to wait before retrying a throttled
+    # request for the attempt-th time.
+    def get_retry_delay(self, response, attempt):
+        retry_after = parse_retry_after(response.getheader('Retry-After'))
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * (2 ** attempt)))
+
+
+# Returns the number of seconds of a Retry-After header, given either as a
+# number of seconds or as an HTTP date, or None.
+def parse_retry_after(retry_after):
+    if not retry_after:
+        return None
+    retry_after = retry_after.strip()
+    if retry_after.isdigit():
+        return float(retry_after)
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_date is None:
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
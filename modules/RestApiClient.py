@@ -1,26 +1,165 @@
 from config import Config
+from RequestThrottle import RequestThrottle
+from RequestMetrics import RequestMetrics
 
-from urllib.error import HTTPError
-from urllib.error import URLError
 from urllib.parse import quote
-from urllib.request import Request
-from urllib.request import urlopen
-from urllib.request import install_opener
-from urllib.request import build_opener
-from urllib.request import HTTPSHandler
 
 import SampleUtilities
 
+import http.client
+import io
 import ssl
 import sys
 import base64
+import json
+import logging
+import re
+import select
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Connection errors that mean a kept-alive connection was closed by the
+# server while it was idle in the pool. When one of these is raised on a
+# reused connection the request is retried on a new connection, if it was
+# not completely sent or if sending it again has no side effect: once sent,
+# the console may have processed it before closing the connection, and a
+# POST sent again could e.g. create a second QID record.
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected,
+                           http.client.CannotSendRequest,
+                           http.client.BadStatusLine,
+                           BrokenPipeError,
+                           ConnectionResetError,
+                           ConnectionAbortedError)
+
+
+# Methods of the requests that can be sent again after the connection broke
+# while waiting for their response.
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+
+# Matches the Content-Range header of a paged response, e.g.
+# "items 0-49/1234". The total is omitted by some endpoints.
+CONTENT_RANGE_PATTERN = re.compile(r'items\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+# An HTTPS connection that resumes the TLS session negotiated by a previous
+# connection of the same pool, so that opening a new connection does not
+# always require a full handshake.
+class SessionReuseHTTPSConnection(http.client.HTTPSConnection):
+
+    def __init__(self, host, pool, context, timeout):
+        super(SessionReuseHTTPSConnection, self).__init__(
+            host, timeout=timeout, context=context)
+        self.pool = pool
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self.host if ssl.HAS_SNI else None
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=server_hostname,
+            session=self.pool.get_tls_session())
+        self.pool.set_tls_session(self.sock.session)
+
+
+# A thread-safe pool of persistent HTTP/1.1 connections to a single host.
+# Connections are borrowed for the duration of one request and returned once
+# the response body has been read, so they can be reused by the next request.
+class HTTPSConnectionPool:
+
+    def __init__(self, host, context, max_idle=10, timeout=60):
+        self.host = host
+        self.context = context
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle_connections = []
+        self.tls_session = None
+        self.lock = threading.Lock()
+
+    def get_tls_session(self):
+        with self.lock:
+            return self.tls_session
+
+    def set_tls_session(self, tls_session):
+        with self.lock:
+            self.tls_session = tls_session
+
+    # Returns a tuple (connection, reused). reused is True when the
+    # connection was taken from the idle list. The idle connections already
+    # closed by the server are dropped.
+    def get_connection(self):
+        while True:
+            with self.lock:
+                if not self.idle_connections:
+                    break
+                connection = self.idle_connections.pop()
+            if not is_connection_dropped(connection):
+                return connection, True
+            connection.close()
+        return SessionReuseHTTPSConnection(self.host, self, self.context,
+                                           self.timeout), False
+
+    def release_connection(self, connection):
+        with self.lock:
+            if len(self.idle_connections) < self.max_idle:
+                self.idle_connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            connections = self.idle_connections
+            self.idle_connections = []
+        for connection in connections:
+            connection.close()
+
+
+# An idle connection only has something to read when the server closed it
+# (or sent data nobody asked for): either way it can not be used.
+def is_connection_dropped(connection):
+    if connection.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+# The response returned by call_api. The body is read as soon as the response
+# arrives so the connection can go back to the pool; it offers the same
+# code/read()/info() interface as the responses returned by urlopen.
+class ApiResponse:
+
+    def __init__(self, code, reason, headers, body):
+        self.code = code
+        self.status = code
+        self.reason = reason
+        self.headers = headers
+        self.size = len(body)
+        self.body = io.BytesIO(body)
+
+    def read(self, amt=None):
+        return self.body.read(amt)
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.code
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
 
 
 # This is a simple HTTP client that can be used to access the REST API
 class RestApiClient:
 
     # Constructor for the RestApiClient Class
-    def __init__(self, config_section='DEFAULT', version=None, config=None):
+    def __init__(self, config_section='DEFAULT', version=None, config=None,
+                 max_connections=10, throttle=None, metrics=None):
 
         if config is None:
             self.config = Config(config_section=config_section)
@@ -76,7 +215,6 @@ class RestApiClient:
         if sys.version_info >= (3, 4):
             context.check_hostname = True
 
-        check_hostname = True
         certificate_file = self.config.get_config_value('certificate_file')
         if certificate_file is not None:
             # Load the certificate if the user has specified a certificate
@@ -86,7 +224,6 @@ class RestApiClient:
             # so me must disable hostname checking.
             if sys.version_info >= (3, 4):
                 context.check_hostname = False
-            check_hostname = False
 
             # Instead of loading the default certificates load only the
             # certificates specified by the user.
@@ -103,56 +240,214 @@ class RestApiClient:
                 # this call fails the certificate will fail to validate.
                 context.set_default_verify_paths()
 
-        install_opener(build_opener(
-            HTTPSHandler(context=context, check_hostname=check_hostname)))
+        # The SSLContext is built once and shared by every connection of the
+        # pool, which also lets new connections resume the TLS session.
+        self.ssl_context = context
+        self.connection_pool = HTTPSConnectionPool(self.server_ip, context,
+                                                   max_idle=max_connections)
+
+        # Rate limits, adaptive concurrency and retries of throttled
+        # requests.
+        if throttle is None:
+            throttle = RequestThrottle(max_concurrency=max(1, max_connections))
+        self.throttle = throttle
+
+        # Per endpoint request metrics, may be shared with other clients.
+        if metrics is None:
+            metrics = RequestMetrics()
+        self.metrics = metrics
 
     # This method is used to set up an HTTP request and send it to the server
     def call_api(self, endpoint, method, headers=None, params=[], data=None,
                  print_request=False):
 
         path = self.parse_path(endpoint, params)
-
-        # If the caller specified customer headers merge them with the default
-        # headers.
-        actual_headers = self.headers.copy()
-        if headers is not None:
-            for header_key in headers:
-                actual_headers[header_key] = headers[header_key]
-
-        # Send the request and receive the response
-        request = Request(
-            'https://' + self.server_ip + self.base_uri + path,
-            headers=actual_headers)
-        request.get_method = lambda: method
+        actual_headers = self.merge_headers(headers, data)
 
         # Print the request if print_request is True.
         if print_request:
             SampleUtilities.pretty_print_request(self, path, method,
                                                  headers=actual_headers)
 
-        try:
-            response = urlopen(request, data)
-
-            response_info = response.info()
-            if 'Deprecated' in response_info:
-
-                # This version of the API is Deprecated. Print a warning to
-                # stderr.
-                print("WARNING: " + response_info['Deprecated'],
-                      file=sys.stderr)
-
-            # returns response object for opening url.
-            return response
-        except HTTPError as e:
-            # an object which contains information similar to a request object
-            return e
-        except URLError as e:
-            if (isinstance(e.reason, ssl.SSLError) and
-                    e.reason.reason == "CERTIFICATE_VERIFY_FAILED"):
+        # Send the request and receive the response, within the budget of
+        # its kind of request and again while the console throttles it.
+        budget = self.throttle.get_budget(method)
+        attempt = 0
+        while True:
+            time.sleep(budget.token_bucket.reserve())
+            budget.concurrency_limit.acquire()
+            start = time.monotonic()
+            # requests that fail also count against the concurrency limit
+            throttled = True
+            response = None
+            try:
+                response = self.send_request(method, self.base_uri + path,
+                                             actual_headers, data)
+                throttled = self.throttle.is_throttled(response)
+            except ssl.SSLCertVerificationError:
                 print("Certificate verification failed.")
                 sys.exit(3)
+            finally:
+                latency = time.monotonic() - start
+                budget.concurrency_limit.release(latency, throttled)
+                self.metrics.record(
+                    method, endpoint,
+                    0 if response is None else response.code,
+                    0 if data is None else len(data),
+                    0 if response is None else response.size, latency)
+
+            if not self.throttle.should_retry(response, attempt):
+                break
+            delay = self.throttle.get_retry_delay(response, attempt)
+            attempt += 1
+            logging.warning('Console returned ' + str(response.code) +
+                            ' for ' + method + ' ' + endpoint +
+                            ', retry ' + str(attempt) + ' in ' +
+                            '{0:.2f}'.format(delay) + 's')
+            time.sleep(delay)
+
+        self.check_deprecated(response)
+
+        # returns the response object, including error responses.
+        return response
+
+    # Returns a generator over the records of a collection endpoint. The
+    # records are requested page_size at a time through the Range header and
+    # yielded one by one, so only one or two pages are held in memory. The
+    # Content-Range header of each page tells whether another page exists.
+    # With prefetch the next page is requested on a background thread while
+    # the records of the current page are consumed.
+    def iter_items(self, endpoint, params=None, page_size=500, headers=None,
+                   prefetch=False, print_request=False):
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            range_start = 0
+            next_page = None
+            while True:
+                if next_page is None:
+                    page, total = self.get_page(endpoint, params, range_start,
+                                                page_size, headers,
+                                                print_request)
+                else:
+                    page, total = next_page.result()
+                    next_page = None
+
+                range_start += len(page)
+                has_next_page = (len(page) >= page_size and
+                                 (total is None or range_start < total))
+                if has_next_page and executor is not None:
+                    next_page = executor.submit(self.get_page, endpoint,
+                                                params, range_start,
+                                                page_size, headers,
+                                                print_request)
+
+                for item in page:
+                    yield item
+
+                if not has_next_page:
+                    return
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    # Requests one page of a collection endpoint. Returns a tuple
+    # (records, total) where total is the size of the collection read from
+    # the Content-Range header, or None if the server did not send it.
+    def get_page(self, endpoint, params, range_start, page_size,
+                 headers=None, print_request=False):
+
+        page_headers = dict((header_key, header_value)
+                            for header_key, header_value in
+                            (headers or {}).items()
+                            if str(header_key).lower() != 'range')
+        page_headers['Range'] = ('items=' + str(range_start) + '-' +
+                                 str(range_start + page_size - 1))
+        response = self.call_api(endpoint, 'GET', headers=page_headers,
+                                 params={} if params is None else params,
+                                 print_request=print_request)
+        if response.code != 200:
+            raise LookupError('Failed to retrieve the list of ' + endpoint +
+                              ' records')
+        page = json.loads(response.read().decode('utf-8'))
+
+        total = None
+        match = CONTENT_RANGE_PATTERN.match(
+            response.getheader('Content-Range') or '')
+        if match is not None and match.group(3) != '*':
+            total = int(match.group(3))
+        return page, total
+
+    # This method merges the headers specified by the caller with the default
+    # headers.
+    def merge_headers(self, headers, data):
+
+        actual_headers = self.headers.copy()
+        if headers is not None:
+            for header_key in headers:
+                actual_headers[header_key] = headers[header_key]
+
+        # urlopen used to send request bodies as form data unless told
+        # otherwise, keep doing so for callers relying on it.
+        header_names = [header_key.decode('ascii').lower()
+                        if isinstance(header_key, bytes)
+                        else header_key.lower()
+                        for header_key in actual_headers]
+        if data is not None and 'content-type' not in header_names:
+            actual_headers['Content-Type'] = \
+                'application/x-www-form-urlencoded'
+
+        return actual_headers
+
+    def check_deprecated(self, response):
+
+        response_info = response.info()
+        if 'Deprecated' in response_info:
+
+            # This version of the API is Deprecated. Print a warning to
+            # stderr.
+            print("WARNING: " + response_info['Deprecated'], file=sys.stderr)
+
+    # This method sends the request over a pooled connection. A request that
+    # fails because the server closed an idle connection is sent again on a
+    # new connection, unless it was sent and is not idempotent.
+    def send_request(self, method, url, headers, data):
+
+        while True:
+            connection, reused = self.connection_pool.get_connection()
+            try:
+                connection.request(method, url, body=data, headers=headers)
+            except STALE_CONNECTION_ERRORS:
+                # the request was not completely sent
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            try:
+                response = connection.getresponse()
+                body = response.read()
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if reused and method in IDEMPOTENT_METHODS:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
             else:
-                raise e
+                self.connection_pool.release_connection(connection)
+            return ApiResponse(response.status, response.reason,
+                               response.msg, body)
+
+    # Closes the idle connections of the pool.
+    def close(self):
+        self.connection_pool.close()
 
     # This method constructs the query string
     def parse_path(self, endpoint, params):
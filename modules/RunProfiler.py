@@ -0,0 +1,132 @@
+import contextlib
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+
+
+# Wall clock time spent in each phase of a run, summed over the lines. With
+# several lines processed at the same time the phases of the lines overlap,
+# so the sum can exceed the duration of the run.
+class PhaseTimers:
+
+    def __init__(self):
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds, count=1):
+        with self.lock:
+            phase_time = self.phases.setdefault(phase, [0, 0.0])
+            phase_time[0] += count
+            phase_time[1] += seconds
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    # Yields the items of iterable, adding the time taken to produce each one
+    # to phase.
+    def timed_iter(self, phase, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(phase, time.perf_counter() - start, count=0)
+                return
+            self.add(phase, time.perf_counter() - start)
+            yield item
+
+    # Returns a list of (phase, count, seconds) in the order the phases were
+    # first seen.
+    def get_phases(self):
+        with self.lock:
+            return [(phase, count, seconds)
+                    for phase, (count, seconds) in self.phases.items()]
+
+
+# Profiles a run with cProfile and tracemalloc. The main thread is profiled
+# between start() and stop(); worker threads are profiled from
+# start_thread(), e.g. as the initializer of a thread pool, until they end.
+# The profiles of all the threads are merged into one pstats file.
+class RunProfiler:
+
+    def __init__(self, profile_file, top=15):
+        self.profile_file = profile_file
+        self.top = top
+        self.phase_timers = PhaseTimers()
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.peak_memory = 0
+
+    def start(self):
+        tracemalloc.start()
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        self.start_thread()
+
+    def start_thread(self):
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def stop(self):
+        # only the profile of the calling thread can be disabled, the ones
+        # of the worker threads stopped when the threads ended
+        with self.lock:
+            main_profile = self.profiles[0]
+        main_profile.disable()
+        self.duration = time.perf_counter() - self.start_time
+        self.cpu_time = time.process_time() - self.start_cpu_time
+        self.snapshot = tracemalloc.take_snapshot()
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        with self.lock:
+            profiles = list(self.profiles)
+        self.stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            self.stats.add(profile)
+        self.stats.dump_stats(self.profile_file)
+
+    # Returns the summary of the profile as text: duration, CPU time and
+    # memory, the time of each phase (and of the extra_phases, a list of
+    # (phase, count, seconds) measured elsewhere), the functions with the
+    # longest cumulative time and the lines that allocated the most memory.
+    def get_summary(self, extra_phases=()):
+
+        lines = ['Profile written to ' + self.profile_file,
+                 'Duration {0:.3f}s, CPU time {1:.3f}s, peak traced memory '
+                 '{2:.1f} MB'.format(self.duration, self.cpu_time,
+                                      self.peak_memory / 1048576.0),
+                 '',
+                 '{0:<32}{1:>10}{2:>12}{3:>12}'.format('Phase', 'Count',
+                                                       'Seconds', 'Per call')]
+        for phase, count, seconds in (self.phase_timers.get_phases() +
+                                      list(extra_phases)):
+            lines.append('{0:<32}{1:>10}{2:>12.3f}{3:>12}'.format(
+                phase, count, seconds,
+                '{0:.6f}'.format(seconds / count) if count else ''))
+
+        stats_text = io.StringIO()
+        self.stats.stream = stats_text
+        self.stats.sort_stats('cumulative').print_stats(self.top)
+        lines += ['', 'Top ' + str(self.top) + ' functions by cumulative '
+                  'time (all threads):']
+        lines += [line for line in stats_text.getvalue().splitlines()
+                  if line.strip() and not line.startswith('   Ordered by')
+                  and 'function calls' not in line]
+
+        lines += ['', 'Top 10 allocations by line:']
+        for statistic in self.snapshot.statistics('lineno')[:10]:
+            lines.append('  ' + str(statistic))
+        return '\n'.join(lines)
@@ -0,0 +1,225 @@
+import logging
+import queue
+import threading
+import time
+
+
+# One stage of a StagedPipeline: workers threads call function on the items
+# of its input queue. The function returns the item passed to the next
+# stage, or Done(result) to skip the remaining stages. The return value of
+# the last stage is the result of the item.
+class Stage:
+
+    def __init__(self, name, function, workers=1, queue_size=None):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue_size = queue_size or self.workers * 4
+        self.input_queue = queue.Queue(maxsize=self.queue_size)
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.running_workers = self.workers
+        self.lock = threading.Lock()
+
+    def sample_depth(self):
+        depth = self.input_queue.qsize()
+        self.depth_samples += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+        return depth
+
+    def get_average_depth(self):
+        if not self.depth_samples:
+            return 0.0
+        return self.depth_total / self.depth_samples
+
+
+# The result of an item that skips the remaining stages.
+class Done:
+
+    __slots__ = ('result',)
+
+    def __init__(self, result):
+        self.result = result
+
+
+# Marks the end of the input of a stage.
+END_OF_INPUT = object()
+
+
+# The exception raised for an item, raised again by StagedPipeline.run().
+class Failure:
+
+    def __init__(self, error):
+        self.error = error
+
+
+# Runs items through stages connected by bounded queues, each stage with its
+# own worker threads, so that a slow stage only holds the items waiting for
+# it instead of the whole run. The items are read from an iterable by a
+# feeder thread and the results are handed to emit on the calling thread, in
+# the order of the items.
+#
+# A full queue blocks the stage in front of it, and the feeder stops reading
+# when the first queue is full, so at most the sum of the queue sizes and
+# worker counts of the stages are in flight, plus the results waiting for an
+# earlier item to be emitted. The depth of every queue is sampled while the
+# pipeline runs and logged every report_interval seconds; the stage with the
+# fullest input queue is the bottleneck.
+#
+# An exception raised by a stage function or by the iterable stops the
+# pipeline and is raised again by run().
+class StagedPipeline:
+
+    SAMPLE_INTERVAL = 0.1
+
+    def __init__(self, stages, output_queue_size=None, report_interval=10.0,
+                 initializer=None):
+        self.stages = stages
+        self.output_queue = queue.Queue(
+            maxsize=output_queue_size or sum(stage.queue_size
+                                             for stage in stages))
+        self.report_interval = report_interval
+        self.initializer = initializer
+        self.cancelled = threading.Event()
+
+    # Returns the number of results emitted.
+    def run(self, items, emit):
+
+        threads = [threading.Thread(target=self.feed, args=(items,),
+                                    name='pipeline feeder', daemon=True)]
+        for stage_index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self.work, args=(stage_index,),
+                    name='pipeline ' + stage.name + ' ' + str(worker),
+                    daemon=True))
+        for thread in threads:
+            thread.start()
+
+        # results of the items finished before an earlier item, by sequence
+        # number
+        emitted = 0
+        pending_results = {}
+        next_sample = time.monotonic()
+        next_report = next_sample + self.report_interval
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= next_sample:
+                    depths = [stage.sample_depth() for stage in self.stages]
+                    next_sample = now + self.SAMPLE_INTERVAL
+                    if now >= next_report:
+                        self.log_depths(depths, emitted)
+                        next_report = now + self.report_interval
+                try:
+                    sequence, result = self.output_queue.get(
+                        timeout=self.SAMPLE_INTERVAL)
+                except queue.Empty:
+                    continue
+                if result is END_OF_INPUT:
+                    break
+                if isinstance(result, Failure):
+                    raise result.error
+                pending_results[sequence] = result
+                while emitted in pending_results:
+                    emit(pending_results.pop(emitted))
+                    emitted += 1
+        finally:
+            self.cancelled.set()
+            for thread in threads:
+                thread.join()
+        return emitted
+
+    def feed(self, items):
+        first_queue = self.stages[0].input_queue
+        try:
+            for sequence, item in enumerate(items):
+                if not self.put(first_queue, (sequence, item)):
+                    return
+        except BaseException as error:
+            self.put(self.output_queue, (None, Failure(error)))
+            return
+        for _ in range(self.stages[0].workers):
+            if not self.put(first_queue, END_OF_INPUT):
+                return
+
+    def work(self, stage_index):
+        if self.initializer is not None:
+            self.initializer()
+        stage = self.stages[stage_index]
+        last_stage = stage_index == len(self.stages) - 1
+        while not self.cancelled.is_set():
+            try:
+                entry = stage.input_queue.get(timeout=self.SAMPLE_INTERVAL)
+            except queue.Empty:
+                continue
+            if entry is END_OF_INPUT:
+                self.stop_worker(stage_index)
+                return
+            sequence, item = entry
+            start = time.monotonic()
+            try:
+                item = stage.function(item)
+            except BaseException as error:
+                self.put(self.output_queue, (sequence, Failure(error)))
+                return
+            finally:
+                with stage.lock:
+                    stage.items += 1
+                    stage.busy_seconds += time.monotonic() - start
+            if isinstance(item, Done):
+                self.put(self.output_queue, (sequence, item.result))
+            elif last_stage:
+                self.put(self.output_queue, (sequence, item))
+            else:
+                self.put(self.stages[stage_index + 1].input_queue,
+                         (sequence, item))
+
+    # The last worker of a stage to stop ends the input of the next stage.
+    def stop_worker(self, stage_index):
+        stage = self.stages[stage_index]
+        with stage.lock:
+            stage.running_workers -= 1
+            if stage.running_workers:
+                return
+        if stage_index == len(self.stages) - 1:
+            self.put(self.output_queue, (None, END_OF_INPUT))
+            return
+        for _ in range(self.stages[stage_index + 1].workers):
+            self.put(self.stages[stage_index + 1].input_queue, END_OF_INPUT)
+
+    # Waits for room in the queue unless the pipeline is stopped, returns
+    # False if it is.
+    def put(self, item_queue, entry):
+        while not self.cancelled.is_set():
+            try:
+                item_queue.put(entry, timeout=self.SAMPLE_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def log_depths(self, depths, emitted):
+        logging.info('Pipeline: ' + str(emitted) + ' emitted, queue depth ' +
+                     ', '.join(stage.name + ' ' + str(depth) + '/' +
+                               str(stage.queue_size) for stage, depth
+                               in zip(self.stages, depths)) +
+                     ', output ' + str(self.output_queue.qsize()))
+
+    # One line per stage with its workers, items, busy time and input queue
+    # depth.
+    def get_report(self):
+        lines = ['{0:<20}{1:>8}{2:>10}{3:>10}{4:>10}{5:>10}'.format(
+            'Stage', 'Workers', 'Items', 'Busy s', 'Avg queue', 'Max queue')]
+        for stage in self.stages:
+            lines.append('{0:<20}{1:>8}{2:>10}{3:>10.1f}{4:>10.1f}{5:>10}'
+                         .format(stage.name, stage.workers, stage.items,
+                                 stage.busy_seconds,
+                                 stage.get_average_depth(),
+                                 str(stage.max_depth) + '/' +
+                                 str(stage.queue_size)))
+        return '\n'.join(lines)
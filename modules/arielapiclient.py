@@ -12,13 +12,16 @@ class APIClient(RestApiClient):
 
     # This class will encode any data or query parameters which will then be
     # sent to the call_api() method of its inherited class.
-    def __init__(self, config_section='DEFAULT', config=None):
+    def __init__(self, config_section='DEFAULT', config=None,
+                 max_connections=10, throttle=None, metrics=None):
 
         # This version of the ariel APIClient is designed to function with
         # version 6.0 of the ariel API.
         self.endpoint_start = 'ariel/'
         super(APIClient, self).__init__(config_section=config_section,
-                                        version='6.0', config=config)
+                                        version='6.0', config=config,
+                                        max_connections=max_connections,
+                                        throttle=throttle, metrics=metrics)
 
     def get_databases(self):
 
@@ -63,12 +66,14 @@ class APIClient(RestApiClient):
     def get_search_results(self, search_id,
                            response_type, range_start=None, range_end=None):
 
+        # same header names as the default headers, so they are replaced
+        # rather than sent twice
         headers = self.headers.copy()
-        headers[b'Accept'] = response_type
+        headers['Accept'] = response_type
 
         if ((range_start is not None) and (range_end is not None)):
-            headers[b'Range'] = ('items=' +
-                                 str(range_start) + '-' + str(range_end))
+            headers['Range'] = ('items=' +
+                                str(range_start) + '-' + str(range_end))
 
         # sends a GET request to
         # https://<server_ip>/rest/api/ariel/searches/<search_id>
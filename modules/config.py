@@ -18,13 +18,14 @@ class Config:
         server_ip is defined in the INI configuration section config_section
         then the settings are read from the config_file. Otherwise the user is
         prompted for the settings and given the option to save the settings to
-        config_file. config_file is read from and written to the root of the
-        samples directory.
+        config_file. A relative config_file is read from and written to the
+        root of the samples directory.
         """
 
-        # Read config_file from the root of the samples directory.
-        config_file = os.path.abspath(os.path.dirname(__file__) +
-                                      '/../' + config_file)
+        # Read config_file from the root of the samples directory, unless it
+        # is an absolute path.
+        config_file = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                   '..', config_file))
 
         self.config_file = config_file
         self.config_section = config_section
@@ -0,0 +1,139 @@
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.realpath(__file__))
+PACKAGE_DIR = os.path.dirname(TESTS_DIR)
+sys.path.append(os.path.join(PACKAGE_DIR, 'modules'))
+import ArielResultDownloader
+
+COLUMNS = ['sourceip', 'qid', 'event_count']
+
+
+def get_result_row(index):
+    return {'sourceip': '10.0.0.' + str(index % 256), 'qid': 2000000 + index,
+            'event_count': index}
+
+
+class FakeResponse:
+
+    def __init__(self, code, body):
+        self.code = code
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+# Stands in for the ariel APIClient, with the results of one search. The
+# earlier chunks take longer to come back, so the chunks complete in the
+# reverse order of their ranges, and the requests of the failing ranges
+# get a 500 the first time.
+class FakeArielClient:
+
+    def __init__(self, record_count, failing_ranges=(), delay=0.1):
+        self.rows = [get_result_row(index) for index in range(record_count)]
+        self.failing_ranges = set(failing_ranges)
+        self.delay = delay
+        self.requests = []
+        self.completed_ranges = []
+        self.lock = threading.Lock()
+
+    def get_search_results(self, search_id, response_type, range_start=None,
+                           range_end=None):
+
+        with self.lock:
+            self.requests.append((response_type, range_start, range_end))
+            failing = (range_start, range_end) in self.failing_ranges
+            self.failing_ranges.discard((range_start, range_end))
+        if response_type == 'application/csv':
+            return FakeResponse(200, (','.join(COLUMNS) + '\r\n').encode(
+                'utf-8'))
+        if failing:
+            return FakeResponse(500, b'{"message": "Internal error"}')
+
+        time.sleep(self.delay * max(0, len(self.rows) - range_start) /
+                   max(1, len(self.rows)))
+        with self.lock:
+            self.completed_ranges.append((range_start, range_end))
+        return FakeResponse(200, json.dumps(
+            {'events': self.rows[range_start:range_end + 1]}).encode('utf-8'))
+
+
+class ArielResultDownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='ariel_downloader_')
+        self.output_file = os.path.join(self.work_dir, 'results.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def read_output(self):
+        with open(self.output_file, mode='r', newline='',
+                  encoding='utf-8') as output:
+            reader = csv.reader(output)
+            return next(reader, None), list(reader)
+
+    def download(self, ariel_client, record_count, output_format='csv'):
+        downloader = ArielResultDownloader.ArielResultDownloader(
+            ariel_client, chunk_size=10, workers=4, max_attempts=3,
+            retry_delay=0)
+        return downloader.download('search-1', record_count,
+                                   self.output_file, output_format)
+
+    # The chunks are written in the order of their ranges, whatever the order
+    # they come back in.
+    def test_chunks_completed_out_of_order_are_written_in_order(self):
+        ariel_client = FakeArielClient(95)
+        self.assertEqual(95, self.download(ariel_client, 95))
+
+        self.assertNotEqual(sorted(ariel_client.completed_ranges),
+                            ariel_client.completed_ranges)
+        header, rows = self.read_output()
+        self.assertEqual(COLUMNS, header)
+        self.assertEqual([[str(row[column]) for column in COLUMNS]
+                          for row in ariel_client.rows], rows)
+        self.assertFalse(os.path.exists(self.output_file + '.part'))
+
+    # Only the failing chunk is requested again.
+    def test_chunk_failing_with_500_is_retried(self):
+        ariel_client = FakeArielClient(45, failing_ranges=[(20, 29)])
+        self.assertEqual(45, self.download(ariel_client, 45,
+                                           output_format='jsonl'))
+
+        requested_ranges = [(range_start, range_end) for _, range_start,
+                            range_end in ariel_client.requests]
+        self.assertEqual(2, requested_ranges.count((20, 29)))
+        self.assertEqual(6, len(requested_ranges))
+        with open(self.output_file, mode='r', encoding='utf-8') as output:
+            self.assertEqual(ariel_client.rows,
+                             [json.loads(line) for line in output])
+
+    def test_chunk_failing_every_attempt_leaves_no_file(self):
+        ariel_client = FakeArielClient(20, failing_ranges=[(10, 19)])
+        downloader = ArielResultDownloader.ArielResultDownloader(
+            ariel_client, chunk_size=10, workers=2, max_attempts=1,
+            retry_delay=0)
+        with self.assertRaises(LookupError):
+            downloader.download('search-1', 20, self.output_file)
+        self.assertEqual([], os.listdir(self.work_dir))
+
+    # A search without results still gets the header of its columns.
+    def test_search_without_results_writes_the_header(self):
+        ariel_client = FakeArielClient(0)
+        self.assertEqual(0, self.download(ariel_client, 0))
+
+        self.assertEqual([('application/csv', None, None)],
+                         ariel_client.requests)
+        self.assertEqual((COLUMNS, []), self.read_output())
+
+
+if __name__ == '__main__':
+    unittest.main()
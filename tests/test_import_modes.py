@@ -0,0 +1,241 @@
+import csv
+import http.client
+import json
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import types
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.realpath(__file__))
+PACKAGE_DIR = os.path.dirname(TESTS_DIR)
+sys.path.append(os.path.join(PACKAGE_DIR, 'benchmark'))
+import GenerateEventsCSV
+import MockQRadarServer
+import RunBenchmark
+
+
+# The output columns holding ids given by the console, which depend on the
+# order of the requests.
+ID_COLUMNS = ('QID', 'QID Record ID', 'Event Mapping Record ID')
+
+ROWS = 200
+
+
+def get_free_port():
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return free_socket.getsockname()[1]
+
+
+# Smoke tests of the import modes of MapEventsFromCSV.py against the mock
+# console of benchmark/MockQRadarServer.py: each mode imports the same file
+# into a new mock console, and must leave the console with the same mappings
+# and QID records as the sequential import, without any error line. The
+# modes that process every line on its own must write the same output file
+# too, except for the ids given by the console.
+@unittest.skipIf(shutil.which('openssl') is None,
+                 'openssl is needed for the certificate of the mock console')
+class ImportModesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix='import_modes_')
+        cls.cert_file, cls.key_file = RunBenchmark.create_certificate(
+            cls.work_dir)
+        cls.input_file = os.path.join(cls.work_dir, 'input.csv')
+        GenerateEventsCSV.generate_csv(cls.input_file, ROWS, duplicates=0.2)
+        cls.reference_output, cls.reference_console = cls.run_import(
+            'sequential', [])
+        cls.reference_rows = cls.read_output(
+            os.path.join(cls.work_dir, 'sequential.csv'), ignored_columns=())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    # Imports the file into a new mock console with one run of the script
+    # per list of arguments of runs (default only script_args), and returns
+    # the output file named after name and the content of the console.
+    @classmethod
+    def run_import(cls, name, script_args, runs=None):
+
+        port = get_free_port()
+        config_file = os.path.join(cls.work_dir, name + '.ini')
+        RunBenchmark.write_config_file(config_file, port, cls.cert_file)
+        mock_options = types.SimpleNamespace(
+            latency=0, jitter=0, error_rate=0, max_in_flight=None,
+            retry_after=None)
+        mock_server = RunBenchmark.start_mock_server(
+            mock_options, port, cls.cert_file, cls.key_file)
+        try:
+            output_file = os.path.join(cls.work_dir, name + '.csv')
+            for run_args in runs or [script_args]:
+                cls.run_script(name, config_file, run_args)
+            return (cls.read_output(output_file),
+                    cls.read_console(port))
+        finally:
+            RunBenchmark.stop_mock_server(mock_server)
+
+    @classmethod
+    def run_script(cls, name, config_file, script_args):
+
+        command = ([sys.executable,
+                    os.path.join(PACKAGE_DIR, 'MapEventsFromCSV.py'),
+                    '-l', os.path.join(cls.work_dir, name + '.log'),
+                    '--config_file', config_file] + script_args)
+        if '-i' not in script_args:
+            command += ['-i', cls.input_file]
+        if '-o' not in script_args and '--plan' not in script_args:
+            command += ['-o', os.path.join(cls.work_dir, name + '.csv')]
+        # the modules are loaded relative to the working directory
+        subprocess.run(command, cwd=PACKAGE_DIR, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    @staticmethod
+    def read_output(output_file, ignored_columns=ID_COLUMNS):
+        with open(output_file, mode='r', newline='',
+                  encoding='utf-8-sig') as output:
+            return [dict((column, value) for column, value in row.items()
+                         if column not in ignored_columns)
+                    for row in csv.DictReader(output)]
+
+    # Returns the mappings of the console with the values of their QID
+    # record, and the number of QID records.
+    @classmethod
+    def read_console(cls, port):
+
+        qid_records = dict((qid_record['id'], qid_record) for qid_record in
+                           cls.get_records(
+                               port, MockQRadarServer.QID_RECORDS_ENDPOINT))
+        mappings = {}
+        for mapping in cls.get_records(
+                port, MockQRadarServer.DSM_EVENT_MAPPINGS_ENDPOINT):
+            qid_record = qid_records[mapping['qid_record_id']]
+            mappings[(mapping['log_source_type_id'],
+                      mapping['log_source_event_id'],
+                      mapping['log_source_event_category'])] = (
+                qid_record['name'], qid_record['description'],
+                qid_record['severity'], qid_record['low_level_category_id'])
+        return mappings, len(qid_records)
+
+    @classmethod
+    def get_records(cls, port, endpoint):
+
+        context = ssl.create_default_context(cafile=cls.cert_file)
+        context.check_hostname = False
+        connection = http.client.HTTPSConnection('127.0.0.1', port,
+                                                 context=context)
+        try:
+            connection.request('GET', '/api/' + endpoint)
+            response = connection.getresponse()
+            return json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+
+    def assert_same_console(self, console):
+        mappings, qid_record_count = console
+        reference_mappings, reference_qid_record_count = \
+            self.reference_console
+        self.assertEqual(reference_mappings, mappings)
+        self.assertEqual(reference_qid_record_count, qid_record_count)
+
+    def test_sequential_import_has_no_errors(self):
+        self.assertEqual(ROWS, len(self.reference_output))
+        self.assertEqual([], [row for row in self.reference_output
+                              if row['Mapping Result'] not in
+                              ('CREATED', 'UPDATED', 'SKIPPED')])
+
+    def test_workers(self):
+        output, console = self.run_import('workers', ['-w', '8'])
+        self.assertEqual(self.reference_output, output)
+        self.assert_same_console(console)
+
+    def test_async(self):
+        output, console = self.run_import('async', ['-a', '-w', '8'])
+        self.assertEqual(self.reference_output, output)
+        self.assert_same_console(console)
+
+    # One line at a time, the asyncio engine sends the same requests in the
+    # same order as the sequential mode, so even the ids match.
+    def test_async_one_line_at_a_time_matches_row_for_row(self):
+        self.run_import('async_1', ['-a', '-w', '1'])
+        rows = self.read_output(os.path.join(self.work_dir, 'async_1.csv'),
+                                ignored_columns=())
+        self.assertEqual(len(self.reference_rows), len(rows))
+        for line_number, (reference_row, row) in enumerate(
+                zip(self.reference_rows, rows), start=2):
+            self.assertEqual(reference_row, row, 'line ' + str(line_number))
+
+    def test_pipeline(self):
+        output, console = self.run_import('pipeline', ['--pipeline', '2,4,4'])
+        self.assertEqual(self.reference_output, output)
+        self.assert_same_console(console)
+
+    def test_coalesce(self):
+        output, console = self.run_import('coalesce', ['--coalesce'])
+        self.assertEqual(ROWS, len(output))
+        self.assert_same_console(console)
+
+    def test_plan_and_apply(self):
+        plan_file = os.path.join(self.work_dir, 'plan.csv')
+        output, console = self.run_import('apply', None, runs=[
+            ['--plan', plan_file], ['--apply', plan_file]])
+        self.assertEqual(ROWS, len(output))
+        self.assert_same_console(console)
+
+    # The first half of the file is imported, then the whole file is
+    # imported again with --resume: the lines of the first half come from the
+    # journal.
+    def test_resume(self):
+        first_half_file = os.path.join(self.work_dir, 'first_half.csv')
+        with open(self.input_file, mode='r', newline='') as input_file, \
+                open(first_half_file, mode='w', newline='') as first_half:
+            lines = input_file.readlines()
+            first_half.writelines(lines[:ROWS // 2 + 1])
+        journal_file = os.path.join(self.work_dir, 'resume.journal')
+        output, console = self.run_import('resume', None, runs=[
+            ['-i', first_half_file,
+             '-o', os.path.join(self.work_dir, 'first_half_output.csv'),
+             '-j', journal_file],
+            ['--resume', '-j', journal_file]])
+        self.assertEqual(self.reference_output, output)
+        self.assert_same_console(console)
+
+    # The mock console finds get_event_count() events for each QID and log
+    # source type it has a mapping for: each created or remapped line must
+    # get the count of its QID and log source type, the other lines none.
+    def test_verify_with_ariel(self):
+        output, console = self.run_import('verify',
+                                          ['--verify_with_ariel', '24'])
+        self.assert_same_console(console)
+        self.assertEqual(self.reference_output,
+                         [dict((column, value) for column, value
+                               in row.items()
+                               if column != 'Ariel Event Count')
+                          for row in output])
+
+        expected_counts = {}
+        observed_counts = {}
+        for row in self.read_output(os.path.join(self.work_dir,
+                                                 'verify.csv'),
+                                    ignored_columns=()):
+            if (row['QID Result'] != 'CREATED' and
+                    row['Mapping Result'] not in ('CREATED', 'UPDATED')):
+                self.assertEqual('', row['Ariel Event Count'])
+                continue
+            key = (int(row['QID']), int(row['Log Source Type ID']))
+            expected_counts[key] = MockQRadarServer.get_event_count(*key)
+            observed_counts[key] = int(row['Ariel Event Count'])
+        self.assertEqual(expected_counts, observed_counts)
+        # both the pairs with and without events are covered
+        self.assertIn(0, observed_counts.values())
+        self.assertTrue(any(observed_counts.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()